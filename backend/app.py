@@ -1,17 +1,11 @@
-
 import sys
 import os
 
-# Add the workspace to Python path for ml_models imports
-sys.path.insert(0, '/home/runner/workspace')
+# The repository root holds ml_models, next to this backend directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-import uvicorn
-from app.main import app
+from app.server import main
 
 if __name__ == "__main__":
-    uvicorn.run(
-        app,
-        host="0.0.0.0",
-        port=8000,
-        reload=True
-    )
+    # Production server; use `uvicorn app.main:app --reload` while developing
+    main()
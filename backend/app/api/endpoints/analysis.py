@@ -1,42 +1,92 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException
+from fastapi import APIRouter, File, Query, UploadFile, HTTPException
 from fastapi.responses import JSONResponse
 import os
-from typing import Dict, Any
+from typing import Dict, Any, List
 
 from app.services.analysis_service import AnalysisService
+from app.services.executor import ExecutorOverloaded
+from app.utils.upload_ingest import UploadRejected, ingest_upload, iter_batch_sources
 from app.core.config import settings
 
 router = APIRouter()
 analysis_service = AnalysisService()
 
 @router.post("/analyze-media")
-async def analyze_media(file: UploadFile = File(...)):
+async def analyze_media(file: UploadFile = File(...), timings: bool = Query(False)):
     try:
-        # Validate file type
-        content = await file.read()
-        
-        if not any(file.filename.lower().endswith(ext) for ext in settings.ALLOWED_EXTENSIONS):
-            raise HTTPException(status_code=400, detail="File type not supported")
-        
-        # Determine file type from content_type or filename
-        file_type = file.content_type or "application/octet-stream"
-        if file.filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-            file_type = "image/jpeg"
-        elif file.filename.lower().endswith(('.mp4', '.avi', '.mov')):
-            file_type = "video/mp4"
-        
-        # Reset file pointer
-        await file.seek(0)
-        
-        # Perform analysis
-        analysis_result = await analysis_service.analyze_media(file, content, file_type)
+        # Stream, validate and hash the upload without holding it all in memory
+        upload = await ingest_upload(file, settings.MAX_FILE_SIZE, settings.ALLOWED_EXTENSIONS)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    try:
+        with upload:
+            # Determine file type from the sniffed content
+            file_type = upload.media_type
+            
+            # Perform analysis; ?timings=1 adds the per-stage breakdown
+            analysis_result = await analysis_service.analyze_media(file, upload, file_type,
+                                                                   timings=timings)
         
         return JSONResponse(content=analysis_result)
         
+    except HTTPException:
+        raise
+    except ExecutorOverloaded as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+@router.post("/analyze-batch")
+async def analyze_batch(files: List[UploadFile] = File(...)):
+    # Many files and/or zip/tar archives; archive members are extracted as they stream
+    try:
+        sources = iter_batch_sources(files, settings.BATCH_MAX_ARCHIVE_SIZE)
+        batch_result = await analysis_service.analyze_batch(sources)
+        return JSONResponse(content=batch_result)
+        
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch analysis failed: {str(e)}")
+
+@router.post("/analysis-jobs", status_code=202)
+async def submit_analysis_job(file: UploadFile = File(...), priority: int = Query(0, ge=-99, le=99)):
+    # Queued for a job worker; poll GET /analysis/{analysis_id} for status and result
+    try:
+        upload = await ingest_upload(file, settings.MAX_FILE_SIZE, settings.ALLOWED_EXTENSIONS)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    try:
+        with upload:
+            job = await analysis_service.submit_job(file, upload, priority)
+        return JSONResponse(status_code=202, content=job)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Job submission failed: {str(e)}")
+
 @router.get("/analysis/{analysis_id}")
 async def get_analysis(analysis_id: str):
-    # Implementation for retrieving previous analysis
-    pass
\ No newline at end of file
+    # Finished analyses come from the job broker or the content-addressed
+    # result store; unfinished jobs report their status
+    analysis_result = await analysis_service.get_analysis(analysis_id)
+    if analysis_result is None:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return JSONResponse(content=analysis_result)
+
+@router.delete("/analysis/{analysis_id}")
+async def cancel_analysis(analysis_id: str):
+    # Queued jobs are cancelled at once, running ones at their worker's next heartbeat
+    job = await analysis_service.cancel_job(analysis_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(content=job)
+
+@router.get("/inference-stats")
+async def get_inference_stats():
+    # Batch sizes and queue waits of the model micro-batching schedulers
+    return JSONResponse(content={"models": analysis_service.inference_report()})
\ No newline at end of file
@@ -1,4 +1,5 @@
 import os
+from typing import Dict
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -10,6 +11,18 @@ class Settings(BaseSettings):
     DEEPTRACE_MODEL_PATH: str = os.getenv("DEEPTRACE_MODEL_PATH", "./models/deeptrace.h5")
     MESONET_MODEL_PATH: str = os.getenv("MESONET_MODEL_PATH", "./models/mesonet.h5")
     FORENSICS_MODEL_PATH: str = os.getenv("FORENSICS_MODEL_PATH", "./models/forensics.pth")
+    # The paths may name the original weights; the .ort/.onnx export beside
+    # them is what runs (needs onnxruntime, otherwise heuristics only)
+    MODEL_INTRA_OP_THREADS: int = 1  # per worker process
+    # Inference micro-batching: inputs of concurrent callers (threads of the
+    # same process) and of the frames of a video batch are run together
+    MODEL_MAX_BATCH_SIZE: int = 16
+    MODEL_MAX_WAIT_MS: float = 5.0  # after the oldest queued input
+    # Per-model overrides, e.g. {"mesonet": {"max_batch_size": 32, "max_wait_ms": 2}}
+    MODEL_BATCHING: Dict[str, Dict[str, float]] = {}
+    # Load every model and run a dummy batch in each worker at startup;
+    # /health answers 503 until this is done
+    MODEL_WARMUP: bool = True
     
     # Analysis thresholds
     DEEPFAKE_THRESHOLD: float = 0.7
@@ -20,6 +33,105 @@ class Settings(BaseSettings):
     MAX_FILE_SIZE: int = 100 * 1024 * 1024  # 100MB
     ALLOWED_EXTENSIONS: list = [".jpg", ".jpeg", ".png", ".mp4", ".avi", ".mov"]
     
+    # Batch uploads (many files and/or zip/tar archives per request)
+    BATCH_MAX_ITEMS: int = 500
+    BATCH_MAX_ARCHIVE_SIZE: int = 1024 * 1024 * 1024  # 1GB read from, and extracted from, each archive
+    # Items ingested and analyzed at once; bounds buffered uploads per batch
+    BATCH_MAX_IN_FLIGHT: int = 2 * (os.cpu_count() or 1)
+    # Seconds a batch item waits for room in a queue other requests filled before it fails with 429
+    BATCH_OVERLOAD_WAIT: float = 120.0
+    
+    # Longest image side for detectors that run on a reduced image (JPEGs are
+    # scaled during decode); detectors needing native pixels ignore it. 0 disables
+    IMAGE_ANALYSIS_MAX_SIDE: int = 1024
+    
+    # Skip the detectors when header metadata plainly names a generation tool
+    METADATA_PRESCREEN: bool = True
+    
+    # Tiles along the longer side of forensic localization heatmaps (0 disables)
+    FORENSICS_TILE_GRID: int = 16
+    
+    # Video frame sampling ("adaptive", "uniform", "stride", "time" or "keyframe")
+    VIDEO_SAMPLING_MODE: str = "adaptive"
+    VIDEO_MAX_FRAMES: int = 10  # used by the sequential modes
+    VIDEO_FRAME_STRIDE: int = 30  # used by "stride" sampling
+    VIDEO_SAMPLE_INTERVAL: float = 1.0  # seconds, used by "time" sampling
+    # "adaptive" starts with evenly spaced frames, then adds frames where
+    # scores disagree until the 95% confidence interval of the mean scores
+    # is this narrow (or the frame cap or time budget is reached)
+    VIDEO_ADAPTIVE_INITIAL_FRAMES: int = 5
+    VIDEO_ADAPTIVE_MAX_FRAMES: int = 40
+    VIDEO_ADAPTIVE_CI_HALF_WIDTH: float = 0.05
+    # Seconds a video analysis may spend sampling before it stops (0 disables);
+    # results it cut short are served but not stored
+    VIDEO_TIME_BUDGET: float = 30.0
+    # Sampled frames stacked into one detector batch; full batches are
+    # dispatched while later frames are still decoding
+    VIDEO_BATCH_SIZE: int = 5
+    # Batches analyzed at once; finished ones are folded into running
+    # temporal statistics, so memory does not grow with the frame count
+    VIDEO_BATCHES_IN_FLIGHT: int = 4
+    # Sampled frames per temporal segment (doubles on very long videos)
+    VIDEO_SEGMENT_FRAMES: int = 10
+    
+    # Result store (empty path keeps results in memory only)
+    RESULT_STORE_PATH: str = os.getenv("RESULT_STORE_PATH", "./data/analysis_results.sqlite3")
+    RESULT_CACHE_MEMORY_BYTES: int = 64 * 1024 * 1024  # 64MB of serialized results
+    # Stored results older than this, or beyond this total size, are deleted (0 keeps them)
+    RESULT_STORE_MAX_AGE: float = 30 * 24 * 3600.0  # seconds
+    RESULT_STORE_MAX_BYTES: int = 1024 * 1024 * 1024  # 1GB of serialized results
+    
+    # Queued analyses: broker URL is memory://, sqlite:///path or redis://host:port/db
+    JOB_BROKER_URL: str = os.getenv("JOB_BROKER_URL", "sqlite:///./data/jobs.sqlite3")
+    # Where queued uploads wait for a worker (shared with remote workers)
+    JOB_SPOOL_DIR: str = os.getenv("JOB_SPOOL_DIR", "./data/job_uploads")
+    # Worker processes started with the API (0 when `python -m app.services.job_worker` runs elsewhere)
+    JOB_LOCAL_WORKERS: int = 1
+    JOB_WORKER_CONCURRENCY: int = 2  # jobs each worker runs at once
+    JOB_LEASE_SECONDS: float = 60.0  # a worker silent this long is presumed lost
+    JOB_MAX_ATTEMPTS: int = 3  # runs of a job whose workers keep getting lost
+    JOB_POLL_INTERVAL: float = 0.5  # seconds between queue polls of an idle worker
+    
+    # Detector execution
+    ANALYSIS_EXECUTOR: str = "process"  # "process" or "thread"
+    ANALYSIS_WORKERS: int = os.cpu_count() or 1
+    ANALYSIS_QUEUE_DEPTH: int = 16  # tasks allowed to wait beyond the busy workers
+    ANALYSIS_RETRY_AFTER: int = 5  # seconds, sent with 429 responses
+    # Run the three detectors of an image/frame batch on threads of their own,
+    # inside the one pool task that decodes it
+    ANALYSIS_FANOUT_DETECTORS: bool = True
+    # Pool tasks a single request may have in flight at once
+    ANALYSIS_MAX_TASKS_PER_REQUEST: int = os.cpu_count() or 1
+    
+    # "float32" keeps detector planes and statistics in single precision (half
+    # the memory traffic; scores within ml_models.precision.SCORE_TOLERANCE)
+    ANALYSIS_PRECISION: str = "float64"
+    
+    # Per-stage latency tracing, exported on /metrics and with ?timings=1
+    TRACING_ENABLED: bool = True
+    
+    # Near-duplicate detection: uploads whose perceptual hashes are within
+    # NEAR_DUPLICATE_MAX_DISTANCE bits of an analyzed item, and whose own
+    # forensics find no editing indicator it lacked, reuse its result
+    # (empty index path keeps the fingerprints in memory only)
+    NEAR_DUPLICATE_ENABLED: bool = True
+    NEAR_DUPLICATE_INDEX_PATH: str = os.getenv("NEAR_DUPLICATE_INDEX_PATH", "./data/near_duplicates.sqlite3")
+    NEAR_DUPLICATE_MAX_DISTANCE: int = 6  # of 64 bits, for both pHash and dHash; re-encodes stay within 5
+    NEAR_DUPLICATE_VIDEO_FRAMES: int = 8  # frames hashed per video, at fixed fractions of its length
+    NEAR_DUPLICATE_VIDEO_MATCH: float = 0.75  # share of those frames that must match
+    
+    # Production server (python -m app.server): forked API worker processes,
+    # each recycled after about this many requests (0 never recycles)
+    SERVER_WORKERS: int = 2
+    SERVER_MAX_REQUESTS: int = 1000
+    SERVER_MAX_REQUESTS_JITTER: int = 100  # spreads out recycling of the workers
+    SERVER_GRACEFUL_TIMEOUT: float = 30.0  # seconds in-flight requests get on shutdown
+    # Directory where every process of the server (API and job workers) writes
+    # its metrics for /metrics to sum up; the server makes a temporary one
+    # when empty, and a single process needs none
+    METRICS_DIR: str = ""
+    METRICS_PUBLISH_INTERVAL: float = 1.0  # seconds a process may hold back its latest metrics
+    
     class Config:
         case_sensitive = True
 
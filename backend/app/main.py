@@ -1,6 +1,6 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import uvicorn
 from typing import Optional
 import os
@@ -26,13 +26,32 @@ app.add_middleware(
 # Include routers
 app.include_router(analysis.router, prefix="/api/v1", tags=["analysis"])
 
+@app.on_event("startup")
+async def startup():
+    analysis.analysis_service.start_warmup()
+    analysis.analysis_service.start_job_workers()
+
+@app.on_event("shutdown")
+async def shutdown():
+    analysis.analysis_service.shutdown()
+
 @app.get("/")
 async def root():
     return {"message": "Image & Video Authenticity Analyzer API"}
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    readiness = analysis.analysis_service.readiness()
+    if not readiness["ready"]:
+        # Models are still loading in the workers
+        return JSONResponse(status_code=503, content={"status": "warming_up", **readiness})
+    return {"status": "healthy", **readiness}
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus scrape endpoint
+    return PlainTextResponse(analysis.analysis_service.metrics_text(),
+                             media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="localhost", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,311 @@
+"""Production API server: the app is preloaded once, then worker processes are forked.
+
+Run from the backend directory with:
+
+    python -m app.server --workers 4 --port 8000
+
+The launcher imports the app, which builds the detectors and reads the
+``.ort`` model weights, then binds the port and forks the workers.  Every
+worker shares those modules and weights with the launcher copy-on-write,
+warms up its own detector pool and only then starts accepting connections.
+A worker exits gracefully after about ``SERVER_MAX_REQUESTS`` requests and
+is replaced, which caps memory growth; ``SIGHUP`` recycles all of them.
+Job workers are started once by the launcher, not by each API worker.
+Every worker writes its metrics to a shared directory, so ``/metrics``
+reports the whole server whichever worker answers the scrape.
+"""
+import time
+
+# Cold start is measured from here, before the app and its libraries are imported
+_LAUNCHED = time.perf_counter()
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import select
+import shutil
+import signal
+import sys
+import tempfile
+import traceback
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import uvicorn
+
+from app.core.config import settings
+from app.services.jobs import MemoryBroker
+from app.services.job_worker import spawn_worker_process, stop_worker_processes
+
+
+def _log(message: str):
+    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
+
+
+def _prepare_metrics_dir() -> Optional[str]:
+    """Set up the directory every worker writes its metrics to; returns it if it is temporary.
+
+    Called before the app is imported, so the service (and the job worker
+    processes, through the environment) pick it up.
+    """
+    if settings.METRICS_DIR:
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        # Totals start over with the server, as they would in a single process
+        for name in os.listdir(settings.METRICS_DIR):
+            if name.endswith((".json", ".tmp")):
+                os.unlink(os.path.join(settings.METRICS_DIR, name))
+        return None
+    settings.METRICS_DIR = os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="media-analyzer-metrics-")
+    return settings.METRICS_DIR
+
+
+def _preload():
+    """Import the app (building the service and its detectors) and what requests would load lazily"""
+    from PIL import Image
+    from app.api.endpoints.analysis import analysis_service
+    from app.main import app
+
+    # Otherwise the first upload in a less common format imports the image plugins
+    Image.init()
+    # Indexed once here, so every worker shares the index instead of building its own
+    if analysis_service.near_duplicates is not None:
+        analysis_service.near_duplicates.load()
+    return app, analysis_service
+
+
+class PreforkServer:
+    """Forks ``workers`` API processes from a parent that has already imported the app.
+
+    Each worker reports on a pipe once it is warmed up and serving; the
+    first report marks the cold start.  Workers that exit, recycled or
+    crashed, are replaced until the server stops.
+    """
+
+    def __init__(self, app, service, host: str = "0.0.0.0", port: int = 8000, workers: int = 2,
+                 max_requests: int = 0, max_requests_jitter: int = 0, graceful_timeout: float = 30.0,
+                 job_workers: int = 0, log_level: str = "info"):
+        self.app = app
+        self.service = service
+        self.host = host
+        self.port = port
+        self.workers = max(1, workers)
+        self.max_requests = max(0, max_requests)
+        self.max_requests_jitter = max(0, max_requests_jitter)
+        self.graceful_timeout = graceful_timeout
+        self.job_workers = max(0, job_workers)
+        self.log_level = log_level
+        self.cold_start: Optional[Dict[str, Any]] = None
+        self.preload_seconds = 0.0
+        # pid -> {"spawned", "ready", "pipe"}
+        self._workers: Dict[int, Dict[str, Any]] = {}
+        self._job_processes = []
+        self._socket = None
+        self._stopping = False
+        self._recycle = False
+
+    def run(self, preload_seconds: float = 0.0):
+        config = uvicorn.Config(self.app, host=self.host, port=self.port, log_level=self.log_level)
+        self._socket = config.bind_socket()
+        self.preload_seconds = preload_seconds
+        _log(f"Preloaded the app in {preload_seconds:.2f}s; starting {self.workers} workers "
+             f"(detector pools of {settings.ANALYSIS_WORKERS} {settings.ANALYSIS_EXECUTOR} workers each)")
+
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_recycle)
+
+        self._job_processes = [spawn_worker_process(settings.JOB_WORKER_CONCURRENCY, settings.ANALYSIS_WORKERS)
+                               for _ in range(self.job_workers)]
+        try:
+            for _ in range(self.workers):
+                self._spawn()
+            while not self._stopping:
+                self._wait_for_events(0.5)
+                if self._recycle:
+                    self._recycle = False
+                    self._signal_workers(signal.SIGTERM)
+        finally:
+            self._shutdown()
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+
+    def _handle_recycle(self, signum, frame):
+        self._recycle = True
+
+    def _spawn(self):
+        read_fd, write_fd = os.pipe()
+        max_requests = self.max_requests
+        if max_requests:
+            max_requests += random.randint(0, self.max_requests_jitter)
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            self._worker_main(write_fd, max_requests)
+        os.close(write_fd)
+        self._workers[pid] = {"spawned": time.perf_counter(), "ready": False, "pipe": read_fd}
+
+    def _wait_for_events(self, timeout: float):
+        pipes = {info["pipe"]: pid for pid, info in self._workers.items() if info["pipe"] is not None}
+        readable, _, _ = select.select(list(pipes), [], [], timeout)
+        for fd in readable:
+            pid = pipes[fd]
+            data = os.read(fd, 65536)
+            os.close(fd)
+            self._workers[pid]["pipe"] = None
+            if data:
+                self._worker_ready(pid, json.loads(data))
+        self._reap()
+
+    def _worker_ready(self, pid: int, report: Dict[str, Any]):
+        info = self._workers[pid]
+        info["ready"] = True
+        startup = time.perf_counter() - info["spawned"]
+        if self.cold_start is None:
+            self.cold_start = {
+                "seconds": round(time.perf_counter() - _LAUNCHED, 3),
+                "preload_seconds": round(self.preload_seconds, 3),
+                "worker_startup_seconds": round(startup, 3),
+                "warmup": report.get("warmup", {})
+            }
+            _log(f"Cold start: first worker ({pid}) ready {self.cold_start['seconds']:.2f}s after launch "
+                 f"{json.dumps(self.cold_start)}")
+        else:
+            _log(f"Worker {pid} ready in {startup:.2f}s")
+
+    def _reap(self):
+        for pid in list(self._workers):
+            try:
+                finished, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                finished, status = pid, 0
+            if not finished:
+                continue
+            info = self._workers.pop(pid)
+            if info["pipe"] is not None:
+                os.close(info["pipe"])
+            self.service.retire_metrics(pid)
+            if self._stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if info["ready"]:
+                # Recycled workers exit after max requests (0) or on SIGHUP (SIGTERM)
+                recycled = code in (0, -signal.SIGTERM)
+                _log(f"Worker {pid} exited ({'recycled' if recycled else f'code {code}'}), replacing it")
+            else:
+                _log(f"Worker {pid} exited during startup (code {code}), replacing it")
+                # Do not fork in a tight loop while startup keeps failing
+                time.sleep(1.0)
+            self._spawn()
+
+    def _signal_workers(self, signum: int):
+        for pid in self._workers:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _shutdown(self):
+        _log(f"Stopping {len(self._workers)} workers")
+        self._stopping = True
+        self._signal_workers(signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 5.0
+        while self._workers and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        self._signal_workers(signal.SIGKILL)
+        for pid in list(self._workers):
+            os.waitpid(pid, 0)
+        self._workers = {}
+        stop_worker_processes(self._job_processes)
+        self._job_processes = []
+        self._socket.close()
+
+    def _worker_main(self, ready_fd: int, max_requests: int):
+        # In the forked worker: never returns
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, signal.SIG_DFL)
+        for info in self._workers.values():
+            if info["pipe"] is not None:
+                os.close(info["pipe"])
+        code = 0
+        try:
+            config = uvicorn.Config(self.app, log_level=self.log_level,
+                                    limit_max_requests=max_requests or None,
+                                    timeout_graceful_shutdown=self.graceful_timeout)
+            asyncio.run(self._serve_worker(uvicorn.Server(config), ready_fd))
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    async def _serve_worker(self, server: uvicorn.Server, ready_fd: int):
+        # Warm up first, so no request reaches a worker whose models are still loading
+        if not self.service.ready:
+            await self.service.warmup()
+        serving = asyncio.ensure_future(server.serve(sockets=[self._socket]))
+        while not server.started and not serving.done():
+            await asyncio.sleep(0.01)
+        if server.started:
+            report = {"pid": os.getpid(), "warmup": self.service.warmup_status}
+            os.write(ready_fd, (json.dumps(report) + "\n").encode())
+        os.close(ready_fd)
+        await serving
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with preloaded, prefork worker processes")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=settings.SERVER_WORKERS,
+                        help="API worker processes")
+    parser.add_argument("--max-requests", type=int, default=settings.SERVER_MAX_REQUESTS,
+                        help="requests after which a worker is replaced (0 never)")
+    parser.add_argument("--max-requests-jitter", type=int, default=settings.SERVER_MAX_REQUESTS_JITTER,
+                        help="random extra requests per worker, so they are not all replaced at once")
+    parser.add_argument("--graceful-timeout", type=float, default=settings.SERVER_GRACEFUL_TIMEOUT,
+                        help="seconds in-flight requests get when a worker stops")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    if not hasattr(os, "fork"):
+        parser.error("the prefork server needs os.fork; use uvicorn directly on this platform")
+
+    # Job workers are started by the launcher, unless the memory broker runs them in the API worker
+    job_workers = 0 if urlparse(settings.JOB_BROKER_URL).scheme == "memory" else settings.JOB_LOCAL_WORKERS
+    if "ANALYSIS_WORKERS" not in os.environ:
+        # Every API and job worker has its own detector pool; together they use every core once
+        settings.ANALYSIS_WORKERS = max(1, (os.cpu_count() or 1) // max(1, args.workers + job_workers))
+
+    metrics_dir = _prepare_metrics_dir()
+
+    started = time.perf_counter()
+    app, service = _preload()
+    preload_seconds = time.perf_counter() - started
+
+    if isinstance(service.job_broker, MemoryBroker):
+        if args.workers > 1:
+            parser.error("several workers need a shared job broker; set JOB_BROKER_URL to sqlite:// or redis://")
+    else:
+        # Started once by the launcher instead of by every API worker
+        settings.JOB_LOCAL_WORKERS = 0
+
+    server = PreforkServer(app, service, host=args.host, port=args.port, workers=args.workers,
+                           max_requests=args.max_requests, max_requests_jitter=args.max_requests_jitter,
+                           graceful_timeout=args.graceful_timeout, job_workers=job_workers,
+                           log_level=args.log_level)
+    try:
+        server.run(preload_seconds)
+    finally:
+        if metrics_dir is not None:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
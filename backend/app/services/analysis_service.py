@@ -1,42 +1,573 @@
 import sys
 import os
-import cv2
+import asyncio
 import numpy as np
-from PIL import Image, ImageFilter
-import io
-import tempfile
-from typing import Dict, Any, List
+import hashlib
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Any, List, Optional
 import json
+import subprocess
+import types
+from contextvars import ContextVar
 from datetime import datetime
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
 
+from ml_models import precision, tracing
 from ml_models.deepfake_detector import DeepFakeDetector
 from ml_models.ai_generated_detector import AIGeneratedDetector
-from ml_models.image_forensics import ImageForensicsAnalyzer
-from app.utils.metadata_extractor import MetadataExtractor
-from app.utils.video_processor import VideoProcessor
+from ml_models.image_forensics import ImageForensicsAnalyzer, localized_anomalies
+from ml_models.jpeg_structure import analyze_jpeg_structure
+from ml_models.inference_scheduler import InferenceStats
+from ml_models.model_registry import ModelRegistry
+from ml_models.temporal_consistency import TemporalConsistencyAnalyzer, frame_thumbnail
+from app.core.config import settings
+from app.services import detector_tasks
+from app.services.executor import DetectorExecutor, ExecutorOverloaded
+from app.services.jobs import Job, MemoryBroker, clamp_priority, create_broker, new_job_id
+from app.services.metrics import MetricsSpool, model_histogram_lines, service_metrics
+from app.services.near_duplicates import NearDuplicateIndex
+from app.services.result_store import ResultStore
+from app.utils.metadata_extractor import PRESCREEN_CONFIDENCE, MetadataExtractor
+from app.utils.upload_ingest import ArchiveTooLarge, IngestedUpload, UploadRejected, ingest_upload, spool_upload
+from app.utils.video_processor import ADAPTIVE_MODE, AdaptiveFrameSampler, VideoProcessor, VideoSource
+
+# Set while a batch item is analyzed: until then its pool tasks wait for room instead of failing
+_overload_deadline: ContextVar[Optional[float]] = ContextVar("overload_deadline", default=None)
 
 class AnalysisService:
     def __init__(self):
-        self.deepfake_detector = DeepFakeDetector()
+        # CNNs shared by the detectors; each worker loads them once (at warmup)
+        # Pool workers run one task at a time; detector threads share one process
+        concurrency = settings.ANALYSIS_WORKERS if settings.ANALYSIS_EXECUTOR == "thread" else 1
+        self.model_registry = ModelRegistry(threads=settings.MODEL_INTRA_OP_THREADS,
+                                            max_batch_size=settings.MODEL_MAX_BATCH_SIZE,
+                                            max_wait_ms=settings.MODEL_MAX_WAIT_MS,
+                                            concurrency=concurrency)
+        for name, path in (("deeptrace", settings.DEEPTRACE_MODEL_PATH),
+                           ("mesonet", settings.MESONET_MODEL_PATH),
+                           ("forensics", settings.FORENSICS_MODEL_PATH)):
+            batching = settings.MODEL_BATCHING.get(name, {})
+            self.model_registry.register(name, path, max_batch_size=batching.get("max_batch_size"),
+                                         max_wait_ms=batching.get("max_wait_ms"))
+        self.inference_stats = InferenceStats()
+        # Stage timings from the detectors and the video reader, plus request metrics
+        tracing.enable(settings.TRACING_ENABLED)
+        self.metrics = service_metrics()
+        # Shared with the other processes of the server, which /metrics then sums up
+        self.metrics_spool = MetricsSpool(settings.METRICS_DIR) if settings.METRICS_DIR else None
+        self._metrics_flush: Optional[asyncio.TimerHandle] = None
+        # Checked here, so a bad setting fails at startup rather than in every worker
+        precision.set_precision(settings.ANALYSIS_PRECISION)
+        # Read before the pool forks, so the workers share the weights
+        self.model_registry.preload()
+        
+        self.deepfake_detector = DeepFakeDetector(registry=self.model_registry,
+                                                  model_names=("deeptrace", "mesonet"))
         self.ai_detector = AIGeneratedDetector()
-        self.forensics_analyzer = ImageForensicsAnalyzer()
+        self.forensics_analyzer = ImageForensicsAnalyzer(tile_grid=settings.FORENSICS_TILE_GRID or None,
+                                                         registry=self.model_registry,
+                                                         model_name="forensics")
         self.metadata_extractor = MetadataExtractor()
         self.video_processor = VideoProcessor()
+        
+        # CPU-bound detector work runs in a pool so the event loop stays responsive
+        self.executor = DetectorExecutor(
+            mode=settings.ANALYSIS_EXECUTOR,
+            max_workers=settings.ANALYSIS_WORKERS,
+            queue_depth=settings.ANALYSIS_QUEUE_DEPTH,
+            retry_after=settings.ANALYSIS_RETRY_AFTER,
+            initializer=detector_tasks.install_detectors,
+            initargs=(self.deepfake_detector, self.ai_detector, self.forensics_analyzer,
+                      settings.IMAGE_ANALYSIS_MAX_SIDE, settings.MODEL_WARMUP,
+                      settings.TRACING_ENABLED, settings.ANALYSIS_PRECISION,
+                      settings.ANALYSIS_FANOUT_DETECTORS)
+        )
+        self.ready = not settings.MODEL_WARMUP
+        self.warmup_status: Dict[str, Any] = {}
+        self._worker_models: Optional[Dict[str, Any]] = None
+        self._warmup_task: Optional[asyncio.Task] = None
+        
+        # Identical content analyzed with the same configuration is served from here
+        self.result_store = ResultStore(
+            db_path=settings.RESULT_STORE_PATH or None,
+            memory_limit_bytes=settings.RESULT_CACHE_MEMORY_BYTES,
+            config_version=self._config_version(),
+            disk_max_age=settings.RESULT_STORE_MAX_AGE,
+            disk_limit_bytes=settings.RESULT_STORE_MAX_BYTES
+        )
+        # Perceptual fingerprints of analyzed content, so re-encoded uploads reuse a result
+        self.near_duplicates: Optional[NearDuplicateIndex] = None
+        if settings.NEAR_DUPLICATE_ENABLED:
+            self.near_duplicates = NearDuplicateIndex(
+                db_path=settings.NEAR_DUPLICATE_INDEX_PATH or None,
+                max_distance=settings.NEAR_DUPLICATE_MAX_DISTANCE,
+                video_match=settings.NEAR_DUPLICATE_VIDEO_MATCH
+            )
+        
+        # Queued analyses, run by job workers (separate processes unless in memory)
+        self.job_broker = create_broker(settings.JOB_BROKER_URL, max_attempts=settings.JOB_MAX_ATTEMPTS)
+        self._worker_processes: List[subprocess.Popen] = []
+        self._worker_task: Optional[asyncio.Task] = None
+        self._worker_stop: Optional[asyncio.Event] = None
+    
+    def shutdown(self):
+        self.publish_metrics()
+        self.stop_job_workers()
+        self.executor.shutdown()
+        self.result_store.close()
+        if self.near_duplicates is not None:
+            self.near_duplicates.close()
+        self.job_broker.close()
+    
+    def start_warmup(self):
+        """Warm up in the background; ``readiness`` reports when it is done"""
+        if not self.ready and self._warmup_task is None:
+            self._warmup_task = asyncio.ensure_future(self.warmup())
+    
+    async def warmup(self):
+        """Start the detector workers, load their models and run a dummy batch through each"""
+        started = time.perf_counter()
+        try:
+            workers = await self.executor.warmup(detector_tasks.warmup_detectors)
+        except Exception as e:
+            self.warmup_status = {"error": f"Warmup failed: {str(e)}"}
+        else:
+            self.warmup_status = {"workers": len({worker["pid"] for worker in workers})}
+            self._worker_models = workers[0]["models"]
+        self.warmup_status["seconds"] = round(time.perf_counter() - started, 3)
+        # Analyses still work after a failed warmup, just without the head start
+        self.ready = True
+    
+    def readiness(self) -> Dict[str, Any]:
+        """Whether warmup is done, and the models as a worker has them"""
+        models = self._worker_models if self._worker_models is not None else self.model_registry.status()
+        return {"ready": self.ready, "models": models, "warmup": self.warmup_status}
+    
+    def inference_report(self) -> Dict[str, Any]:
+        """Batching limits and batch-size/queue-wait histograms of every model"""
+        snapshot = self._all_metrics()[1].snapshot()
+        return {
+            name: {**self.model_registry.batching(name), **snapshot.get(name, {})}
+            for name in self.model_registry.names()
+        }
+    
+    def metrics_text(self) -> str:
+        """Service and inference metrics in the Prometheus text format"""
+        metrics, inference_stats = self._all_metrics()
+        return metrics.render(model_histogram_lines(inference_stats.models))
+    
+    def publish_metrics(self):
+        """Write this process's metrics to the spool now"""
+        if self._metrics_flush is not None:
+            self._metrics_flush.cancel()
+            self._metrics_flush = None
+        if self.metrics_spool is not None:
+            self.metrics_spool.write(self._metrics_snapshot())
+    
+    def _schedule_metrics_publish(self):
+        # At most one write per interval, however many requests it covers
+        if self.metrics_spool is not None and self._metrics_flush is None:
+            self._metrics_flush = asyncio.get_running_loop().call_later(
+                settings.METRICS_PUBLISH_INTERVAL, self.publish_metrics
+            )
+    
+    def _metrics_snapshot(self) -> Dict[str, Any]:
+        return {"service": self.metrics.snapshot(), "inference": self.inference_stats.to_dict()}
+    
+    def _all_metrics(self):
+        """``(metrics, inference_stats)`` summed over every process sharing the spool"""
+        if self.metrics_spool is None:
+            return self.metrics, self.inference_stats
+        # This process's own metrics are read live rather than from its last write
+        return self._sum_metrics([self._metrics_snapshot()] + self.metrics_spool.collect())
+    
+    def _sum_metrics(self, snapshots: List[Dict[str, Any]]):
+        metrics, inference_stats = service_metrics(), InferenceStats()
+        for snapshot in snapshots:
+            metrics.merge(snapshot["service"])
+            inference_stats.merge(snapshot["inference"])
+        return metrics, inference_stats
+    
+    def retire_metrics(self, pid: int):
+        """Fold the spooled metrics of exited worker ``pid`` into the total of exited workers"""
+        if self.metrics_spool is None:
+            return
+        
+        def total(snapshots: List[Dict[str, Any]]) -> Dict[str, Any]:
+            metrics, inference_stats = self._sum_metrics(snapshots)
+            return {"service": metrics.snapshot(), "inference": inference_stats.to_dict()}
+        
+        self.metrics_spool.retire(pid, total)
+    
+    def start_job_workers(self, count: Optional[int] = None):
+        """Start local job workers: processes, or a task in this process for the memory broker"""
+        count = settings.JOB_LOCAL_WORKERS if count is None else count
+        if count <= 0:
+            return
+        if isinstance(self.job_broker, MemoryBroker):
+            from app.services.job_worker import JobWorker
+            self._worker_stop = asyncio.Event()
+            worker = JobWorker(self, concurrency=count * settings.JOB_WORKER_CONCURRENCY)
+            self._worker_task = asyncio.ensure_future(worker.run(self._worker_stop))
+            return
+        
+        # Same command as standalone workers
+        from app.services.job_worker import spawn_worker_process
+        for _ in range(count):
+            self._worker_processes.append(spawn_worker_process(settings.JOB_WORKER_CONCURRENCY))
+    
+    def stop_job_workers(self, timeout: float = 10.0):
+        if self._worker_stop is not None:
+            self._worker_stop.set()
+            self._worker_stop = None
+        from app.services.job_worker import stop_worker_processes
+        stop_worker_processes(self._worker_processes, timeout)
+        self._worker_processes = []
+    
+    def _config_version(self) -> str:
+        """Fingerprint of everything that changes analysis output"""
+        config = {
+            "version": settings.VERSION,
+            "image_max_side": settings.IMAGE_ANALYSIS_MAX_SIDE,
+            "metadata_prescreen": settings.METADATA_PRESCREEN,
+            "precision": settings.ANALYSIS_PRECISION,
+            "models": self.model_registry.fingerprint(),
+            "deepfake": [self.deepfake_detector.lbp_points, self.deepfake_detector.lbp_radius,
+                         self.deepfake_detector.lbp_method],
+            "ai": [self.ai_detector.entropy_kernel_size, self.ai_detector.entropy_bins],
+            "forensics": [list(self.forensics_analyzer.ela_qualities), self.forensics_analyzer.ela_map_size,
+                          self.forensics_analyzer.tile_grid],
+            "video": [settings.VIDEO_SAMPLING_MODE, settings.VIDEO_MAX_FRAMES,
+                      settings.VIDEO_FRAME_STRIDE, settings.VIDEO_SAMPLE_INTERVAL,
+                      settings.VIDEO_SEGMENT_FRAMES, settings.VIDEO_ADAPTIVE_INITIAL_FRAMES,
+                      settings.VIDEO_ADAPTIVE_MAX_FRAMES, settings.VIDEO_ADAPTIVE_CI_HALF_WIDTH,
+                      settings.VIDEO_TIME_BUDGET]
+        }
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+    
+    async def get_analysis(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        """A finished analysis, or the status of a job that has not finished"""
+        job = await asyncio.to_thread(self.job_broker.get, analysis_id)
+        if job is None:
+            return await self.result_store.get_by_analysis_id(analysis_id)
+        if job.status == "completed" and job.result is not None:
+            return {**job.result, "job": job.to_dict()}
+        return job.to_dict()
+    
+    async def submit_job(self, file, upload: IngestedUpload, priority: int = 0) -> Dict[str, Any]:
+        """Queue an analysis and return its status right away.
+        
+        The upload is moved to the spool directory, where any worker sharing
+        it (and the broker) can pick it up.
+        """
+        job_id = new_job_id()
+        extension = os.path.splitext(file.filename or "")[1].lower()
+        path = os.path.join(settings.JOB_SPOOL_DIR, job_id + extension)
+        payload = {
+            "filename": file.filename,
+            "content_type": file.content_type,
+            "media_type": upload.media_type,
+            "size": upload.size,
+            "sha256": upload.sha256,
+            "path": os.path.abspath(path)
+        }
+        await asyncio.to_thread(spool_upload, upload, path)
+        
+        job = Job(job_id, payload, priority=clamp_priority(priority))
+        try:
+            await asyncio.to_thread(self.job_broker.submit, job)
+        except BaseException:
+            self.discard_job_upload(job)
+            raise
+        return job.to_dict()
+    
+    async def cancel_job(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        job = await asyncio.to_thread(self.job_broker.cancel, analysis_id)
+        if job is None:
+            return None
+        if job.status == "cancelled":
+            self.discard_job_upload(job)
+        return job.to_dict()
+    
+    async def run_job(self, job: Job) -> Dict[str, Any]:
+        """Analyze a job's spooled upload (called by job workers)"""
+        payload = job.payload
+        with open(payload["path"], "rb") as f:
+            head = f.read(64 * 1024)
+        # Not closed here: the spooled file must survive if the job is requeued
+        upload = IngestedUpload(payload["filename"], payload["media_type"], head, payload["size"],
+                                payload["sha256"], path=payload["path"])
+        file = types.SimpleNamespace(filename=payload["filename"], content_type=payload["content_type"])
+        return await self.analyze_media(file, upload, upload.media_type)
+    
+    def discard_job_upload(self, job: Job):
+        try:
+            os.unlink(job.payload["path"])
+        except OSError:
+            pass
+    
+    async def analyze_media(self, file, upload: IngestedUpload, file_type: str,
+                            limiter: Optional[asyncio.Semaphore] = None,
+                            timings: bool = False) -> Dict[str, Any]:
+        """Analyze an ingested upload, or serve the stored result for its content.
+        
+        Content not in the store is fingerprinted first; when it is a near
+        duplicate of analyzed content, that result is served instead.
+        
+        With ``timings`` the result carries the wall time of each traced
+        stage this request ran (empty when it was served from the store).
+        """
+        started = time.perf_counter()
+        fingerprint, near_duplicate = None, None
+        
+        async def compute():
+            # Runs only on a store miss, so stored content is never fingerprinted
+            nonlocal fingerprint, near_duplicate
+            if self.near_duplicates is not None:
+                fingerprint, near_duplicate = await self._find_near_duplicate(upload, limiter)
+                if near_duplicate is not None:
+                    return near_duplicate
+            return await self._analyze_upload(file, upload, file_type, limiter)
+        
+        with tracing.recording() as recorder:
+            result, source = await self.result_store.get_or_compute(
+                # A near duplicate's result is served, but kept only under its own content
+                upload.sha256, compute, storable=lambda result: result is not near_duplicate and self._storable(result)
+            )
+            if near_duplicate is not None:
+                source = "near_duplicate"
+            if source == "computed" and fingerprint is not None and self._storable(result):
+                await asyncio.to_thread(self.near_duplicates.add, upload.sha256, fingerprint)
+        elapsed = time.perf_counter() - started
+        self._record_metrics(result, source, upload, elapsed, recorder)
+        
+        if source != "computed":
+            result["filename"] = file.filename
+            result["cache"] = {"hit": True, "source": source}
+        if timings:
+            result["timings"] = {
+                "total_ms": round(elapsed * 1000.0, 3),
+                "tracing_enabled": tracing.is_enabled(),
+                "stages": recorder.summary()
+            }
+        return result
+    
+    def _storable(self, result: Dict[str, Any]) -> bool:
+        # A video cut short by the time budget reflects the load it ran under,
+        # not just its content; the next upload of it gets another try
+        return result.get("sampling", {}).get("stop_reason") != "budget"
+    
+    async def _find_near_duplicate(self, upload: IngestedUpload, limiter: Optional[asyncio.Semaphore]):
+        """``(fingerprint, result)``: the upload's fingerprint, and the stored result of its near duplicate if any"""
+        if limiter is None:
+            limiter = asyncio.Semaphore(settings.ANALYSIS_MAX_TASKS_PER_REQUEST)
+        try:
+            if upload.is_video:
+                fingerprinted = await self._submit(limiter, detector_tasks.fingerprint_video,
+                                                   upload.path, settings.NEAR_DUPLICATE_VIDEO_FRAMES)
+            else:
+                fingerprinted = await self._submit(limiter, detector_tasks.fingerprint_image_content,
+                                                   upload.read())
+        except ExecutorOverloaded:
+            raise
+        except Exception:
+            # Undecodable here means the analysis itself reports the error
+            return None, None
+        fingerprint = fingerprinted["fingerprint"]
+        if fingerprint is None:
+            return None, None
+        
+        with tracing.span("near_duplicate.find"):
+            match = await asyncio.to_thread(self.near_duplicates.find, fingerprint)
+        if match is None:
+            return fingerprint, None
+        prior = await self.result_store.get(match["content_sha256"])
+        if prior is None:
+            # Analyzed under another configuration; analyze this upload afresh
+            return fingerprint, None
+        
+        with tracing.span("near_duplicate.check"):
+            unchanged = await self._forensics_unchanged(upload, prior, limiter)
+        if not unchanged:
+            return fingerprint, None
+        
+        prior["near_duplicate"] = {
+            "analysis_id": prior.get("analysis_id"),
+            "max_distance": self.near_duplicates.max_distance,
+            **match
+        }
+        # The verdict is the prior item's; the identity is this upload's
+        prior["content_sha256"] = upload.sha256
+        prior["file_size"] = upload.size
+        return fingerprint, prior
+    
+    async def _forensics_unchanged(self, upload: IngestedUpload, prior: Dict[str, Any],
+                                   limiter: asyncio.Semaphore) -> bool:
+        """Whether the upload's own forensics find nothing its near duplicate's analysis did not.
+        
+        A local edit (a splice, a swapped face) moves the hashes only a few
+        bits; it shows up as a new editing indicator or as an outlying tile
+        away from the analyzed item's.  Video results keep no tile analysis,
+        so a video with any outlying tile is analyzed afresh.
+        """
+        known = set(prior["authenticity_analysis"].get("editing_indicators", []))
+        if upload.is_video:
+            checked = await self._submit(limiter, detector_tasks.check_video_forensics,
+                                         upload.path, settings.NEAR_DUPLICATE_VIDEO_FRAMES)
+            return bool(checked["forensics"]) and not any(
+                "error" in frame or set(frame.get("editing_indicators", [])) - known
+                or localized_anomalies(frame.get("detailed_analysis", {}).get("tile_analysis"))
+                for frame in checked["forensics"]
+            )
+        
+        checked = await self._submit(limiter, detector_tasks.analyze_image_content, upload.read(), ("forensics",))
+        forensics = checked["forensics"]
+        if "error" in forensics or set(forensics.get("editing_indicators", [])) - known:
+            return False
+        tiles = forensics.get("detailed_analysis", {}).get("tile_analysis")
+        prior_tiles = prior.get("localization") or {}
+        prior_anomalies = localized_anomalies(prior_tiles)
+        for name, tile in localized_anomalies(tiles).items():
+            expected = prior_anomalies.get(name)
+            if expected is None or tiles["grid"] != prior_tiles.get("grid"):
+                return False
+            # Re-encoding shifts an outlier by at most a tile
+            if max(abs(tile[0] - expected[0]), abs(tile[1] - expected[1])) > 1:
+                return False
+        return True
+    
+    def _record_metrics(self, result: Dict[str, Any], source: str, upload: IngestedUpload,
+                        elapsed: float, recorder: tracing.StageRecorder):
+        media_type = "video" if upload.is_video else "image"
+        self.metrics.inc("analyses_total", media_type=media_type, source=source)
+        self.metrics.observe("ingested_bytes", upload.size, media_type=media_type)
+        for stage, durations in recorder.stages.items():
+            for seconds in durations:
+                self.metrics.observe("stage_seconds", seconds, stage=stage)
+        self._schedule_metrics_publish()
+        if source != "computed":
+            return
+        self.metrics.observe("analysis_seconds", elapsed, media_type=media_type)
+        if "sampling" in result:
+            self.metrics.observe("video_frames", result["sampling"]["frames_sampled"])
+    
+    async def analyze_batch(self, sources: AsyncIterator) -> Dict[str, Any]:
+        """Analyze every file of a batch upload, returning per-item results or errors.
+        
+        Sources are ingested one at a time in arrival order (archive members
+        must be read before the next one is extracted) while up to
+        ``BATCH_MAX_IN_FLIGHT`` ingested items are analyzed concurrently.
+        All items share one limiter sized to keep the whole pool busy
+        without overflowing its queue; when other requests fill it anyway,
+        items wait up to ``BATCH_OVERLOAD_WAIT`` seconds for room.
+        """
+        started = time.perf_counter()
+        slots = asyncio.Semaphore(settings.BATCH_MAX_IN_FLIGHT)
+        limiter = asyncio.Semaphore(min(self.executor.capacity, 2 * self.executor.max_workers))
+        items: List[Optional[Dict[str, Any]]] = []
+        tasks = []
+        
+        try:
+            async for source in sources:
+                index = len(items)
+                if index >= settings.BATCH_MAX_ITEMS:
+                    raise UploadRejected(413, f"Batch exceeds {settings.BATCH_MAX_ITEMS} items")
+                
+                await slots.acquire()
+                try:
+                    upload = await ingest_upload(source, settings.MAX_FILE_SIZE, settings.ALLOWED_EXTENSIONS)
+                except ArchiveTooLarge:
+                    slots.release()
+                    raise
+                except UploadRejected as e:
+                    slots.release()
+                    items.append(self._batch_error(index, source.filename, e.status_code, e.detail))
+                    continue
+                except BaseException:
+                    slots.release()
+                    raise
+                items.append(None)
+                tasks.append(asyncio.ensure_future(
+                    self._analyze_batch_item(index, source, upload, limiter, slots)
+                ))
+            for item in await asyncio.gather(*tasks):
+                items[item["index"]] = item
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        
+        elapsed = time.perf_counter() - started
+        succeeded = sum(1 for item in items if item["status"] == "ok")
+        return {
+            "batch_id": self._generate_analysis_id().replace("analysis_", "batch_", 1),
+            "total": len(items),
+            "succeeded": succeeded,
+            "failed": len(items) - succeeded,
+            "items": items,
+            "timing": {
+                "total_seconds": elapsed,
+                "items_per_second": len(items) / elapsed if elapsed > 0 else 0
+            }
+        }
+    
+    async def _analyze_batch_item(self, index: int, file, upload: IngestedUpload,
+                                  limiter: asyncio.Semaphore, slots: asyncio.Semaphore) -> Dict[str, Any]:
+        started = time.perf_counter()
+        # Pool tasks of the item wait for room rather than fail while other requests fill the queue
+        _overload_deadline.set(time.monotonic() + settings.BATCH_OVERLOAD_WAIT)
+        try:
+            with upload:
+                result = await self.analyze_media(file, upload, upload.media_type, limiter)
+        except ExecutorOverloaded as e:
+            return self._batch_error(index, file.filename, 429, str(e))
+        except Exception as e:
+            return self._batch_error(index, file.filename, 500, f"Analysis failed: {str(e)}")
+        finally:
+            slots.release()
+        
+        return {
+            "index": index,
+            "filename": file.filename,
+            "status": "ok",
+            "seconds": time.perf_counter() - started,
+            "result": result
+        }
     
-    async def analyze_media(self, file, content, file_type: str) -> Dict[str, Any]:
+    def _batch_error(self, index: int, filename: str, status_code: int, detail: str) -> Dict[str, Any]:
+        return {
+            "index": index,
+            "filename": filename,
+            "status": "error",
+            "status_code": status_code,
+            "detail": detail
+        }
+    
+    async def _analyze_upload(self, file, upload: IngestedUpload, file_type: str,
+                              limiter: Optional[asyncio.Semaphore] = None) -> Dict[str, Any]:
         analysis_id = self._generate_analysis_id()
         
-        # Extract basic metadata
-        metadata = await self.metadata_extractor.extract(file, content)
+        # Header-only metadata; images are already in memory, videos are
+        # parsed from the spooled file so a trailing moov box is found
+        if upload.is_video:
+            content = None
+            with tracing.span("metadata"):
+                metadata = await self.metadata_extractor.extract(file, upload.head, size=upload.size,
+                                                                 path=upload.path)
+        else:
+            content = upload.read()
+            with tracing.span("metadata"):
+                metadata = await self.metadata_extractor.extract(file, content, size=upload.size)
         
         # Initialize result structure
         result = {
             "analysis_id": analysis_id,
             "filename": file.filename,
             "file_type": file_type,
-            "file_size": len(content),
+            "file_size": upload.size,
+            "content_sha256": upload.sha256,
             "timestamp": datetime.utcnow().isoformat(),
             "metadata": metadata,
             "authenticity_analysis": {},
@@ -45,11 +576,18 @@ class AnalysisService:
             "confidence_scores": {}
         }
         
+        # Caps this request's share of the worker pool (batches pass a shared one)
+        if limiter is None:
+            limiter = asyncio.Semaphore(settings.ANALYSIS_MAX_TASKS_PER_REQUEST)
+        
         # Perform type-specific analysis
-        if file_type.startswith('image'):
-            analysis_result = await self._analyze_image(content)
+        if settings.METADATA_PRESCREEN and metadata.get("generator"):
+            # Metadata names the generator; the detectors could only agree
+            analysis_result = self._prescreen_result(metadata)
+        elif file_type.startswith('image'):
+            analysis_result = await self._analyze_image(content, limiter)
         elif file_type.startswith('video'):
-            analysis_result = await self._analyze_video(file, content)
+            analysis_result = await self._analyze_video(upload.path, limiter, metadata.get("container"))
         else:
             raise ValueError("Unsupported file type")
         
@@ -60,29 +598,68 @@ class AnalysisService:
         
         return result
     
-    async def _analyze_image(self, content: bytes) -> Dict[str, Any]:
-        # Convert to PIL Image
-        image = Image.open(io.BytesIO(content))
-        image_np = np.array(image)
+    async def _run_detectors(self, task, payload, limiter: asyncio.Semaphore) -> Dict[str, Any]:
+        """Run all detectors on ``payload`` in one pool task (fanned out to threads there if enabled)"""
+        return await self._submit(limiter, task, payload)
+    
+    async def _submit(self, limiter: asyncio.Semaphore, fn, *args):
+        submitted = time.time()
+        with tracing.span(f"pool.{fn.__name__}"):
+            async with limiter:
+                result = await self._run_in_pool(fn, *args)
+        self.inference_stats.merge(result.pop("inference", {}))
+        # Stages run in the worker are reported back with the result
+        trace = result.pop("trace", {})
+        if "started_at" in trace:
+            self.metrics.observe("queue_wait_seconds", max(0.0, trace["started_at"] - submitted))
+        tracing.merge(trace.get("stages"))
+        return result
+    
+    async def _run_in_pool(self, fn, *args):
+        """``executor.run``, waiting out a full queue until the overload deadline if one is set"""
+        deadline = _overload_deadline.get()
+        while True:
+            try:
+                return await self.executor.run(fn, *args)
+            except ExecutorOverloaded:
+                remaining = deadline - time.monotonic() if deadline is not None else 0.0
+                if remaining <= 0:
+                    raise
+            try:
+                await asyncio.wait_for(self.executor.wait_for_capacity(), remaining)
+            except asyncio.TimeoutError:
+                raise ExecutorOverloaded(self.executor.retry_after)
+    
+    async def _analyze_image(self, content: bytes, limiter: asyncio.Semaphore) -> Dict[str, Any]:
+        # JPEG header forensics straight from the bytes, before any pixel decode
+        with tracing.span("jpeg_structure"):
+            jpeg_structure = analyze_jpeg_structure(content)
         
-        # Perform various analyses
-        deepfake_analysis = await self.deepfake_detector.analyze_image(image_np)
-        ai_analysis = await self.ai_detector.analyze_image(image_np)
-        forensics_analysis = await self.forensics_analyzer.analyze(image_np)
+        # Decode and run every detector in the worker pool
+        analyses = await self._run_detectors(detector_tasks.analyze_image_content, content, limiter)
+        deepfake_analysis = analyses["deepfake"]
+        ai_analysis = analyses["ai"]
+        forensics_analysis = analyses["forensics"]
         
-        return {
+        editing_indicators = list(forensics_analysis.get("editing_indicators", []))
+        compression_artifacts = dict(forensics_analysis.get("compression_artifacts", {}))
+        if jpeg_structure is not None:
+            compression_artifacts["jpeg"] = jpeg_structure
+            if jpeg_structure.get("double_compression_suspected"):
+                editing_indicators.append("Possible double JPEG compression")
+        
+        result = {
             "authenticity_analysis": {
                 "is_authentic": deepfake_analysis.get("is_authentic", False),
                 "deepfake_probability": deepfake_analysis.get("probability", 0),
                 "ai_generated_probability": ai_analysis.get("probability", 0),
-                "editing_indicators": forensics_analysis.get("editing_indicators", []),
-                "compression_artifacts": forensics_analysis.get("compression_artifacts", {})
+                "editing_indicators": editing_indicators,
+                "compression_artifacts": compression_artifacts
             },
             "technical_analysis": {
-                "image_dimensions": image.size,
-                "color_mode": image.mode,
-                "dpi": image.info.get('dpi', (72, 72)),
-                "format": image.format
+                **analyses["image_info"],
+                # Width x height each detector actually analyzed
+                "analysis_dimensions": analyses["resolutions"]
             },
             "confidence_scores": {
                 "overall_confidence": self._calculate_overall_confidence(
@@ -93,44 +670,196 @@ class AnalysisService:
                 "deepfake_confidence": deepfake_analysis.get("confidence", 0),
                 "ai_generation_confidence": ai_analysis.get("confidence", 0),
                 "forensics_confidence": forensics_analysis.get("confidence", 0)
-            }
+            },
+            "processing": analyses["processing"]
+        }
+        
+        # Raw CNN outputs (already blended into the probabilities above)
+        model_scores = dict(deepfake_analysis.get("model_scores", {}))
+        cnn_analysis = forensics_analysis.get("detailed_analysis", {}).get("cnn_analysis")
+        if cnn_analysis is not None:
+            model_scores[cnn_analysis["model"]] = cnn_analysis["manipulation_probability"]
+        if model_scores:
+            result["authenticity_analysis"]["model_scores"] = model_scores
+        
+        # Per-tile forensic heatmaps for locating edited regions
+        tile_analysis = forensics_analysis.get("detailed_analysis", {}).get("tile_analysis")
+        if tile_analysis is not None:
+            result["localization"] = tile_analysis
+        
+        return result
+    
+    def _prescreen_result(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """Verdict for media whose metadata names a generation tool, without running detectors"""
+        generator = metadata["generator"]
+        # Header-level geometry and codec stand in for the decoded image info
+        technical_analysis = {
+            key: value for key, value in metadata.get("container", {}).items()
+            if key in ("format", "width", "height", "duration", "resolution", "video_codec", "encoder")
+        }
+        
+        return {
+            "authenticity_analysis": {
+                "is_authentic": False,
+                "deepfake_probability": 0,
+                "ai_generated_probability": PRESCREEN_CONFIDENCE,
+                "editing_indicators": [],
+                "compression_artifacts": {},
+                "prescreen": {
+                    "verdict": "ai_generated",
+                    "tool": generator["tool"],
+                    "evidence": generator["field"]
+                }
+            },
+            "technical_analysis": technical_analysis,
+            "confidence_scores": {
+                "overall_confidence": PRESCREEN_CONFIDENCE,
+                "ai_generation_confidence": PRESCREEN_CONFIDENCE
+            },
+            "processing": {}
         }
     
-    async def _analyze_video(self, file, content: bytes) -> Dict[str, Any]:
-        # Save to temporary file for processing
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_file:
-            temp_file.write(content)
-            temp_path = temp_file.name
+    async def _analyze_video(self, video_path: str, limiter: asyncio.Semaphore,
+                             container: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        started = time.perf_counter()
+        temporal = TemporalConsistencyAnalyzer(segment_size=settings.VIDEO_SEGMENT_FRAMES)
+        indicators: Dict[str, None] = {}
+        
+        # The upload was spooled to disk by the ingest step.
+        # One capture handle serves metadata and decoded frames
+        async with self.video_processor.open(video_path) as source:
+            video_metadata = source.metadata(container)
+            if settings.VIDEO_SAMPLING_MODE == ADAPTIVE_MODE and source.frame_count() > 0:
+                sampling = await self._sample_video_adaptive(source, limiter, temporal, indicators, started)
+            else:
+                sampling = await self._sample_video_stream(source, limiter, temporal, indicators, started)
+        sampling["elapsed_seconds"] = time.perf_counter() - started
         
+        # Aggregate results
+        aggregated = self._aggregate_video_analysis(temporal, list(indicators))
+        
+        return {
+            "authenticity_analysis": aggregated,
+            "technical_analysis": video_metadata,
+            "confidence_scores": {
+                "overall_confidence": aggregated.get("overall_confidence", 0),
+                "temporal_consistency": aggregated.get("temporal_consistency", 0)
+            },
+            "temporal_analysis": temporal.summary(),
+            "sampling": sampling
+        }
+    
+    def _budget_spent(self, started: float) -> bool:
+        budget = settings.VIDEO_TIME_BUDGET
+        return budget > 0 and time.perf_counter() - started >= budget
+    
+    async def _sample_video_stream(self, source: VideoSource, limiter: asyncio.Semaphore,
+                                   temporal: TemporalConsistencyAnalyzer, indicators: Dict[str, None],
+                                   started: float) -> Dict[str, Any]:
+        # Frames are stacked into batches and each batch is dispatched as
+        # soon as it fills, so analysis overlaps with decoding of the next.
+        # Finished batches are folded into running statistics in sample
+        # order, so memory stays flat however many frames are sampled
+        mode = settings.VIDEO_SAMPLING_MODE
+        if mode == ADAPTIVE_MODE:
+            # Length unknown, so nothing to place adaptive samples by
+            mode = "time"
+        batch_size = max(1, settings.VIDEO_BATCH_SIZE)
+        max_pending = max(1, settings.VIDEO_BATCHES_IN_FLIGHT)
+        pending: Deque[asyncio.Future] = deque()
+        frames = []
+        sampled = 0
+        stop_reason = "end_of_video"
+        stream = source.stream(
+            mode=mode,
+            max_frames=settings.VIDEO_MAX_FRAMES,
+            stride=settings.VIDEO_FRAME_STRIDE,
+            interval_seconds=settings.VIDEO_SAMPLE_INTERVAL,
+            timestamps=True
+        )
         try:
-            # Extract frames for analysis
-            frames = await self.video_processor.extract_frames(temp_path)
-            
-            # Analyze multiple frames
-            frame_analyses = []
-            for frame in frames[:10]:  # Analyze first 10 frames
-                frame_analysis = await self._analyze_video_frame(frame)
-                frame_analyses.append(frame_analysis)
-            
-            # Aggregate results
-            aggregated = self._aggregate_video_analysis(frame_analyses)
-            
-            # Additional video-specific analysis
-            video_metadata = await self.video_processor.analyze_video_metadata(temp_path)
+            async for timestamp, frame in stream:
+                temporal.add_frame(frame, timestamp)
+                frames.append(frame)
+                sampled += 1
+                if len(frames) == batch_size:
+                    pending.append(asyncio.ensure_future(self._analyze_video_batch(frames, limiter)))
+                    frames = []
+                    while len(pending) > max_pending:
+                        self._fold_video_batch(await pending.popleft(), temporal, indicators)
+                if sampled >= settings.VIDEO_MAX_FRAMES:
+                    stop_reason = "max_frames"
+                elif self._budget_spent(started):
+                    stop_reason = "budget"
+                    break
+            if frames:
+                pending.append(asyncio.ensure_future(self._analyze_video_batch(frames, limiter)))
+            while pending:
+                self._fold_video_batch(await pending.popleft(), temporal, indicators)
+        except BaseException:
+            for task in pending:
+                task.cancel()
+            raise
+        finally:
+            await stream.aclose()
+        
+        return {"mode": mode, "frames_sampled": sampled, "stop_reason": stop_reason}
+    
+    async def _sample_video_adaptive(self, source: VideoSource, limiter: asyncio.Semaphore,
+                                     temporal: TemporalConsistencyAnalyzer, indicators: Dict[str, None],
+                                     started: float) -> Dict[str, Any]:
+        """Analyze frames in rounds chosen by ``AdaptiveFrameSampler`` until it or the budget says stop.
+        
+        Rounds arrive out of temporal order, so each frame is kept only as a
+        small thumbnail and the temporal analysis is replayed in frame order
+        at the end (bounded by ``VIDEO_ADAPTIVE_MAX_FRAMES``).
+        """
+        sampler = AdaptiveFrameSampler(
+            source.frame_count(),
+            initial_frames=settings.VIDEO_ADAPTIVE_INITIAL_FRAMES,
+            max_frames=settings.VIDEO_ADAPTIVE_MAX_FRAMES,
+            batch_size=settings.VIDEO_BATCH_SIZE,
+            ci_half_width=settings.VIDEO_ADAPTIVE_CI_HALF_WIDTH
+        )
+        samples: Dict[int, Any] = {}
+        indices = sampler.initial()
+        rounds = 0
+        stop_reason = None
+        while stop_reason is None:
+            decoded = await source.read_frames_async(indices)
+            if decoded:
+                frame_analyses = await self._analyze_video_batch([frame for _, _, frame in decoded], limiter)
+            else:
+                frame_analyses = []
+            rounds += 1
             
-            return {
-                "authenticity_analysis": aggregated,
-                "technical_analysis": video_metadata,
-                "confidence_scores": {
-                    "overall_confidence": aggregated.get("overall_confidence", 0),
-                    "temporal_consistency": aggregated.get("temporal_consistency", 0)
-                }
-            }
+            analyzed = set()
+            for (index, timestamp, frame), frame_analysis in zip(decoded, frame_analyses):
+                samples[index] = (timestamp, frame_thumbnail(frame), frame_analysis)
+                sampler.add(index, frame_analysis)
+                analyzed.add(index)
+            for index in indices:
+                if index not in analyzed:
+                    sampler.add(index, None)
             
-        finally:
-            # Cleanup
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
+            stop_reason = sampler.stop_reason()
+            if stop_reason is None and self._budget_spent(started):
+                stop_reason = "budget"
+            if stop_reason is None:
+                indices = sampler.next_batch()
+        
+        for index in sorted(samples):
+            timestamp, thumbnail, frame_analysis = samples[index]
+            temporal.add_frame(thumbnail, timestamp)
+            self._fold_video_batch([frame_analysis], temporal, indicators)
+        
+        return {
+            "mode": ADAPTIVE_MODE,
+            "frames_sampled": len(samples),
+            "stop_reason": stop_reason,
+            "rounds": rounds,
+            "confidence_half_width": min(sampler.half_width(), 1.0)
+        }
     
     def _calculate_overall_confidence(self, *scores):
         return sum(scores) / len(scores) if scores else 0
@@ -144,6 +873,10 @@ class AnalysisService:
         editing_indicators = auth_analysis.get("editing_indicators", [])
         
         risk_score = (deepfake_prob + ai_prob) / 2
+        prescreen = auth_analysis.get("prescreen")
+        if prescreen:
+            # Only the AI generation probability is known for pre-screened media
+            risk_score = ai_prob
         
         if risk_score > 0.8 or len(editing_indicators) > 3:
             risk_level = "HIGH"
@@ -152,24 +885,34 @@ class AnalysisService:
         else:
             risk_level = "LOW"
         
+        factors = [
+            f"Deepfake probability: {deepfake_prob:.2f}",
+            f"AI generation probability: {ai_prob:.2f}",
+            f"Editing indicators found: {len(editing_indicators)}"
+        ]
+        if prescreen:
+            factors.insert(0, f"Metadata names generation tool: {prescreen['tool']}")
+        
         return {
             "risk_level": risk_level,
             "risk_score": risk_score,
-            "factors": [
-                f"Deepfake probability: {deepfake_prob:.2f}",
-                f"AI generation probability: {ai_prob:.2f}",
-                f"Editing indicators found: {len(editing_indicators)}"
-            ]
+            "factors": factors
         }
     
     def _generate_analysis_id(self) -> str:
         return f"analysis_{datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')}"
     
-    async def _analyze_video_frame(self, frame: np.ndarray) -> Dict[str, Any]:
-        deepfake_analysis = await self.deepfake_detector.analyze_image(frame)
-        ai_analysis = await self.ai_detector.analyze_image(frame)
-        forensics_analysis = await self.forensics_analyzer.analyze(frame)
-        
+    async def _analyze_video_batch(self, frames: List[np.ndarray], limiter: asyncio.Semaphore) -> List[Dict]:
+        # Per-frame results are identical to analyzing each frame on its own
+        analyses = await self._run_detectors(detector_tasks.analyze_frames, np.stack(frames), limiter)
+        return [
+            self._summarize_video_frame(deepfake_analysis, ai_analysis, forensics_analysis)
+            for deepfake_analysis, ai_analysis, forensics_analysis
+            in zip(analyses["deepfake"], analyses["ai"], analyses["forensics"])
+        ]
+    
+    def _summarize_video_frame(self, deepfake_analysis: Dict, ai_analysis: Dict,
+                               forensics_analysis: Dict) -> Dict[str, Any]:
         return {
             "deepfake_probability": deepfake_analysis.get("probability", 0),
             "ai_generated_probability": ai_analysis.get("probability", 0),
@@ -181,8 +924,20 @@ class AnalysisService:
             )
         }
     
-    def _aggregate_video_analysis(self, frame_analyses: List[Dict]) -> Dict[str, Any]:
-        if not frame_analyses:
+    def _fold_video_batch(self, frame_analyses: List[Dict], temporal: TemporalConsistencyAnalyzer,
+                          indicators: Dict[str, None]):
+        for frame_analysis in frame_analyses:
+            temporal.add_scores({
+                key: frame_analysis.get(key, 0)
+                for key in ("deepfake_probability", "ai_generated_probability", "confidence")
+            })
+            # First-seen order keeps the response stable across runs
+            indicators.update(dict.fromkeys(frame_analysis.get("editing_indicators", [])))
+    
+    def _aggregate_video_analysis(self, temporal: TemporalConsistencyAnalyzer,
+                                  editing_indicators: List[str]) -> Dict[str, Any]:
+        deepfake = temporal.score("deepfake_probability")
+        if not deepfake.count:
             return {
                 "is_authentic": True,
                 "deepfake_probability": 0,
@@ -191,25 +946,17 @@ class AnalysisService:
                 "temporal_consistency": 0
             }
         
-        avg_deepfake = np.mean([fa.get("deepfake_probability", 0) for fa in frame_analyses])
-        avg_ai = np.mean([fa.get("ai_generated_probability", 0) for fa in frame_analyses])
-        avg_confidence = np.mean([fa.get("confidence", 0) for fa in frame_analyses])
-        
-        deepfake_variance = np.var([fa.get("deepfake_probability", 0) for fa in frame_analyses])
-        temporal_consistency = 1.0 - min(deepfake_variance, 1.0)
-        
-        all_editing_indicators = []
-        for fa in frame_analyses:
-            all_editing_indicators.extend(fa.get("editing_indicators", []))
-        
-        unique_indicators = list(set(all_editing_indicators))
+        avg_deepfake = deepfake.mean
+        avg_ai = temporal.score("ai_generated_probability").mean
+        avg_confidence = temporal.score("confidence").mean
+        temporal_consistency = 1.0 - min(deepfake.variance, 1.0)
         
         return {
-            "is_authentic": avg_deepfake < 0.5 and avg_ai < 0.5,
+            "is_authentic": bool(avg_deepfake < 0.5 and avg_ai < 0.5),
             "deepfake_probability": float(avg_deepfake),
             "ai_generated_probability": float(avg_ai),
-            "editing_indicators": unique_indicators,
+            "editing_indicators": editing_indicators,
             "overall_confidence": float(avg_confidence),
             "temporal_consistency": float(temporal_consistency),
-            "frames_analyzed": len(frame_analyses)
+            "frames_analyzed": deepfake.count
         }
\ No newline at end of file
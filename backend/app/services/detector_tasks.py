@@ -0,0 +1,256 @@
+"""Picklable detector entry points executed inside the worker pool.
+
+Each worker process gets its own copy of the detectors through
+``install_detectors`` (used as the pool initializer); in thread mode the
+service's own instances are installed once in the parent process.
+"""
+import asyncio
+import contextvars
+import functools
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from ml_models import precision, tracing
+from ml_models.analysis_context import AnalysisContext, FrameBatch
+from ml_models.perceptual_hash import image_fingerprint, video_fingerprint
+from app.utils.video_processor import VideoSource
+
+DETECTOR_NAMES = ("deepfake", "ai", "forensics")
+
+_detectors: Dict[str, Any] = {}
+_analysis_max_side: Optional[int] = None
+# Run the detectors of one task on threads of their own (see ``_call_detectors``)
+_fanout_detectors = False
+
+
+def install_detectors(deepfake_detector, ai_detector, forensics_analyzer,
+                      analysis_max_side: Optional[int] = None, warmup: bool = False,
+                      tracing_enabled: bool = False, float_precision: str = "float64",
+                      fanout_detectors: bool = False):
+    global _analysis_max_side, _fanout_detectors
+    tracing.enable(tracing_enabled)
+    precision.set_precision(float_precision)
+    _detectors["deepfake"] = deepfake_detector
+    _detectors["ai"] = ai_detector
+    _detectors["forensics"] = forensics_analyzer
+    _analysis_max_side = analysis_max_side or None
+    _fanout_detectors = fanout_detectors
+    if warmup:
+        # Before the worker takes any task, so no request pays for model init
+        _warmup_models()
+
+
+def _registries() -> List[Any]:
+    registries = {}
+    for detector in _detectors.values():
+        registry = getattr(detector, "registry", None)
+        if registry is not None:
+            registries[id(registry)] = registry
+    return list(registries.values())
+
+
+def _warmup_models() -> Dict[str, Any]:
+    models: Dict[str, Any] = {}
+    for registry in _registries():
+        models.update(registry.warmup())
+    return models
+
+
+def warmup_detectors() -> Dict[str, Any]:
+    """Load the models and run every detector once on a dummy frame"""
+    models = _warmup_models()
+    analyze_frame(np.full((64, 64, 3), 128, dtype=np.uint8))
+    return {"pid": os.getpid(), "models": models}
+
+
+def _max_side(name: str) -> Optional[int]:
+    """Longest image side the detector runs on, None for native resolution"""
+    if getattr(_detectors[name], "needs_native_resolution", True):
+        return None
+    return _analysis_max_side
+
+
+def _inference_stats() -> Dict[str, Any]:
+    """Histogram deltas of every model run by this process, for the parent to merge"""
+    stats: Dict[str, Any] = {}
+    for registry in _registries():
+        stats.update(registry.drain_stats())
+    return stats
+
+
+def _pool_task(fn: Callable) -> Callable:
+    """Attach this process's inference stats and the task's trace to its result.
+
+    ``trace`` holds the wall-clock start of the task (for the parent's
+    queue-wait histogram) and, with tracing enabled, the stages it ran.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs) -> Dict[str, Any]:
+        started_at = time.time()
+        with tracing.recording() as recorder:
+            result = fn(*args, **kwargs)
+        result["inference"] = _inference_stats()
+        result["trace"] = {"started_at": started_at, "stages": recorder.stages}
+        return result
+    return wrapper
+
+
+def _detector_calls(image: np.ndarray, names, context: AnalysisContext) -> Dict[str, Callable[[], Awaitable]]:
+    calls: Dict[str, Callable[[], Awaitable]] = {}
+    if "deepfake" in names:
+        calls["deepfake"] = lambda: _detectors["deepfake"].analyze_image(image, context)
+    if "ai" in names:
+        calls["ai"] = lambda: _detectors["ai"].analyze_image(image, context)
+    if "forensics" in names:
+        calls["forensics"] = lambda: _detectors["forensics"].analyze(image, context)
+    return calls
+
+
+def _call_detectors(calls: Dict[str, Callable[[], Awaitable]]) -> Dict[str, Any]:
+    """Run detector coroutines, each on a thread of its own when fanning out.
+
+    The threads share the caller's decoded input and its derived planes, so
+    fanning out costs no extra pickling, decoding or grayscale conversion.
+    Results are keyed in call order either way.
+    """
+    if not _fanout_detectors or len(calls) < 2:
+        return {name: asyncio.run(call()) for name, call in calls.items()}
+    first, *rest = calls
+    # Threads per task rather than a shared pool, so thread-mode executors
+    # fan out every task they run at once; each thread runs in a copy of
+    # this context, so its traced stages reach the task's recorder
+    with ThreadPoolExecutor(max_workers=len(rest), thread_name_prefix="fanout") as pool:
+        futures = [pool.submit(contextvars.copy_context().run, asyncio.run, calls[name]()) for name in rest]
+        results = {first: asyncio.run(calls[first]())}
+        results.update((name, future.result()) for name, future in zip(rest, futures))
+    return results
+
+
+def _run_detectors(image: np.ndarray, names) -> Dict[str, Any]:
+    with AnalysisContext(image) as context:
+        result = _call_detectors(_detector_calls(image, names, context))
+        result["processing"] = context.stats()
+    return result
+
+
+@_pool_task
+def analyze_frame(image: np.ndarray, names=DETECTOR_NAMES) -> Dict[str, Any]:
+    """Run the named detectors on one decoded image or video frame"""
+    return _run_detectors(image, names)
+
+
+@_pool_task
+def analyze_frames(frames: np.ndarray, names=DETECTOR_NAMES) -> Dict[str, Any]:
+    """Run the named detectors on an N x H x W x C stack; one result list per detector"""
+    with FrameBatch(frames) as batch:
+        result = _call_detectors({
+            name: functools.partial(_detectors[name].analyze_batch, frames, batch)
+            for name in DETECTOR_NAMES if name in names
+        })
+        result["processing"] = batch.stats()
+    return result
+
+
+@tracing.traced("decode")
+def decode_image(content: bytes, max_side: Optional[int] = None) -> np.ndarray:
+    """Decode an image so that its longest side is at most ``max_side``.
+
+    JPEGs are shrunk inside the decoder (libjpeg DCT scaling by 1/2, 1/4 or
+    1/8 via draft mode), so the full-resolution pixels are never
+    materialized; the remainder, and every other format, goes through a
+    reducing resize.
+    """
+    image = Image.open(io.BytesIO(content))
+    if max_side and max(image.size) > max_side:
+        scale = max_side / max(image.size)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        # Picks the smallest DCT scale that still yields at least ``size``
+        image.draft(image.mode, size)
+        if image.size != size:
+            image = image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+    return np.array(image)
+
+
+@_pool_task
+def analyze_image_content(content: bytes, names=DETECTOR_NAMES) -> Dict[str, Any]:
+    """Decode an uploaded image and run the named detectors on it.
+
+    Every detector gets the image at the resolution it declares; detectors
+    sharing a resolution share one decode and one ``AnalysisContext``.
+    """
+    with Image.open(io.BytesIO(content)) as image:
+        image_info = {
+            "image_dimensions": image.size,
+            "color_mode": image.mode,
+            "dpi": image.info.get('dpi', (72, 72)),
+            "format": image.format
+        }
+
+    groups: Dict[Optional[int], Tuple[str, ...]] = {}
+    for name in names:
+        groups[_max_side(name)] = groups.get(_max_side(name), ()) + (name,)
+
+    contexts = [AnalysisContext(decode_image(content, max_side)) for max_side in groups]
+    calls: Dict[str, Callable[[], Awaitable]] = {}
+    resolutions: Dict[str, List[int]] = {}
+    for context, group in zip(contexts, groups.values()):
+        calls.update(_detector_calls(context.image, group, context))
+        for name in group:
+            resolutions[name] = [context.image.shape[1], context.image.shape[0]]
+    try:
+        # Every decode is done before the detectors (of all resolutions) fan out
+        result = _call_detectors({name: calls[name] for name in names})
+    finally:
+        for context in contexts:
+            context.release()
+
+    result["processing"] = {}
+    for context in contexts:
+        for key, value in context.stats().items():
+            result["processing"][key] = result["processing"].get(key, 0) + value
+    result["resolutions"] = resolutions
+    result["image_info"] = image_info
+    return result
+
+
+@_pool_task
+@tracing.traced("fingerprint")
+def fingerprint_image_content(content: bytes) -> Dict[str, Any]:
+    """Perceptual fingerprint of an uploaded image, for the near-duplicate index"""
+    with Image.open(io.BytesIO(content)) as image:
+        # Hashes only see a 32 x 32 thumbnail, so a scaled-down JPEG decode is plenty
+        image.draft("L", (64, 64))
+        gray = np.asarray(image.convert("L"), dtype=np.float32)
+    return {"fingerprint": image_fingerprint(gray)}
+
+
+def _fingerprint_indices(total: int, frames: int) -> List[int]:
+    return [min(total - 1, int((i + 0.5) * total / frames)) for i in range(frames)]
+
+
+@_pool_task
+@tracing.traced("fingerprint")
+def fingerprint_video(video_path: str, frames: int) -> Dict[str, Any]:
+    """Perceptual fingerprint of ``frames`` frames at fixed fractions of a video's length"""
+    with VideoSource(video_path) as source:
+        total = source.frame_count()
+        if total <= 0:
+            return {"fingerprint": None}
+        indices = _fingerprint_indices(total, frames)
+        decoded = {index: frame for index, _, frame in source.read_frames(indices)}
+    return {"fingerprint": video_fingerprint([decoded.get(index) for index in indices])}
+
+
+@_pool_task
+def check_video_forensics(video_path: str, frames: int) -> Dict[str, Any]:
+    """Forensics, tile analysis included, of the frames ``fingerprint_video`` hashes"""
+    with VideoSource(video_path) as source:
+        total = source.frame_count()
+        decoded = source.read_frames(_fingerprint_indices(total, frames)) if total > 0 else []
+    return {"forensics": [_run_detectors(frame, ("forensics",))["forensics"] for _, _, frame in decoded]}
@@ -0,0 +1,125 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+EXECUTOR_MODES = ("process", "thread")
+
+
+class ExecutorOverloaded(Exception):
+    """Raised when the in-flight queue is full and new work is rejected"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Analysis queue is full, retry later")
+        self.retry_after = retry_after
+
+
+class DetectorExecutor:
+    """Runs CPU-bound detector work off the asyncio event loop.
+
+    Work goes to a process pool (or a thread pool) with at most
+    ``max_workers + queue_depth`` tasks in flight.  Once that bound is
+    reached ``run`` fails fast with ``ExecutorOverloaded`` instead of
+    queueing without limit.
+    """
+
+    def __init__(self, mode: str = "process", max_workers: int = 1, queue_depth: int = 0,
+                 retry_after: int = 5, initializer: Optional[Callable] = None,
+                 initargs: Tuple = ()):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown executor mode '{mode}', expected one of {EXECUTOR_MODES}")
+        self.mode = mode
+        self.max_workers = max(1, max_workers)
+        self.queue_depth = max(0, queue_depth)
+        self.retry_after = retry_after
+        self._initializer = initializer
+        self._initargs = initargs
+        self._pool: Optional[Executor] = None
+        self._in_flight = 0
+        self._waiters: List[asyncio.Future] = []
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.queue_depth
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def has_capacity(self, tasks: int = 1) -> bool:
+        return self._in_flight + tasks <= self.capacity
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run ``fn(*args)`` in the pool, rejecting it if the queue is full.
+
+        The task keeps its slot until the pool is done with it, even when the
+        caller is cancelled while it runs.
+        """
+        if not self.has_capacity():
+            raise ExecutorOverloaded(self.retry_after)
+
+        loop = asyncio.get_running_loop()
+        self._in_flight += 1
+        try:
+            future = self._get_pool().submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release_from(loop))
+        return await asyncio.wrap_future(future, loop=loop)
+
+    def _release_from(self, loop: asyncio.AbstractEventLoop):
+        # Called on a pool thread once the task is done (or cancelled before it started)
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            # The loop is closed; nobody is left to wait for the slot
+            pass
+
+    def _release(self):
+        self._in_flight -= 1
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def wait_for_capacity(self):
+        """Wait until ``run`` would accept a task (another caller may still take the slot first)"""
+        while not self.has_capacity():
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            await waiter
+
+    async def warmup(self, fn: Callable, *args) -> list:
+        """Start every worker and run ``fn(*args)`` once per worker slot.
+
+        The tasks are submitted together, so the pool starts all of its
+        processes (each runs the initializer before its first task).
+        """
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        return await asyncio.gather(*(
+            loop.run_in_executor(pool, fn, *args) for _ in range(self.max_workers)
+        ))
+
+    def shutdown(self, wait: bool = True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+
+    def _get_pool(self) -> Executor:
+        # Created lazily so importing the service never forks worker processes
+        if self._pool is None:
+            if self.mode == "process":
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    initializer=self._initializer,
+                    initargs=self._initargs
+                )
+            else:
+                if self._initializer is not None:
+                    self._initializer(*self._initargs)
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="detector"
+                )
+        return self._pool
@@ -0,0 +1,180 @@
+"""Job worker: claims queued analyses from the broker and runs them.
+
+Run standalone workers (any number, on any host sharing the broker and the
+upload spool directory) with:
+
+    python -m app.services.job_worker --concurrency 2
+
+The API also starts ``JOB_LOCAL_WORKERS`` of these processes itself.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
+
+from app.core.config import settings
+from app.services.jobs import Job, JobBroker
+
+
+class JobWorker:
+    """Runs up to ``concurrency`` jobs at once through an ``AnalysisService``.
+
+    While a job runs its lease is renewed every third of
+    ``JOB_LEASE_SECONDS``; the same heartbeat reports cancellation
+    requests, which cancel the analysis.  When the worker stops, jobs it
+    is still running go back to the queue.
+    """
+
+    def __init__(self, service, broker: Optional[JobBroker] = None, concurrency: int = 1,
+                 worker_id: Optional[str] = None):
+        self.service = service
+        self.broker = broker if broker is not None else service.job_broker
+        self.concurrency = max(1, concurrency)
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = settings.JOB_LEASE_SECONDS
+        self.poll_interval = settings.JOB_POLL_INTERVAL
+
+    async def run(self, stop: asyncio.Event):
+        slots = asyncio.Semaphore(self.concurrency)
+        running: Dict[asyncio.Task, Job] = {}
+        try:
+            while not stop.is_set():
+                if not await self._acquire_slot(slots, stop):
+                    break
+                if stop.is_set():
+                    slots.release()
+                    break
+                job = await asyncio.to_thread(self.broker.claim, self.worker_id, self.lease_seconds)
+                if job is None:
+                    slots.release()
+                    try:
+                        await asyncio.wait_for(stop.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                task = asyncio.ensure_future(self._execute(job, slots))
+                running[task] = job
+                task.add_done_callback(lambda task: running.pop(task, None))
+        finally:
+            tasks = dict(running)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            # The worker is stopping, not the jobs: let another worker take them (a
+            # task cancelled before it started never ran its own cleanup)
+            for task, job in tasks.items():
+                if task.cancelled():
+                    await asyncio.to_thread(self.broker.requeue, job.id)
+
+    async def _acquire_slot(self, slots: asyncio.Semaphore, stop: asyncio.Event) -> bool:
+        """Wait for a free slot; False (holding none) once ``stop`` is set first"""
+        acquire = asyncio.ensure_future(slots.acquire())
+        stopped = asyncio.ensure_future(stop.wait())
+        try:
+            await asyncio.wait({acquire, stopped}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stopped.cancel()
+            acquire.cancel()
+        if acquire.cancelled():
+            return False
+        if stop.is_set():
+            slots.release()
+            return False
+        return True
+
+    async def _execute(self, job: Job, slots: asyncio.Semaphore):
+        analysis = asyncio.ensure_future(self.service.run_job(job))
+        status, result, error = "completed", None, None
+        try:
+            while True:
+                done, _ = await asyncio.wait({analysis}, timeout=self.lease_seconds / 3)
+                if done:
+                    break
+                cancel = await asyncio.to_thread(self.broker.heartbeat, job.id, self.worker_id,
+                                                 self.lease_seconds)
+                if cancel:
+                    analysis.cancel()
+                    await asyncio.gather(analysis, return_exceptions=True)
+                    status = "cancelled"
+                    break
+            if status == "completed":
+                try:
+                    result = analysis.result()
+                except Exception as e:
+                    status, error = "failed", f"Analysis failed: {str(e)}"
+        except asyncio.CancelledError:
+            # The worker is stopping; ``run`` gives the job back to the queue
+            analysis.cancel()
+            await asyncio.gather(analysis, return_exceptions=True)
+            raise
+        finally:
+            slots.release()
+
+        await asyncio.to_thread(self.broker.finish, job.id, status, result, error)
+        self.service.discard_job_upload(job)
+
+
+def spawn_worker_process(concurrency: int, analysis_workers: Optional[int] = None) -> subprocess.Popen:
+    """Start a standalone worker (the command below) from the backend directory.
+
+    ``analysis_workers`` sizes its detector pool (``ANALYSIS_WORKERS``, which
+    otherwise defaults to a worker per core).
+    """
+    backend_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+    env = None
+    if analysis_workers is not None:
+        env = dict(os.environ, ANALYSIS_WORKERS=str(analysis_workers))
+    return subprocess.Popen(
+        [sys.executable, "-m", "app.services.job_worker", "--concurrency", str(concurrency)],
+        cwd=backend_dir, env=env
+    )
+
+
+def stop_worker_processes(processes: List[subprocess.Popen], timeout: float = 10.0):
+    # Workers put the jobs they are running back in the queue on SIGTERM
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def _serve(concurrency: int):
+    # Imported here: the service imports this module to run in-process workers
+    from app.services.analysis_service import AnalysisService
+
+    service = AnalysisService()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        if not service.ready:
+            await service.warmup()
+        await JobWorker(service, concurrency=concurrency).run(stop)
+    finally:
+        service.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run analysis jobs from the job broker")
+    parser.add_argument("--concurrency", type=int, default=settings.JOB_WORKER_CONCURRENCY,
+                        help="jobs run at once by this worker")
+    args = parser.parse_args()
+    started = time.strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{started}] Job worker {os.getpid()} consuming {settings.JOB_BROKER_URL}")
+    asyncio.run(_serve(args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
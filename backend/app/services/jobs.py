@@ -0,0 +1,515 @@
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+JOB_STATUSES = ("queued", "running", "completed", "failed", "cancelled")
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+# Redis queue scores pack the priority above a submission counter, which
+# keeps priorities within float precision
+MAX_PRIORITY = 99
+
+
+class Job:
+    """One queued analysis and everything known about its progress"""
+
+    def __init__(self, job_id: str, payload: Dict[str, Any], priority: int = 0, status: str = "queued",
+                 submitted_at: Optional[float] = None, started_at: Optional[float] = None,
+                 finished_at: Optional[float] = None, worker: Optional[str] = None, attempts: int = 0,
+                 cancel_requested: bool = False, result: Optional[Dict[str, Any]] = None,
+                 error: Optional[str] = None):
+        self.id = job_id
+        self.payload = payload
+        self.priority = priority
+        self.status = status
+        self.submitted_at = submitted_at if submitted_at is not None else time.time()
+        self.started_at = started_at
+        self.finished_at = finished_at
+        self.worker = worker
+        self.attempts = attempts
+        self.cancel_requested = cancel_requested
+        self.result = result
+        self.error = error
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Public status, without the payload or result"""
+        status = {
+            "analysis_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "filename": self.payload.get("filename"),
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "attempts": self.attempts
+        }
+        if self.cancel_requested and not self.finished:
+            status["cancel_requested"] = True
+        if self.error is not None:
+            status["error"] = self.error
+        return status
+
+
+def new_job_id() -> str:
+    return f"job_{uuid.uuid4().hex}"
+
+
+def clamp_priority(priority: int) -> int:
+    return max(-MAX_PRIORITY, min(MAX_PRIORITY, int(priority)))
+
+
+class JobBroker(ABC):
+    """Queue and record store for jobs, shared by the API and the workers.
+
+    Higher priorities are claimed first, FIFO within a priority.  A claimed
+    job holds a lease its worker renews with ``heartbeat``; jobs whose lease
+    ran out (the worker died) are queued again on the next ``claim``, up to
+    ``max_attempts`` runs.
+    """
+
+    def __init__(self, max_attempts: int = 3):
+        self.max_attempts = max_attempts
+
+    @abstractmethod
+    def submit(self, job: Job) -> Job:
+        ...
+
+    @abstractmethod
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[Job]:
+        """Next queued job, marked running for ``worker_id``, or None"""
+        ...
+
+    @abstractmethod
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """Extend the lease; returns True if cancellation was requested"""
+        ...
+
+    @abstractmethod
+    def finish(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None,
+               error: Optional[str] = None):
+        ...
+
+    @abstractmethod
+    def requeue(self, job_id: str):
+        """Give a running job back to the queue (its worker is shutting down)"""
+        ...
+
+    @abstractmethod
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued job, or ask the worker of a running one to stop"""
+        ...
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Job]:
+        ...
+
+    @abstractmethod
+    def counts(self) -> Dict[str, int]:
+        ...
+
+    def close(self):
+        pass
+
+
+class MemoryBroker(JobBroker):
+    """Broker inside one process, for tests and single-process deployments"""
+
+    def __init__(self, max_attempts: int = 3):
+        super().__init__(max_attempts)
+        self._jobs: Dict[str, Job] = {}
+        self._queue: List[Any] = []
+        self._leases: Dict[str, float] = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def submit(self, job: Job) -> Job:
+        with self._lock:
+            self._jobs[job.id] = job
+            self._push(job)
+        return job
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[Job]:
+        now = time.time()
+        with self._lock:
+            self._expire_leases(now)
+            while self._queue:
+                _, _, job_id = heapq.heappop(self._queue)
+                job = self._jobs.get(job_id)
+                # Cancelled jobs stay in the heap until they surface
+                if job is None or job.status != "queued":
+                    continue
+                job.status, job.worker, job.started_at = "running", worker_id, now
+                job.attempts += 1
+                self._leases[job_id] = now + lease_seconds
+                return job
+        return None
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != "running" or job.worker != worker_id:
+                return True
+            self._leases[job_id] = time.time() + lease_seconds
+            return job.cancel_requested
+
+    def finish(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None,
+               error: Optional[str] = None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.status, job.result, job.error, job.finished_at = status, result, error, time.time()
+            self._leases.pop(job_id, None)
+
+    def requeue(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status == "running":
+                job.status, job.worker = "queued", None
+                self._leases.pop(job_id, None)
+                self._push(job)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return job
+            if job.status == "queued":
+                job.status, job.finished_at = "cancelled", time.time()
+            else:
+                job.cancel_requested = True
+            return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            counts = dict.fromkeys(JOB_STATUSES, 0)
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+    def _push(self, job: Job):
+        heapq.heappush(self._queue, (-job.priority, next(self._sequence), job.id))
+
+    def _expire_leases(self, now: float):
+        for job_id, lease_until in list(self._leases.items()):
+            if lease_until >= now:
+                continue
+            job = self._jobs[job_id]
+            del self._leases[job_id]
+            if job.attempts >= self.max_attempts:
+                job.status, job.error, job.finished_at = "failed", "Worker lost", now
+            else:
+                job.status, job.worker = "queued", None
+                self._push(job)
+
+
+class SQLiteBroker(JobBroker):
+    """Broker in an SQLite file, shared by every process on the host"""
+
+    _COLUMNS = ("id", "status", "priority", "payload", "submitted_at", "started_at", "finished_at",
+                "worker", "attempts", "cancel_requested", "result", "error")
+
+    def __init__(self, db_path: str, max_attempts: int = 3):
+        super().__init__(max_attempts)
+        self.db_path = db_path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def submit(self, job: Job) -> Job:
+        with self._lock:
+            db = self._connection()
+            db.execute(
+                "INSERT INTO jobs (id, status, priority, payload, submitted_at, attempts, cancel_requested)"
+                " VALUES (?, 'queued', ?, ?, ?, 0, 0)",
+                (job.id, job.priority, json.dumps(job.payload), job.submitted_at)
+            )
+            db.commit()
+        return job
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[Job]:
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            # IMMEDIATE takes the write lock up front, so two workers never claim the same row
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'Worker lost', finished_at = ?"
+                    " WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                    (now, now, self.max_attempts)
+                )
+                db.execute(
+                    "UPDATE jobs SET status = 'queued', worker = NULL"
+                    " WHERE status = 'running' AND lease_until < ?", (now,)
+                )
+                row = db.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY priority DESC, seq LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    db.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, started_at = ?, lease_until = ?,"
+                        " attempts = attempts + 1 WHERE id = ?",
+                        (worker_id, now, now + lease_seconds, row[0])
+                    )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            return self._get(db, row[0]) if row is not None else None
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        with self._lock:
+            db = self._connection()
+            db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running' AND worker = ?",
+                (time.time() + lease_seconds, job_id, worker_id)
+            )
+            db.commit()
+            row = db.execute(
+                "SELECT cancel_requested, status, worker FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return row is None or bool(row[0]) or row[1] != "running" or row[2] != worker_id
+
+    def finish(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None,
+               error: Optional[str] = None):
+        with self._lock:
+            db = self._connection()
+            db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL"
+                " WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+            )
+            db.commit()
+
+    def requeue(self, job_id: str):
+        with self._lock:
+            db = self._connection()
+            db.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL, lease_until = NULL"
+                " WHERE id = ? AND status = 'running'", (job_id,)
+            )
+            db.commit()
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            db = self._connection()
+            db.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            )
+            db.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+            db.commit()
+            return self._get(db, job_id)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._get(self._connection(), job_id)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        counts.update(dict(rows))
+        return counts
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _get(self, db: sqlite3.Connection, job_id: str) -> Optional[Job]:
+        row = db.execute(f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        record = dict(zip(self._COLUMNS, row))
+        return Job(
+            record["id"], json.loads(record["payload"]), priority=record["priority"], status=record["status"],
+            submitted_at=record["submitted_at"], started_at=record["started_at"],
+            finished_at=record["finished_at"], worker=record["worker"], attempts=record["attempts"],
+            cancel_requested=bool(record["cancel_requested"]),
+            result=json.loads(record["result"]) if record["result"] is not None else None,
+            error=record["error"]
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(os.path.abspath(self.db_path))
+            os.makedirs(directory, exist_ok=True)
+            # Autocommit mode; claim() manages its own transaction
+            db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " id TEXT UNIQUE NOT NULL,"
+                " status TEXT NOT NULL,"
+                " priority INTEGER NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " submitted_at REAL NOT NULL,"
+                " started_at REAL,"
+                " finished_at REAL,"
+                " worker TEXT,"
+                " lease_until REAL,"
+                " attempts INTEGER NOT NULL,"
+                " cancel_requested INTEGER NOT NULL,"
+                " result TEXT,"
+                " error TEXT)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, priority DESC, seq)")
+            self._db = db
+        return self._db
+
+
+class RedisBroker(JobBroker):
+    """Broker on a Redis server, shared by workers on any host.
+
+    Needs the optional ``redis`` package.  Queued ids live in a sorted set
+    scored by priority then submission order, running ids in another scored
+    by lease expiry, and every job in a hash.
+    """
+
+    def __init__(self, url: str, max_attempts: int = 3, prefix: str = "media-analysis:jobs"):
+        super().__init__(max_attempts)
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("The Redis job broker needs the 'redis' package (pip install redis)") from e
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._prefix = prefix
+
+    def _key(self, *parts: str) -> str:
+        return ":".join((self._prefix,) + parts)
+
+    def submit(self, job: Job) -> Job:
+        sequence = self._redis.incr(self._key("sequence"))
+        with self._redis.pipeline() as pipe:
+            pipe.hset(self._key("job", job.id), mapping={
+                "payload": json.dumps(job.payload),
+                "priority": job.priority,
+                "status": "queued",
+                "submitted_at": job.submitted_at,
+                "attempts": 0,
+                "cancel_requested": 0
+            })
+            pipe.zadd(self._key("queue"), {job.id: -job.priority * 1e13 + sequence})
+            pipe.execute()
+        return job
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[Job]:
+        now = time.time()
+        self._expire_leases(now)
+        popped = self._redis.zpopmin(self._key("queue"))
+        if not popped:
+            return None
+        job_id = popped[0][0]
+        with self._redis.pipeline() as pipe:
+            pipe.hset(self._key("job", job_id), mapping={"status": "running", "worker": worker_id,
+                                                         "started_at": now})
+            pipe.hincrby(self._key("job", job_id), "attempts", 1)
+            pipe.zadd(self._key("running"), {job_id: now + lease_seconds})
+            pipe.execute()
+        return self.get(job_id)
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        status, worker, cancel_requested = self._redis.hmget(
+            self._key("job", job_id), "status", "worker", "cancel_requested"
+        )
+        if status != "running" or worker != worker_id:
+            return True
+        self._redis.zadd(self._key("running"), {job_id: time.time() + lease_seconds})
+        return cancel_requested == "1"
+
+    def finish(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None,
+               error: Optional[str] = None):
+        fields: Dict[str, Any] = {"status": status, "finished_at": time.time()}
+        if result is not None:
+            fields["result"] = json.dumps(result)
+        if error is not None:
+            fields["error"] = error
+        with self._redis.pipeline() as pipe:
+            pipe.hset(self._key("job", job_id), mapping=fields)
+            pipe.zrem(self._key("running"), job_id)
+            pipe.execute()
+
+    def requeue(self, job_id: str):
+        priority = int(self._redis.hget(self._key("job", job_id), "priority") or 0)
+        sequence = self._redis.incr(self._key("sequence"))
+        with self._redis.pipeline() as pipe:
+            pipe.hset(self._key("job", job_id), mapping={"status": "queued", "worker": ""})
+            pipe.zrem(self._key("running"), job_id)
+            pipe.zadd(self._key("queue"), {job_id: -priority * 1e13 + sequence})
+            pipe.execute()
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        if self._redis.zrem(self._key("queue"), job_id):
+            self._redis.hset(self._key("job", job_id), mapping={"status": "cancelled",
+                                                                "finished_at": time.time()})
+        elif self._redis.hget(self._key("job", job_id), "status") == "running":
+            self._redis.hset(self._key("job", job_id), "cancel_requested", 1)
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        record = self._redis.hgetall(self._key("job", job_id))
+        if not record:
+            return None
+
+        def number(name: str) -> Optional[float]:
+            return float(record[name]) if record.get(name) else None
+
+        return Job(
+            job_id, json.loads(record["payload"]), priority=int(record["priority"]), status=record["status"],
+            submitted_at=number("submitted_at"), started_at=number("started_at"),
+            finished_at=number("finished_at"), worker=record.get("worker") or None,
+            attempts=int(record.get("attempts", 0)), cancel_requested=record.get("cancel_requested") == "1",
+            result=json.loads(record["result"]) if record.get("result") else None, error=record.get("error")
+        )
+
+    def counts(self) -> Dict[str, int]:
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        counts["queued"] = self._redis.zcard(self._key("queue"))
+        counts["running"] = self._redis.zcard(self._key("running"))
+        return counts
+
+    def close(self):
+        self._redis.close()
+
+    def _expire_leases(self, now: float):
+        for job_id in self._redis.zrangebyscore(self._key("running"), "-inf", now):
+            # Only the caller that removes the entry handles the expiry
+            if not self._redis.zrem(self._key("running"), job_id):
+                continue
+            attempts = int(self._redis.hget(self._key("job", job_id), "attempts") or 0)
+            if attempts >= self.max_attempts:
+                self.finish(job_id, "failed", error="Worker lost")
+            else:
+                self.requeue(job_id)
+
+
+def create_broker(url: str, max_attempts: int = 3) -> JobBroker:
+    """Broker for ``memory://``, ``sqlite:///path/to/jobs.sqlite3`` or ``redis://host:port/db``"""
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return MemoryBroker(max_attempts)
+    if scheme == "sqlite":
+        # sqlite:///relative/path and sqlite:////absolute/path, as in SQLAlchemy
+        return SQLiteBroker(url[len("sqlite:///"):], max_attempts)
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisBroker(url, max_attempts)
+    raise ValueError(f"Unknown job broker URL '{url}', expected memory://, sqlite:/// or redis://")
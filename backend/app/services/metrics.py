@@ -0,0 +1,240 @@
+"""Process-wide service metrics, rendered in the Prometheus text format.
+
+Histograms reuse ``ml_models.inference_scheduler.Histogram``; every series
+is keyed by metric name and a (sorted) label tuple.  The processes of one
+server share their metrics through a ``MetricsSpool``.
+"""
+import json
+import os
+import threading
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from ml_models.inference_scheduler import Histogram
+
+PREFIX = "media_analyzer"
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = (16 * 1024, 64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2,
+                 64 * 1024 ** 2, 256 * 1024 ** 2, 1024 ** 3)
+FRAMES_BUCKETS = (1, 2, 5, 10, 20, 40, 80, 160)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Counters and histograms declared once with a help text, observed per label set"""
+
+    def __init__(self, prefix: str = PREFIX):
+        self.prefix = prefix
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._buckets: Dict[str, Sequence[float]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str):
+        self._help[name] = ("counter", help_text)
+        self._counters[name] = {}
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float]):
+        self._help[name] = ("histogram", help_text)
+        self._buckets[name] = tuple(buckets)
+        self._histograms[name] = {}
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms[name]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self._buckets[name])
+            histogram.observe(value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Every series in a JSON-serializable form, for ``merge`` in another process"""
+        with self._lock:
+            return {
+                "counters": {name: [[labels, value] for labels, value in series.items()]
+                             for name, series in self._counters.items()},
+                "histograms": {name: [[labels, histogram.to_dict()] for labels, histogram in series.items()]
+                               for name, series in self._histograms.items()}
+            }
+
+    def merge(self, snapshot: Dict[str, Any]):
+        """Add another registry's ``snapshot``; metrics not declared here are skipped"""
+        with self._lock:
+            for name, series in snapshot.get("counters", {}).items():
+                counters = self._counters.get(name)
+                for labels, value in series if counters is not None else ():
+                    key = tuple(tuple(pair) for pair in labels)
+                    counters[key] = counters.get(key, 0) + value
+            for name, series in snapshot.get("histograms", {}).items():
+                histograms = self._histograms.get(name)
+                for labels, counts in series if histograms is not None else ():
+                    key = tuple(tuple(pair) for pair in labels)
+                    histogram = histograms.get(key)
+                    if histogram is None:
+                        histogram = histograms[key] = Histogram(self._buckets[name])
+                    histogram.merge(counts)
+
+    def render(self, extra: Sequence[str] = ()) -> str:
+        """All series in the Prometheus text exposition format, then ``extra`` lines"""
+        lines: List[str] = []
+        with self._lock:
+            for name, (kind, help_text) in self._help.items():
+                full_name = f"{self.prefix}_{name}"
+                lines.append(f"# HELP {full_name} {help_text}")
+                lines.append(f"# TYPE {full_name} {kind}")
+                if kind == "counter":
+                    for labels, value in sorted(self._counters[name].items()):
+                        lines.append(f"{full_name}{_format_labels(labels)} {_format_value(value)}")
+                else:
+                    for labels, histogram in sorted(self._histograms[name].items()):
+                        lines.extend(histogram_lines(full_name, histogram, labels))
+            lines.extend(extra)
+        return "\n".join(lines) + "\n"
+
+
+def histogram_lines(full_name: str, histogram: Histogram, labels: Labels = ()) -> List[str]:
+    """``_bucket``/``_sum``/``_count`` sample lines of one histogram series"""
+    lines = []
+    for bound, count in histogram.summary()["buckets"].items():
+        bucket = _format_labels(labels, (("le", bound),))
+        lines.append(f"{full_name}_bucket{bucket} {count}")
+    lines.append(f"{full_name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+    lines.append(f"{full_name}_count{_format_labels(labels)} {histogram.count}")
+    return lines
+
+
+def model_histogram_lines(models: Dict[str, Dict[str, Histogram]], prefix: str = PREFIX) -> List[str]:
+    """The micro-batching histograms of ``InferenceStats.models``, labelled by model"""
+    lines: List[str] = []
+    for key, help_text in (("batch_size", "Inputs per model inference call"),
+                           ("queue_wait_ms", "Milliseconds an input waited for its inference batch")):
+        full_name = f"{prefix}_inference_{key.replace('_ms', '_milliseconds')}"
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} histogram")
+        for name in sorted(models):
+            lines.extend(histogram_lines(full_name, models[name][key], (("model", name),)))
+    return lines
+
+
+def service_metrics() -> MetricsRegistry:
+    """The metrics ``AnalysisService`` records"""
+    metrics = MetricsRegistry()
+    metrics.counter("analyses_total", "Analyses served, by media type and result source")
+    metrics.histogram("analysis_seconds", "Wall time of computed analyses", SECONDS_BUCKETS)
+    metrics.histogram("stage_seconds", "Wall time of each traced analysis stage call", SECONDS_BUCKETS)
+    metrics.histogram("queue_wait_seconds", "Seconds a detector task waited before a worker started it",
+                      SECONDS_BUCKETS)
+    metrics.histogram("ingested_bytes", "Size of analyzed uploads", BYTES_BUCKETS)
+    metrics.histogram("video_frames", "Frames analyzed per computed video analysis", FRAMES_BUCKETS)
+    return metrics
+
+
+class MetricsSpool:
+    """Metric snapshots of every process of one server, one file each in ``directory``.
+
+    A process writes its own file with ``write`` and reads the others' with
+    ``collect``.  When a process exits, ``retire`` folds its file into a
+    single running total of the exited processes, so totals never go
+    backwards when a worker is replaced and the directory does not grow
+    with every replacement.  The file name carries a random token, so a
+    reused pid never overwrites one.
+    """
+
+    RETIRED = "retired.json"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._pid: Optional[int] = None
+        self._path: Optional[str] = None
+
+    def write(self, snapshot: Dict[str, Any]):
+        if self._pid != os.getpid():
+            # Forked: the parent's file is not ours
+            self._pid = os.getpid()
+            self._path = os.path.join(self.directory, f"{self._pid}-{uuid.uuid4().hex[:8]}.json")
+        self._replace(self._path, snapshot)
+
+    def collect(self) -> List[Dict[str, Any]]:
+        """The latest snapshot of every other process, the exited ones as one total"""
+        own = self._path if self._pid == os.getpid() else None
+        retired = self._read(os.path.join(self.directory, self.RETIRED))
+        # Files already in the total that are not deleted yet
+        absorbed = set(retired["absorbed"]) if retired else set()
+        snapshots = [retired["snapshot"]] if retired else []
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if not name.endswith(".json") or name == self.RETIRED or name in absorbed or path == own:
+                continue
+            snapshot = self._read(path)
+            if snapshot is not None:
+                snapshots.append(snapshot)
+        return snapshots
+
+    def retire(self, pid: int, total: Callable[[List[Dict[str, Any]]], Dict[str, Any]]):
+        """Fold the file of exited process ``pid`` into the total of exited processes.
+
+        ``total`` sums a list of snapshots into one.  Only the process that
+        reaps the others may call this.
+        """
+        names = [name for name in os.listdir(self.directory) if name.startswith(f"{pid}-")]
+        files = [name for name in names if name.endswith(".json")]
+        if not files:
+            return
+        retired_path = os.path.join(self.directory, self.RETIRED)
+        retired = self._read(retired_path)
+        snapshots = [retired["snapshot"]] if retired else []
+        snapshots += [snapshot for snapshot in map(self._read_name, files) if snapshot is not None]
+        # Absorbed files of earlier calls that could not be deleted stay listed
+        absorbed = [name for name in (retired["absorbed"] if retired else ())
+                    if os.path.exists(os.path.join(self.directory, name))]
+        # Readers skip the absorbed files from the moment the new total
+        # replaces the old one, so the process is never counted twice or not at all
+        self._replace(retired_path, {"absorbed": absorbed + files, "snapshot": total(snapshots)})
+        for name in names:
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def _read_name(self, name: str) -> Optional[Dict[str, Any]]:
+        return self._read(os.path.join(self.directory, name))
+
+    def _read(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _replace(self, path: str, data: Dict[str, Any]):
+        temporary = path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(data, f)
+        # Readers see the previous contents or these, never a partial file
+        os.replace(temporary, path)
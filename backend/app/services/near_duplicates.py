@@ -0,0 +1,274 @@
+import itertools
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ml_models.perceptual_hash import HASH_BITS, hamming
+
+
+# Frame positions per video fingerprint are packed into the low bits of index tags
+_POSITION_BITS = 8
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    """Set bits of every uint64 in ``values`` (the classic SWAR bit count)"""
+    values = values - ((values >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    values = (values & np.uint64(0x3333333333333333)) + ((values >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    values = (values + (values >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (values * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+class HammingIndex:
+    """Multi-index hashing of 64-bit hashes for Hamming-radius search.
+
+    Every hash is split into ``chunks`` substrings.  Two hashes within
+    distance ``r`` agree to within ``r // chunks`` bits on at least one
+    substring (pigeonhole), so a search looks up only the substrings that
+    close to the query's, in one bucket table per substring, and checks the
+    few candidates found against the full hash.
+
+    The bucket tables are rebuilt in bulk; entries added since the last
+    rebuild are compared with the query directly, and a search rebuilds
+    first once there are ``rebuild_after`` of them.
+    """
+
+    def __init__(self, chunks: int = 4, rebuild_after: int = 16384):
+        widths = [HASH_BITS // chunks + (1 if i < HASH_BITS % chunks else 0) for i in range(chunks)]
+        self._chunks = [(sum(widths[:i]), width) for i, width in enumerate(widths)]
+        self.rebuild_after = rebuild_after
+        self._hashes = array("Q")
+        # Caller's integer per entry (what ``search`` returns)
+        self._tags = array("q")
+        self._indexed = 0
+        # Per substring: entries ordered by its value, and where each value's run starts
+        self._order: List[np.ndarray] = []
+        self._starts: List[np.ndarray] = []
+        self._probes: Dict[Tuple[int, int], np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, value: int, tag: int):
+        self._hashes.append(value)
+        self._tags.append(tag)
+
+    def rebuild(self):
+        hashes = np.array(self._hashes, dtype=np.uint64)
+        self._order, self._starts = [], []
+        for shift, width in self._chunks:
+            values = ((hashes >> np.uint64(shift)) & np.uint64((1 << width) - 1)).astype(np.int64)
+            self._order.append(np.argsort(values, kind="stable").astype(np.uint32))
+            starts = np.zeros((1 << width) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(values, minlength=1 << width), out=starts[1:])
+            self._starts.append(starts)
+        self._indexed = len(hashes)
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, int]]:
+        """``(distance, tag)`` of every entry within ``max_distance`` bits, nearest first"""
+        if not self._hashes:
+            return []
+        if len(self._hashes) - self._indexed >= self.rebuild_after:
+            self.rebuild()
+        parts = []
+        if self._indexed:
+            radius = max_distance // len(self._chunks)
+            for (shift, width), order, starts in zip(self._chunks, self._order, self._starts):
+                probes = self._chunk_probes(width, radius) ^ ((value >> shift) & ((1 << width) - 1))
+                low, high = starts[probes], starts[probes + 1]
+                found = high > low
+                low, lengths = low[found], (high - low)[found]
+                if lengths.size:
+                    # Concatenated ranges [low, high) of the sorted positions
+                    offsets = np.repeat(low - (np.cumsum(lengths) - lengths), lengths)
+                    parts.append(order[offsets + np.arange(lengths.sum())])
+        if len(self._hashes) > self._indexed:
+            parts.append(np.arange(self._indexed, len(self._hashes)))
+        if not parts:
+            return []
+
+        # An entry close on several substrings is a candidate once per substring
+        entries = np.concatenate(parts)
+        distances = _popcount(np.frombuffer(self._hashes, dtype=np.uint64)[entries] ^ np.uint64(value))
+        entries = np.unique(entries[distances <= max_distance])
+        if not entries.size:
+            return []
+        distances = _popcount(np.frombuffer(self._hashes, dtype=np.uint64)[entries] ^ np.uint64(value))
+        tags = np.frombuffer(self._tags, dtype=np.int64)[entries]
+        return sorted(zip(distances.tolist(), tags.tolist()))
+
+    def _chunk_probes(self, width: int, radius: int) -> np.ndarray:
+        """Every XOR mask of at most ``radius`` bits within a ``width``-bit substring"""
+        probes = self._probes.get((width, radius))
+        if probes is None:
+            masks = [0]
+            for flipped in range(1, radius + 1):
+                for bits in itertools.combinations(range(width), flipped):
+                    masks.append(sum(1 << bit for bit in bits))
+            probes = self._probes[(width, radius)] = np.array(masks, dtype=np.int64)
+        return probes
+
+
+class NearDuplicateIndex:
+    """Perceptual fingerprints of analyzed media, for finding re-uploads.
+
+    An image matches when its pHash and dHash are both within
+    ``max_distance`` bits of an indexed image's.  A video matches when at
+    least ``video_match`` of its frames, taken at the same fractions of its
+    length, match the frames of one indexed video.
+
+    Fingerprints are kept in an SQLite file shared by every process; each
+    process indexes them in memory (in flat arrays, so millions of them stay
+    compact and shared after a fork) and picks up the rows other processes
+    added before every lookup.
+    """
+
+    def __init__(self, db_path: Optional[str], max_distance: int = 6, video_match: float = 0.75):
+        self.db_path = db_path
+        self.max_distance = max_distance
+        self.video_match = video_match
+        # pHashes, tagged with the item (and frame position, for videos)
+        self._images = HammingIndex()
+        self._videos = HammingIndex()
+        # Per item: SHA-256 digest, frame count (0 for images) and where its dHashes start
+        self._digests = bytearray()
+        self._frame_counts = array("H")
+        self._offsets = array("Q")
+        self._dhashes = array("Q")
+        # Content hashes indexed, when there is no database to keep them unique
+        self._known = set()
+        self._last_row = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._frame_counts)
+
+    def load(self):
+        """Index every stored fingerprint now rather than on the first lookup"""
+        with self._lock:
+            self._refresh()
+            self._images.rebuild()
+            self._videos.rebuild()
+
+    def find(self, fingerprint: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The closest indexed item matching ``fingerprint``, or None"""
+        with self._lock:
+            self._refresh()
+            if fingerprint["kind"] == "image":
+                return self._find_image(fingerprint["hashes"])
+            return self._find_video(fingerprint["frames"])
+
+    def add(self, content_hash: str, fingerprint: Dict[str, Any]):
+        with self._lock:
+            db = self._connection()
+            if db is None:
+                if content_hash not in self._known:
+                    self._known.add(content_hash)
+                    self._index(content_hash, fingerprint)
+                return
+            db.execute(
+                "INSERT OR IGNORE INTO fingerprints (content_hash, fingerprint, created_at) VALUES (?, ?, ?)",
+                (content_hash, json.dumps(fingerprint), time.time())
+            )
+            db.commit()
+            self._refresh()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None and self._pid == os.getpid():
+                self._db.close()
+            self._db = None
+
+    def _content_hash(self, item: int) -> str:
+        return self._digests[item * 32:(item + 1) * 32].hex()
+
+    def _find_image(self, hashes: List[int]) -> Optional[Dict[str, Any]]:
+        phash, dhash = hashes
+        for distance, item in self._images.search(phash, self.max_distance):
+            dhash_distance = hamming(dhash, self._dhashes[self._offsets[item]])
+            if dhash_distance <= self.max_distance:
+                return {"content_sha256": self._content_hash(item), "distance": distance,
+                        "dhash_distance": dhash_distance}
+        return None
+
+    def _find_video(self, frames: List[Optional[List[int]]]) -> Optional[Dict[str, Any]]:
+        needed = math.ceil(self.video_match * sum(1 for hashes in frames if hashes))
+        matches: Dict[int, List[int]] = {}
+        for position, hashes in enumerate(frames):
+            if not hashes:
+                continue
+            seen = set()
+            for distance, tag in self._videos.search(hashes[0], self.max_distance):
+                item, item_position = tag >> _POSITION_BITS, tag & ((1 << _POSITION_BITS) - 1)
+                if item_position != position or item in seen or self._frame_counts[item] != len(frames):
+                    continue
+                if hamming(hashes[1], self._dhashes[self._offsets[item] + position]) <= self.max_distance:
+                    seen.add(item)
+                    matches.setdefault(item, []).append(distance)
+        best = max(matches.items(), key=lambda match: (len(match[1]), -sum(match[1])), default=None)
+        if best is None or len(best[1]) < needed:
+            return None
+        item, distances = best
+        return {"content_sha256": self._content_hash(item), "distance": max(distances),
+                "frames_matched": len(distances), "frames": len(frames)}
+
+    def _index(self, content_hash: str, fingerprint: Dict[str, Any]):
+        item = len(self._frame_counts)
+        self._digests += bytes.fromhex(content_hash)
+        self._offsets.append(len(self._dhashes))
+        if fingerprint["kind"] == "image":
+            self._frame_counts.append(0)
+            self._dhashes.append(fingerprint["hashes"][1])
+            self._images.add(fingerprint["hashes"][0], item)
+            return
+        frames = fingerprint["frames"][:1 << _POSITION_BITS]
+        self._frame_counts.append(len(frames))
+        for position, hashes in enumerate(frames):
+            # Frames that could not be hashed are never indexed, so their dHash is never read
+            self._dhashes.append(hashes[1] if hashes else 0)
+            if hashes:
+                self._videos.add(hashes[0], (item << _POSITION_BITS) | position)
+
+    def _refresh(self):
+        db = self._connection()
+        if db is None:
+            return
+        rows = db.execute(
+            "SELECT row, content_hash, fingerprint FROM fingerprints WHERE row > ? ORDER BY row",
+            (self._last_row,)
+        )
+        # Content hashes are unique in the table, so every row is new here
+        for row, content_hash, fingerprint in rows:
+            self._index(content_hash, json.loads(fingerprint))
+            self._last_row = row
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if self.db_path is None:
+            return None
+        if self._pid != os.getpid():
+            # Forked: the parent's in-memory index is kept, its connection is not
+            self._db = None
+            self._pid = os.getpid()
+        if self._db is None:
+            directory = os.path.dirname(os.path.abspath(self.db_path))
+            os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints ("
+                " row INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " content_hash TEXT UNIQUE NOT NULL,"
+                " fingerprint TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            db.commit()
+            self._db = db
+        return self._db
@@ -0,0 +1,231 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# Seconds between two prunings of the disk tier
+PRUNE_INTERVAL = 60.0
+
+
+class ResultStore:
+    """Content-addressed store of finished analyses.
+
+    Results are keyed by content hash plus a configuration version, so a
+    change to detector settings never serves stale verdicts.  Two tiers:
+
+    - an in-memory LRU bounded by the total size of the serialized results
+    - an SQLite file that survives restarts (and is shared by processes),
+      bounded by the age of its results and their total size
+
+    Concurrent requests for the same key are coalesced so the analysis runs
+    once and every caller receives its result.
+    """
+
+    def __init__(self, db_path: Optional[str], memory_limit_bytes: int, config_version: str,
+                 disk_max_age: float = 0, disk_limit_bytes: int = 0):
+        self.db_path = db_path
+        self.memory_limit_bytes = memory_limit_bytes
+        self.config_version = config_version
+        # 0 leaves the disk tier unbounded in that respect
+        self.disk_max_age = disk_max_age
+        self.disk_limit_bytes = disk_limit_bytes
+        # key -> (analysis id, payload)
+        self._memory: "OrderedDict[str, Tuple[Optional[str], str]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._ids: Dict[str, str] = {}
+        self._next_prune = 0.0
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+
+    def cache_key(self, content_hash: str) -> str:
+        return f"{content_hash}:{self.config_version}"
+
+    async def get_or_compute(self, content_hash: str,
+                             compute: Callable[[], Awaitable[Dict[str, Any]]],
+                             storable: Optional[Callable[[Dict[str, Any]], bool]] = None
+                             ) -> Tuple[Dict[str, Any], str]:
+        """Return ``(result, source)`` where source is memory, disk, coalesced or computed.
+
+        A computed result that ``storable`` rejects is handed to the callers
+        waiting for it but not stored.  If the caller computing a result is
+        cancelled, one of the callers waiting for it computes it instead.
+        """
+        key = self.cache_key(content_hash)
+
+        while True:
+            payload = self._memory_get(key)
+            if payload is not None:
+                return json.loads(payload), "memory"
+
+            pending = self._pending.get(key)
+            if pending is None:
+                break
+            try:
+                return json.loads(await asyncio.shield(pending)), "coalesced"
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            row = await asyncio.to_thread(self._disk_get, "cache_key", key)
+            if row is not None:
+                analysis_id, payload = row
+                source = "disk"
+            else:
+                result = await compute()
+                analysis_id, payload = result.get("analysis_id"), json.dumps(result)
+                source = "computed"
+                if storable is not None and not storable(result):
+                    future.set_result(payload)
+                    return result, source
+                await asyncio.to_thread(self._disk_put, key, analysis_id, payload)
+            self._memory_put(key, analysis_id, payload)
+            future.set_result(payload)
+            return json.loads(payload), source
+        except asyncio.CancelledError:
+            # The waiters did not ask to be cancelled; the next of them computes it
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Nobody may be waiting; retrieve the exception so it is not reported as lost
+            future.exception()
+            raise
+        finally:
+            del self._pending[key]
+
+    async def get(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """The stored result for ``content_hash``, without computing one"""
+        key = self.cache_key(content_hash)
+        payload = self._memory_get(key)
+        if payload is None:
+            row = await asyncio.to_thread(self._disk_get, "cache_key", key)
+            payload = row[1] if row is not None else None
+        return json.loads(payload) if payload is not None else None
+
+    async def get_by_analysis_id(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        key = self._ids.get(analysis_id)
+        payload = self._memory_get(key) if key is not None else None
+        if payload is None:
+            row = await asyncio.to_thread(self._disk_get, "analysis_id", analysis_id)
+            payload = row[1] if row is not None else None
+        return json.loads(payload) if payload is not None else None
+
+    def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    # Memory tier
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        self._memory.move_to_end(key)
+        return entry[1]
+
+    def _memory_put(self, key: str, analysis_id: Optional[str], payload: str):
+        size = len(payload)
+        if size > self.memory_limit_bytes:
+            return
+        if key in self._memory:
+            self._memory_evict(key)
+        self._memory[key] = (analysis_id, payload)
+        self._memory_bytes += size
+        if analysis_id:
+            self._ids[analysis_id] = key
+
+        while self._memory_bytes > self.memory_limit_bytes:
+            self._memory_evict(next(iter(self._memory)))
+
+    def _memory_evict(self, key: str):
+        analysis_id, payload = self._memory.pop(key)
+        self._memory_bytes -= len(payload)
+        # Ids of evicted entries fall through to the disk tier on lookup
+        if analysis_id and self._ids.get(analysis_id) == key:
+            del self._ids[analysis_id]
+
+    # Disk tier
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if self.db_path is None:
+            return None
+        if self._db is None:
+            directory = os.path.dirname(os.path.abspath(self.db_path))
+            os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_results ("
+                " cache_key TEXT PRIMARY KEY,"
+                " analysis_id TEXT,"
+                " created_at REAL NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " size INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = [row[1] for row in db.execute("PRAGMA table_info(analysis_results)")]
+            if "size" not in columns:
+                # Stores written before results were bounded by size
+                db.execute("ALTER TABLE analysis_results ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+                db.execute("UPDATE analysis_results SET size = LENGTH(payload)")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_analysis_id ON analysis_results (analysis_id)")
+            # Covers pruning, which then never reads the payloads
+            db.execute("CREATE INDEX IF NOT EXISTS idx_created_size ON analysis_results (created_at, size)")
+            db.commit()
+            self._db = db
+        return self._db
+
+    def _disk_get(self, column: str, value: str) -> Optional[Tuple[str, str]]:
+        with self._db_lock:
+            db = self._connection()
+            if db is None:
+                return None
+            # Expired results not pruned yet are never served
+            cutoff = time.time() - self.disk_max_age if self.disk_max_age > 0 else 0.0
+            row = db.execute(
+                f"SELECT analysis_id, payload FROM analysis_results WHERE {column} = ? AND created_at >= ?",
+                (value, cutoff)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def _disk_put(self, key: str, analysis_id: Optional[str], payload: str):
+        with self._db_lock:
+            db = self._connection()
+            if db is None:
+                return
+            db.execute(
+                "INSERT OR REPLACE INTO analysis_results (cache_key, analysis_id, created_at, payload, size)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, analysis_id, time.time(), payload, len(payload))
+            )
+            if time.monotonic() >= self._next_prune:
+                self._next_prune = time.monotonic() + PRUNE_INTERVAL
+                self._prune(db)
+            db.commit()
+
+    def _prune(self, db: sqlite3.Connection):
+        """Delete expired results, then the oldest ones until the rest fit the size limit"""
+        if self.disk_max_age > 0:
+            db.execute("DELETE FROM analysis_results WHERE created_at < ?", (time.time() - self.disk_max_age,))
+        if self.disk_limit_bytes <= 0:
+            return
+        excess = db.execute("SELECT COALESCE(SUM(size), 0) FROM analysis_results").fetchone()[0]
+        excess -= self.disk_limit_bytes
+        if excess <= 0:
+            return
+        cutoff = None
+        for created_at, size in db.execute("SELECT created_at, size FROM analysis_results ORDER BY created_at"):
+            cutoff = created_at
+            excess -= size
+            if excess <= 0:
+                break
+        db.execute("DELETE FROM analysis_results WHERE created_at <= ?", (cutoff,))
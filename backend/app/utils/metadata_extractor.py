@@ -1,15 +1,583 @@
-from typing import Dict, Any
+import asyncio
+import json
+import os
+import re
+import struct
+import zlib
+from typing import Dict, Any, Iterator, Optional, Tuple
 from datetime import datetime
 
+# Longest text value (prompt, workflow JSON, comment) kept in a result
+MAX_TEXT_LENGTH = 4096
+# Largest XMP packet inflated from a compressed PNG chunk (a JPEG APP1 segment's limit)
+MAX_XMP_LENGTH = 64 * 1024
+# Largest moov box read from a video; bigger ones are skipped
+MAX_MOOV_SIZE = 64 * 1024 * 1024
+# Deepest nesting of container boxes walked in moov (real files stay under 10)
+MAX_BOX_DEPTH = 16
+
+# Confidence of a verdict taken from metadata that names a generation tool
+PRESCREEN_CONFIDENCE = 0.95
+
+# Case-insensitive substrings of tool fields (software, creator tool,
+# encoder) that identify an image or video generator
+GENERATOR_SIGNATURES = (
+    ("midjourney", "Midjourney"),
+    ("dall-e", "DALL-E"),
+    ("dall·e", "DALL-E"),
+    ("stable diffusion", "Stable Diffusion"),
+    ("automatic1111", "Stable Diffusion (AUTOMATIC1111)"),
+    ("comfyui", "ComfyUI"),
+    ("novelai", "NovelAI"),
+    ("invokeai", "InvokeAI"),
+    ("fooocus", "Fooocus"),
+    ("adobe firefly", "Adobe Firefly"),
+    ("leonardo.ai", "Leonardo.Ai"),
+    ("nightcafe", "NightCafe"),
+)
+
+# PNG text keys written by generators, with the tool they imply
+GENERATOR_TEXT_KEYS = (
+    ("invokeai_metadata", "InvokeAI"),
+    ("sd-metadata", "InvokeAI"),
+    ("Dream", "InvokeAI"),
+)
+
+# IPTC digital source type of media created by a generative model (the last
+# segment of its URI); compositeWithTrainedAlgorithmicMedia, a capture with
+# generated parts, is left to the detectors
+AI_SOURCE_TYPE = "trainedalgorithmicmedia"
+
+EXIF_TAGS = {
+    0x010E: "ImageDescription",
+    0x010F: "Make",
+    0x0110: "Model",
+    0x0112: "Orientation",
+    0x0131: "Software",
+    0x0132: "DateTime",
+    0x013B: "Artist",
+    0x8298: "Copyright",
+    0x9003: "DateTimeOriginal",
+    0x9286: "UserComment",
+    0xA002: "PixelXDimension",
+    0xA003: "PixelYDimension",
+    0xA433: "LensMake",
+    0xA434: "LensModel",
+}
+_EXIF_IFD_POINTER = 0x8769
+_GPS_IFD_POINTER = 0x8825
+# Bytes per value of the TIFF field types read here
+_TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 7: 1, 9: 4}
+
+_XMP_PROPERTY = re.compile(
+    rb'[\w-]+:(CreatorTool|DigitalSourceType)'
+    rb'(?:\s*=\s*"([^"]*)"|>([^<]*)<|\s+rdf:resource\s*=\s*"([^"]*)")'
+)
+_XMP_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+
+# Sample entry formats of the ISO base media (MP4/MOV) stsd box
+CODEC_NAMES = {
+    "avc1": "h264", "avc3": "h264",
+    "hvc1": "hevc", "hev1": "hevc",
+    "av01": "av1", "vp08": "vp8", "vp09": "vp9",
+    "mp4v": "mpeg4", "s263": "h263", "jpeg": "mjpeg", "mjpa": "mjpeg",
+    "apch": "prores", "apcn": "prores", "apcs": "prores", "apco": "prores", "ap4h": "prores",
+    "mp4a": "aac", "ac-3": "ac3", "ec-3": "eac3", "opus": "opus", "Opus": "opus",
+    "alac": "alac", "lpcm": "pcm", "sowt": "pcm", "twos": "pcm", ".mp3": "mp3",
+}
+_ISO_CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl", b"udta", b"edts"}
+# iTunes-style (ilst) and QuickTime (udta) metadata atoms reported as tags
+_MP4_TAGS = {
+    b"\xa9too": "encoder",
+    b"\xa9swr": "software",
+    b"\xa9enc": "encoded_by",
+    b"\xa9nam": "title",
+    b"\xa9cmt": "comment",
+    b"\xa9day": "date",
+    b"\xa9mak": "make",
+    b"\xa9mod": "model",
+}
+_MDTA_TAGS = {
+    "com.apple.quicktime.software": "software",
+    "com.apple.quicktime.make": "make",
+    "com.apple.quicktime.model": "model",
+    "com.apple.quicktime.creationdate": "date",
+    "com.apple.quicktime.comment": "comment",
+    "com.apple.quicktime.description": "comment",
+}
+
+
+def _text(raw: bytes, encoding: str = "utf-8") -> str:
+    text = raw.split(b"\x00", 1)[0].decode(encoding, errors="replace").strip()
+    return text[:MAX_TEXT_LENGTH]
+
+
+# EXIF
+
+def _tiff_value(tiff: memoryview, endian: str, tag: int, field_type: int, count: int, value_offset: int) -> Any:
+    size = _TIFF_TYPE_SIZES.get(field_type)
+    if size is None:
+        return None
+    length = size * count
+    if length <= 4:
+        start = value_offset
+    else:
+        start = struct.unpack_from(endian + "I", tiff, value_offset)[0]
+    raw = bytes(tiff[start:start + length])
+    if len(raw) < length:
+        return None
+
+    if tag == 0x9286:
+        return _user_comment(raw)
+    if field_type == 2:
+        return _text(raw, "latin-1")
+    if field_type == 7:
+        return _text(raw)
+    if field_type in (1, 3, 4, 9):
+        code = {1: "B", 3: "H", 4: "I", 9: "i"}[field_type]
+        values = struct.unpack_from(f"{endian}{count}{code}", raw)
+        return values[0] if count == 1 else list(values[:16])
+    return None
+
+
+def _user_comment(raw: bytes) -> str:
+    """Decode an EXIF UserComment, whose first 8 bytes name its character code"""
+    code, body = raw[:8], raw[8:]
+    if code.startswith(b"UNICODE"):
+        # Writers disagree on byte order; the zero byte of ASCII text gives it away
+        big_endian = len(body) > 1 and body[0] == 0 and body[1] != 0
+        return body.decode("utf-16-be" if big_endian else "utf-16-le", errors="replace").strip("\x00 ")[:MAX_TEXT_LENGTH]
+    return _text(body, "latin-1" if code.startswith(b"ASCII") else "utf-8")
+
+
+def _read_ifd(tiff: memoryview, endian: str, offset: int, tags: Dict[str, Any]) -> Dict[int, int]:
+    """Named tags of one IFD into ``tags``; returns the sub-IFD pointers it holds"""
+    pointers: Dict[int, int] = {}
+    count = struct.unpack_from(endian + "H", tiff, offset)[0]
+    for i in range(count):
+        entry = offset + 2 + 12 * i
+        tag, field_type, value_count = struct.unpack_from(endian + "HHI", tiff, entry)
+        if tag in (_EXIF_IFD_POINTER, _GPS_IFD_POINTER):
+            pointers[tag] = struct.unpack_from(endian + "I", tiff, entry + 8)[0]
+        elif tag in EXIF_TAGS:
+            value = _tiff_value(tiff, endian, tag, field_type, value_count, entry + 8)
+            if value not in (None, ""):
+                tags[EXIF_TAGS[tag]] = value
+    return pointers
+
+
+def parse_exif(tiff: bytes) -> Dict[str, Any]:
+    """Selected tags of a TIFF-structured EXIF block (IFD0 and the Exif sub-IFD)"""
+    data = memoryview(tiff)
+    tags: Dict[str, Any] = {}
+    if len(data) < 8 or bytes(data[:2]) not in (b"II", b"MM"):
+        return tags
+    endian = "<" if data[0] == ord("I") else ">"
+    try:
+        ifd0 = struct.unpack_from(endian + "I", data, 4)[0]
+        pointers = _read_ifd(data, endian, ifd0, tags)
+        if _EXIF_IFD_POINTER in pointers:
+            _read_ifd(data, endian, pointers[_EXIF_IFD_POINTER], tags)
+        if _GPS_IFD_POINTER in pointers:
+            tags["GPSInfo"] = True
+    except struct.error:
+        tags["malformed"] = True
+    return tags
+
+
+def parse_xmp(packet: bytes) -> Dict[str, str]:
+    """Creator tool and IPTC digital source type from an XMP packet"""
+    xmp: Dict[str, str] = {}
+    for match in _XMP_PROPERTY.finditer(packet):
+        name = "creator_tool" if match.group(1) == b"CreatorTool" else "digital_source_type"
+        value = next(group for group in match.groups()[1:] if group is not None)
+        xmp.setdefault(name, _text(value))
+    return xmp
+
+
+# Images
+
+def _jpeg_metadata(data: memoryview) -> Dict[str, Any]:
+    """EXIF, XMP and comments from the APPn/COM segments before the first scan"""
+    metadata: Dict[str, Any] = {"format": "JPEG"}
+    pos, end = 2, len(data)
+    while pos + 4 <= end and data[pos] == 0xFF:
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker == 0xD8 or 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            pos += 2
+            continue
+        if marker == 0xDA:
+            break
+        length = struct.unpack_from(">H", data, pos + 2)[0]
+        payload = data[pos + 4:pos + 2 + length]
+
+        if marker == 0xE1 and bytes(payload[:6]) == b"Exif\x00\x00":
+            metadata.setdefault("exif", parse_exif(bytes(payload[6:])))
+        elif marker == 0xE1 and bytes(payload[:len(_XMP_HEADER)]) == _XMP_HEADER:
+            metadata.setdefault("xmp", parse_xmp(bytes(payload[len(_XMP_HEADER):])))
+        elif marker == 0xFE:
+            metadata.setdefault("comment", _text(bytes(payload)))
+        elif marker in (0xC0, 0xC1, 0xC2) and len(payload) >= 5:
+            metadata["height"], metadata["width"] = struct.unpack_from(">HH", payload, 1)
+        pos += 2 + length
+    return metadata
+
+
+def _png_chunks(data: memoryview) -> Iterator[Tuple[bytes, memoryview]]:
+    pos = 8
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack_from(">I4s", data, pos)
+        yield kind, data[pos + 8:pos + 8 + length]
+        if kind == b"IEND":
+            break
+        pos += 12 + length
+
+
+def _inflate(data: bytes, limit: int) -> bytes:
+    """The first ``limit`` bytes of a zlib stream; the rest is never inflated"""
+    return zlib.decompressobj().decompress(data, limit)
+
+
+def _png_text(kind: bytes, payload: bytes) -> Tuple[str, str]:
+    """Keyword and text (at most MAX_TEXT_LENGTH bytes, or MAX_XMP_LENGTH of XMP) of a tEXt, zTXt or iTXt chunk"""
+    key, _, rest = payload.partition(b"\x00")
+    key = key.decode("latin-1")
+    limit = MAX_XMP_LENGTH if key == "XML:com.adobe.xmp" else MAX_TEXT_LENGTH
+    if kind == b"tEXt":
+        return key, rest[:limit].decode("latin-1")
+    if kind == b"zTXt":
+        return key, _inflate(rest[1:], limit).decode("latin-1")
+    compressed, rest = rest[0], rest[2:]
+    _, _, rest = rest.partition(b"\x00")  # language tag
+    _, _, text = rest.partition(b"\x00")  # translated keyword
+    text = _inflate(text, limit) if compressed else text[:limit]
+    return key, text.decode("utf-8", errors="replace")
+
+
+def _png_metadata(data: memoryview) -> Dict[str, Any]:
+    """Text chunks (where generators store prompts and settings), eXIf and size.
+
+    Chunks are skipped by their length, so image data is never inflated.
+    """
+    metadata: Dict[str, Any] = {"format": "PNG"}
+    text_chunks: Dict[str, str] = {}
+    try:
+        for kind, payload in _png_chunks(data):
+            if kind == b"IHDR" and len(payload) >= 8:
+                metadata["width"], metadata["height"] = struct.unpack_from(">II", payload, 0)
+            elif kind in (b"tEXt", b"zTXt", b"iTXt"):
+                key, text = _png_text(kind, bytes(payload))
+                if key == "XML:com.adobe.xmp":
+                    metadata["xmp"] = parse_xmp(text.encode("utf-8"))
+                else:
+                    text_chunks.setdefault(key, text[:MAX_TEXT_LENGTH])
+            elif kind == b"eXIf":
+                metadata["exif"] = parse_exif(bytes(payload))
+    except (struct.error, zlib.error, IndexError):
+        metadata["malformed"] = True
+    if text_chunks:
+        metadata["text_chunks"] = text_chunks
+    return metadata
+
+
+def parse_image_metadata(content: bytes) -> Dict[str, Any]:
+    """Header metadata of a JPEG or PNG without decoding any pixels"""
+    data = memoryview(content)
+    if bytes(data[:3]) == b"\xff\xd8\xff":
+        try:
+            return _jpeg_metadata(data)
+        except struct.error:
+            return {"format": "JPEG", "malformed": True}
+    if bytes(data[:8]) == b"\x89PNG\r\n\x1a\n":
+        return _png_metadata(data)
+    return {}
+
+
+# Videos (ISO base media: MP4 / MOV)
+
+def _boxes(data: memoryview, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[bytes, memoryview]]:
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            break
+        yield bytes(kind), data[pos + header:pos + size]
+        pos += size
+
+
+def _ilst_value(item: memoryview) -> Optional[str]:
+    for kind, payload in _boxes(item):
+        # data box: type indicator (1 = UTF-8) and locale, then the value
+        if kind == b"data" and len(payload) >= 8 and struct.unpack_from(">I", payload, 0)[0] in (1, 2):
+            return _text(bytes(payload[8:]))
+    return None
+
+
+def _meta_tags(meta: memoryview, tags: Dict[str, str]):
+    # ISO meta is a full box (version and flags first), QuickTime's is not
+    start = 0 if bytes(meta[4:8]) == b"hdlr" else 4
+    keys = []
+    for kind, payload in _boxes(meta, start):
+        if kind == b"keys":
+            # Every entry takes at least 8 bytes, whatever count the file claims
+            count = min(struct.unpack_from(">I", payload, 4)[0], len(payload) // 8)
+            pos = 8
+            for _ in range(count):
+                if pos + 8 > len(payload):
+                    break
+                size = struct.unpack_from(">I", payload, pos)[0]
+                if size < 8 or pos + size > len(payload):
+                    break
+                keys.append(bytes(payload[pos + 8:pos + size]).decode("utf-8", errors="replace"))
+                pos += size
+        elif kind == b"ilst":
+            for item_kind, item in _boxes(payload):
+                if item_kind in _MP4_TAGS:
+                    name = _MP4_TAGS[item_kind]
+                else:
+                    # Items of QuickTime mdta metadata are numbered into the keys box
+                    index = struct.unpack(">I", item_kind)[0] - 1
+                    name = _MDTA_TAGS.get(keys[index]) if 0 <= index < len(keys) else None
+                value = _ilst_value(item) if name else None
+                if value:
+                    tags.setdefault(name, value)
+
+
+def _walk_moov(data: memoryview, container: Dict[str, Any], tags: Dict[str, str], track: Dict[str, Any],
+               depth: int = 0):
+    if depth > MAX_BOX_DEPTH:
+        raise ValueError("moov boxes nested too deeply")
+    for kind, payload in _boxes(data):
+        if kind in _ISO_CONTAINERS:
+            if kind == b"trak":
+                track = {}
+                _walk_moov(payload, container, tags, track, depth + 1)
+                container.setdefault("tracks", []).append(track)
+                track = {}
+            else:
+                _walk_moov(payload, container, tags, track, depth + 1)
+        elif kind == b"mvhd":
+            if payload[0] == 1:
+                timescale, duration = struct.unpack_from(">IQ", payload, 20)
+            else:
+                timescale, duration = struct.unpack_from(">II", payload, 12)
+            if timescale:
+                container["duration"] = duration / timescale
+        elif kind == b"hdlr":
+            track.setdefault("type", {"vide": "video", "soun": "audio"}.get(
+                bytes(payload[8:12]).decode("latin-1"), bytes(payload[8:12]).decode("latin-1")
+            ))
+        elif kind == b"stsd" and len(payload) >= 16:
+            entry_format = bytes(payload[12:16]).decode("latin-1")
+            track["format"] = entry_format
+            track["codec"] = CODEC_NAMES.get(entry_format, entry_format.strip())
+            entry = payload[8:]
+            if len(entry) >= 82 and track.get("type") == "video":
+                track["width"], track["height"] = struct.unpack_from(">HH", entry, 32)
+                # Visual sample entries carry a 32-byte Pascal string naming the compressor
+                name_length = min(entry[50], 31)
+                compressor = _text(bytes(entry[51:51 + name_length]))
+                if compressor:
+                    track["compressor"] = compressor
+        elif kind == b"meta":
+            _meta_tags(payload, tags)
+        elif kind in _MP4_TAGS and len(payload) >= 4:
+            # QuickTime udta text atom: 16-bit length and language, then the text
+            if bytes(payload[8:12]) == b"data":
+                value = _ilst_value(payload)
+            else:
+                length = struct.unpack_from(">H", payload, 0)[0]
+                value = _text(bytes(payload[4:4 + length]))
+            if value:
+                tags.setdefault(_MP4_TAGS[kind], value)
+
+
+def _find_moov(f, file_size: int) -> Tuple[Optional[str], Optional[bytes]]:
+    """Major brand and moov payload, seeking over mdat wherever it is"""
+    brand = None
+    pos = 0
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        header = f.read(16)
+        if len(header) < 8:
+            break
+        size, kind = struct.unpack_from(">I4s", header, 0)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", header, 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = file_size - pos
+        if size < header_size:
+            break
+
+        if kind == b"ftyp":
+            brand = header[8:12].decode("latin-1").strip()
+        elif kind == b"moov":
+            if size > MAX_MOOV_SIZE:
+                return brand, None
+            f.seek(pos + header_size)
+            return brand, f.read(size - header_size)
+        pos += size
+    return brand, None
+
+
+def parse_video_container(path: str) -> Dict[str, Any]:
+    """Codec, duration and encoder of an MP4/MOV from its moov box.
+
+    Only box headers are read until moov is found (whether it sits before
+    or after the media data), so no frame is ever decoded.  Returns an
+    empty dict for other containers.
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(12)
+            if head[4:8] not in (b"ftyp", b"moov", b"mdat", b"wide", b"free", b"skip"):
+                return {}
+            brand, moov = _find_moov(f, os.fstat(f.fileno()).st_size)
+    except OSError:
+        return {}
+
+    container: Dict[str, Any] = {"format": "MOV" if brand in (None, "qt") else "MP4"}
+    if brand:
+        container["brand"] = brand
+    if moov is None:
+        container["moov_found"] = False
+        return container
+
+    tags: Dict[str, str] = {}
+    try:
+        _walk_moov(memoryview(moov), container, tags, {})
+    except (struct.error, IndexError, ValueError):
+        container["malformed"] = True
+
+    for track in container.get("tracks", []):
+        if track.get("type") == "video" and "video_codec" not in container:
+            container["video_codec"] = track.get("codec")
+            if "width" in track:
+                container["resolution"] = f"{track['width']}x{track['height']}"
+            if "compressor" in track:
+                tags.setdefault("compressor", track["compressor"])
+        elif track.get("type") == "audio" and "audio_codec" not in container:
+            container["audio_codec"] = track.get("codec")
+    container.update(tags)
+    return container
+
+
+# Pre-screen
+
+def _match_generator(value: Any) -> Optional[str]:
+    if not isinstance(value, str):
+        return None
+    lowered = value.lower()
+    return next((tool for signature, tool in GENERATOR_SIGNATURES if signature in lowered), None)
+
+
+def detect_generator(metadata: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    """The generation tool plainly named by header metadata, if any.
+
+    Only fields that name the producing software are trusted (EXIF
+    Software, XMP CreatorTool, video encoder tags), plus the parameter
+    blocks generators write verbatim; free text such as descriptions,
+    which may merely mention a tool, is ignored.
+    """
+    exif = metadata.get("exif_data", {})
+    xmp = metadata.get("xmp", {})
+    text_chunks = metadata.get("text_chunks", {})
+    container = metadata.get("container", {})
+
+    source_type = xmp.get("digital_source_type", "")
+    if source_type.lower().rstrip("/").rsplit("/", 1)[-1] == AI_SOURCE_TYPE:
+        tool = _match_generator(xmp.get("creator_tool")) or xmp.get("creator_tool") or "Generative AI"
+        return {"tool": tool, "field": "xmp.digital_source_type"}
+
+    fields = (
+        ("exif.Software", exif.get("Software")),
+        ("xmp.creator_tool", xmp.get("creator_tool")),
+        ("png.Software", text_chunks.get("Software")),
+        ("png.Source", text_chunks.get("Source")),
+        ("container.encoder", container.get("encoder")),
+        ("container.software", container.get("software")),
+    )
+    for field, value in fields:
+        tool = _match_generator(value)
+        if tool:
+            return {"tool": tool, "field": field}
+
+    # AUTOMATIC1111-style parameter blocks (PNG text, or EXIF UserComment in JPEGs)
+    for field, value in (("png.parameters", text_chunks.get("parameters")),
+                         ("exif.UserComment", exif.get("UserComment"))):
+        if isinstance(value, str) and "Steps: " in value and "Sampler: " in value:
+            return {"tool": "Stable Diffusion", "field": field}
+
+    # ComfyUI embeds its node graph as JSON
+    if "prompt" in text_chunks and "workflow" in text_chunks:
+        try:
+            json.loads(text_chunks["prompt"])
+            return {"tool": "ComfyUI", "field": "png.prompt"}
+        except ValueError:
+            pass
+
+    for key, tool in GENERATOR_TEXT_KEYS:
+        if key in text_chunks:
+            return {"tool": tool, "field": f"png.{key}"}
+    return None
+
 
 class MetadataExtractor:
-    async def extract(self, file, content: bytes) -> Dict[str, Any]:
-        return {
+    async def extract(self, file, content: bytes, size: Optional[int] = None,
+                      path: Optional[str] = None) -> Dict[str, Any]:
+        """Header-only metadata of an upload; pixels are never decoded.
+
+        ``content`` may be just the leading bytes of the file when ``size``
+        is given.  Videos pass the spooled ``path`` so a moov box stored
+        after the media data can still be reached.
+        """
+        metadata = {
             "filename": file.filename,
             "content_type": file.content_type,
-            "size": len(content),
+            "size": size if size is not None else len(content),
             "upload_timestamp": datetime.utcnow().isoformat(),
             "exif_data": {},
             "camera_info": "Not available",
             "software_info": "Not available"
         }
+
+        if path is not None:
+            container = await asyncio.to_thread(parse_video_container, path)
+            if container:
+                metadata["container"] = container
+                software = container.get("encoder") or container.get("software")
+                camera = " ".join(filter(None, (container.get("make"), container.get("model"))))
+            else:
+                software = camera = None
+        else:
+            parsed = parse_image_metadata(content)
+            exif = parsed.get("exif", {})
+            metadata["exif_data"] = exif
+            metadata["container"] = {
+                key: parsed[key] for key in ("format", "width", "height", "malformed") if key in parsed
+            }
+            for key in ("xmp", "text_chunks", "comment"):
+                if key in parsed:
+                    metadata[key] = parsed[key]
+            software = exif.get("Software") or parsed.get("xmp", {}).get("creator_tool") \
+                or parsed.get("text_chunks", {}).get("Software")
+            camera = " ".join(str(exif[key]) for key in ("Make", "Model") if key in exif)
+
+        if camera:
+            metadata["camera_info"] = camera
+        if software:
+            metadata["software_info"] = software
+        metadata["generator"] = detect_generator(metadata)
+        return metadata
@@ -0,0 +1,326 @@
+import asyncio
+import hashlib
+import io
+import mimetypes
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import zipfile
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+CHUNK_SIZE = 1024 * 1024  # 1MB
+
+# Extensions grouped by the analysis path they take
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov")
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+class UploadRejected(Exception):
+    """Raised when an upload fails validation while it is being read"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class ArchiveTooLarge(UploadRejected):
+    """Raised once more than the size limit is read from, or extracted from, one archive"""
+
+    def __init__(self, filename: str):
+        super().__init__(413, f"Archive '{filename}' is too large")
+
+
+def sniff_media_type(head: bytes) -> Optional[str]:
+    """Identify the container from its magic bytes, or None if unknown"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return "video/x-msvideo"
+    if head[4:8] == b"ftyp":
+        # ISO base media: QuickTime brands are MOV, everything else MP4
+        return "video/quicktime" if head[8:12] == b"qt  " else "video/mp4"
+    if head[4:8] in (b"moov", b"mdat", b"wide", b"free", b"skip"):
+        # Older QuickTime files without an ftyp box
+        return "video/quicktime"
+    return None
+
+
+class _BufferPool:
+    """Small pool of in-memory buffers reused across image uploads"""
+
+    def __init__(self, max_buffers: int = 8, max_retained_bytes: int = 16 * 1024 * 1024):
+        self.max_buffers = max_buffers
+        self.max_retained_bytes = max_retained_bytes
+        self._buffers: List[io.BytesIO] = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> io.BytesIO:
+        with self._lock:
+            buffer = self._buffers.pop() if self._buffers else io.BytesIO()
+        buffer.seek(0)
+        buffer.truncate()
+        return buffer
+
+    def release(self, buffer: io.BytesIO):
+        # Very large buffers are dropped so one big upload does not pin memory
+        if buffer.seek(0, io.SEEK_END) > self.max_retained_bytes:
+            return
+        buffer.seek(0)
+        buffer.truncate()
+        with self._lock:
+            if len(self._buffers) < self.max_buffers:
+                self._buffers.append(buffer)
+
+
+_buffer_pool = _BufferPool()
+
+
+class IngestedUpload:
+    """An upload that has been validated, hashed and spooled.
+
+    Images live in a pooled in-memory buffer, videos in a temporary file on
+    disk.  Call ``close()`` (or use it as a context manager) to return the
+    buffer to the pool and delete the temporary file.
+    """
+
+    def __init__(self, filename: str, media_type: str, head: bytes, size: int, sha256: str,
+                 buffer: Optional[io.BytesIO] = None, path: Optional[str] = None):
+        self.filename = filename
+        self.media_type = media_type
+        self.head = head
+        self.size = size
+        self.sha256 = sha256
+        self.buffer = buffer
+        self.path = path
+
+    @property
+    def is_video(self) -> bool:
+        return self.media_type.startswith("video")
+
+    def read(self) -> bytes:
+        """Full content as bytes (reads the spooled file for videos)"""
+        if self.buffer is not None:
+            return self.buffer.getvalue()
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def close(self):
+        if self.buffer is not None:
+            _buffer_pool.release(self.buffer)
+            self.buffer = None
+        if self.path is not None and os.path.exists(self.path):
+            os.unlink(self.path)
+            self.path = None
+
+    def __enter__(self) -> "IngestedUpload":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+async def ingest_upload(file, max_size: int, allowed_extensions, chunk_size: int = CHUNK_SIZE) -> IngestedUpload:
+    """Read an UploadFile in chunks, validating it as early as possible.
+
+    The extension is checked before any data is read, the magic bytes after
+    the first chunk, and the size limit after every chunk.  Content is
+    hashed while it streams; videos are spooled straight to disk and images
+    into a reusable in-memory buffer.
+    """
+    filename = file.filename or ""
+    extension = os.path.splitext(filename.lower())[1]
+    if extension not in allowed_extensions:
+        raise UploadRejected(400, "File type not supported")
+
+    declared_size = getattr(file, "size", None)
+    if declared_size is not None and declared_size > max_size:
+        raise UploadRejected(413, "File too large")
+
+    first = await file.read(chunk_size)
+    media_type = sniff_media_type(first[:16])
+    if media_type is None:
+        raise UploadRejected(400, "File content does not match a supported media type")
+
+    is_video = media_type.startswith("video")
+    if is_video != (extension in VIDEO_EXTENSIONS):
+        raise UploadRejected(400, "File content does not match its extension")
+
+    digest = hashlib.sha256()
+    buffer, path, sink = None, None, None
+    try:
+        if is_video:
+            sink = tempfile.NamedTemporaryFile(delete=False, suffix=extension)
+            path = sink.name
+        else:
+            buffer = sink = _buffer_pool.acquire()
+
+        size = 0
+        chunk = first
+        while chunk:
+            size += len(chunk)
+            if size > max_size:
+                raise UploadRejected(413, "File too large")
+            digest.update(chunk)
+            if is_video:
+                # A disk write can stall on I/O; the buffer write is a memcpy
+                await _write_in_thread(sink, chunk)
+            else:
+                sink.write(chunk)
+            chunk = await file.read(chunk_size)
+
+        if is_video:
+            sink.close()
+
+        return IngestedUpload(filename, media_type, first[:64 * 1024], size, digest.hexdigest(),
+                              buffer=buffer, path=path)
+
+    except BaseException:
+        if is_video and sink is not None:
+            sink.close()
+            if os.path.exists(path):
+                os.unlink(path)
+        elif buffer is not None:
+            _buffer_pool.release(buffer)
+        raise
+
+
+async def _write_in_thread(sink, chunk: bytes):
+    writing = asyncio.ensure_future(asyncio.to_thread(sink.write, chunk))
+    try:
+        await asyncio.shield(writing)
+    except asyncio.CancelledError:
+        # The file is closed (and deleted) on the way out, not while the thread writes to it
+        await asyncio.wait([writing])
+        raise
+
+
+def spool_upload(upload: IngestedUpload, path: str):
+    """Persist an upload at ``path`` for a job worker and release it.
+
+    Videos are moved (their temporary file is already on disk), images are
+    written out from their buffer.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if upload.path is not None:
+        shutil.move(upload.path, path)
+        upload.path = None
+    else:
+        with open(path, "wb") as f:
+            f.write(upload.buffer.getbuffer())
+    upload.close()
+
+
+def is_archive(filename: Optional[str]) -> bool:
+    return (filename or "").lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+class ArchiveMember:
+    """One file inside an uploaded archive, readable like an ``UploadFile``"""
+
+    def __init__(self, filename: str, fileobj, size: Optional[int] = None):
+        self.filename = filename
+        self.content_type = mimetypes.guess_type(filename)[0]
+        self.size = size
+        self._fileobj = fileobj
+
+    async def read(self, size: int = -1) -> bytes:
+        # Decompression is CPU work, keep it off the event loop
+        return await asyncio.to_thread(self._fileobj.read, size)
+
+
+class _ArchiveBudget:
+    """Bytes one archive may still yield; wrapped file objects charge every read to it"""
+
+    def __init__(self, filename: str, limit: int):
+        self.filename = filename
+        self.remaining = limit
+
+    def wrap(self, fileobj) -> "_BudgetedFile":
+        return _BudgetedFile(fileobj, self)
+
+    def charge(self, count: int):
+        self.remaining -= count
+        if self.remaining < 0:
+            raise ArchiveTooLarge(self.filename)
+
+
+class _BudgetedFile:
+    def __init__(self, fileobj, budget: _ArchiveBudget):
+        self._fileobj = fileobj
+        self._budget = budget
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._fileobj.read(size)
+        self._budget.charge(len(data))
+        return data
+
+    def __getattr__(self, name):
+        # seek, tell and the rest, as zipfile needs them
+        return getattr(self._fileobj, name)
+
+
+def _skip_member(name: str) -> bool:
+    # Directory entries and resource forks added by archivers are not media
+    base = os.path.basename(name.rstrip("/"))
+    return name.endswith("/") or not base or base.startswith(".") or "__MACOSX/" in name
+
+
+def iter_archive_members(fileobj, filename: str) -> Iterator[Tuple[str, object, Optional[int]]]:
+    """Yield ``(name, fileobj, declared_size)`` for each regular file in a zip or tar.
+
+    Tar archives are read as a stream, so each member's file object is only
+    valid until the next one is requested.
+    """
+    if filename.lower().endswith(".zip"):
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or _skip_member(info.filename):
+                    continue
+                with archive.open(info) as member:
+                    yield info.filename, member, info.file_size
+    else:
+        with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+            for info in archive:
+                if not info.isfile() or _skip_member(info.name):
+                    continue
+                yield info.name, archive.extractfile(info), info.size
+
+
+async def iter_batch_sources(files, max_archive_size: int) -> AsyncIterator[object]:
+    """Expand a batch upload into the files to analyze, extracting archives as they stream.
+
+    Archive members are yielded as ``ArchiveMember`` objects, every other
+    upload as-is.  Broken archives raise ``UploadRejected``, and archives
+    that turn out larger than ``max_archive_size`` (counting the bytes
+    actually read, and separately the bytes extracted) ``ArchiveTooLarge``.
+    """
+    done = object()
+    for file in files:
+        if not is_archive(file.filename):
+            yield file
+            continue
+
+        if file.size is not None and file.size > max_archive_size:
+            raise ArchiveTooLarge(file.filename)
+
+        extracted = _ArchiveBudget(file.filename, max_archive_size)
+        members = iter_archive_members(_ArchiveBudget(file.filename, max_archive_size).wrap(file.file),
+                                       file.filename)
+        try:
+            while True:
+                try:
+                    entry = await asyncio.to_thread(next, members, done)
+                except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as e:
+                    raise UploadRejected(400, f"Archive '{file.filename}' could not be read: {e}")
+                if entry is done:
+                    break
+                name, member, size = entry
+                yield ArchiveMember(name, extracted.wrap(member), size)
+        finally:
+            members.close()
@@ -1,57 +1,356 @@
+import asyncio
+import contextvars
+import functools
 import cv2
 import numpy as np
-from typing import List, Dict, Any
+from typing import AsyncIterator, Dict, Any, Iterator, List, Optional, Set
 
+from app.utils.metadata_extractor import parse_video_container
+from ml_models.tracing import span, traced
 
-class VideoProcessor:
-    async def extract_frames(self, video_path: str, max_frames: int = 10) -> List[np.ndarray]:
+SAMPLING_MODES = ("uniform", "stride", "time", "keyframe")
+# Score-driven sampling in rounds (see AdaptiveFrameSampler), served by read_frames
+ADAPTIVE_MODE = "adaptive"
+
+# Frames closer ahead than this are reached by decoding forward rather than seeking
+SEEK_DISTANCE = 48
+
+# Decoded frames within this of a keyframe packet's timestamp are that keyframe
+KEYFRAME_TOLERANCE_MS = 1.0
+
+# Two-sided 95% Student t quantiles by degrees of freedom (normal beyond)
+_T95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086)
+
+
+class VideoSource:
+    """One open capture handle that serves both metadata and sampled frames.
+
+    Frames are walked strictly in decode order with ``grab()`` and only the
+    sampled ones are ``retrieve()``d, so no seek ever forces the decoder back
+    to a previous keyframe.  ``read_frames`` serves random access for
+    adaptive sampling and seeks only across large gaps.
+
+    Async callers use ``async with``: decode steps run on worker threads
+    and keep running when their caller is cancelled, so ``aclose`` releases
+    the capture only once the last of them has returned.
+    """
+
+    def __init__(self, video_path: str):
+        self.video_path = video_path
+        self.cap = cv2.VideoCapture(video_path)
+        self._in_flight: Set[asyncio.Future] = set()
+
+    def __enter__(self) -> "VideoSource":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    async def __aenter__(self) -> "VideoSource":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    def close(self):
+        self.cap.release()
+
+    async def aclose(self):
+        """Release the capture after every decode step still running on a worker thread"""
+        if not self._in_flight:
+            self.close()
+            return
+        in_flight = asyncio.gather(*self._in_flight, return_exceptions=True)
+        try:
+            await asyncio.shield(in_flight)
+        finally:
+            if in_flight.done():
+                self.close()
+            else:
+                # Cancelled while waiting: the last decode step releases it
+                in_flight.add_done_callback(lambda _: self.close())
+
+    async def _in_thread(self, fn, *args):
+        """Run a decode step on a worker thread, tracked until it returns even if the caller is cancelled"""
+        call = functools.partial(contextvars.copy_context().run, fn, *args)
+        future = asyncio.get_running_loop().run_in_executor(None, call)
+        self._in_flight.add(future)
+        future.add_done_callback(self._in_flight.discard)
+        return await asyncio.shield(future)
+
+    def is_opened(self) -> bool:
+        return self.cap.isOpened()
+
+    def frame_count(self) -> int:
+        return int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT)) if self.is_opened() else 0
+
+    @traced("video.read_frames")
+    def read_frames(self, indices: List[int]) -> List[Any]:
+        """``(index, timestamp_ms, frame)`` for the given frame numbers, in ascending order.
+
+        Frames a short way ahead of the read position are reached with
+        ``grab()``; anything else costs a seek.  Frames that cannot be
+        decoded are left out.
+        """
         frames = []
-        cap = cv2.VideoCapture(video_path)
-        
-        if not cap.isOpened():
-            return frames
-        
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        if total_frames == 0:
-            return frames
-        
-        frame_interval = max(1, total_frames // max_frames)
-        
-        frame_count = 0
-        while len(frames) < max_frames:
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count * frame_interval)
-            ret, frame = cap.read()
-            if not ret:
-                break
-            frames.append(frame)
-            frame_count += 1
-        
-        cap.release()
+        position = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+        for index in sorted(set(indices)):
+            if not 0 <= index - position <= SEEK_DISTANCE:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+                position = index
+            ok = True
+            while ok and position <= index:
+                ok = self.cap.grab()
+                position += 1
+            if not ok:
+                continue
+            ret, frame = self.cap.retrieve()
+            if ret:
+                frames.append((index, self.cap.get(cv2.CAP_PROP_POS_MSEC), frame))
         return frames
-    
-    async def analyze_video_metadata(self, video_path: str) -> Dict[str, Any]:
-        cap = cv2.VideoCapture(video_path)
-        
-        if not cap.isOpened():
+
+    async def read_frames_async(self, indices: List[int]) -> List[Any]:
+        """Async version of ``read_frames`` that decodes off the event loop"""
+        return await self._in_thread(self.read_frames, indices)
+
+    def _fourcc(self) -> str:
+        code = int(self.cap.get(cv2.CAP_PROP_FOURCC))
+        fourcc = "".join(chr((code >> (8 * i)) & 0xFF) for i in range(4)).strip("\x00 ")
+        return fourcc.lower() if fourcc.isprintable() and fourcc else "unknown"
+
+    @traced("video.metadata")
+    def metadata(self, container: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Stream properties from the capture, with codec and encoder from the container header.
+
+        ``container`` is a ``parse_video_container`` result already at hand;
+        otherwise the header is parsed here.
+        """
+        if container is None:
+            container = parse_video_container(self.video_path)
+
+        if not self.is_opened():
             return {
                 "duration": 0,
                 "fps": 0,
                 "resolution": "0x0",
-                "codec": "unknown"
+                "codec": container.get("video_codec") or "unknown"
             }
-        
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         duration = frame_count / fps if fps > 0 else 0
-        
-        cap.release()
-        
-        return {
+
+        metadata = {
             "duration": duration,
             "fps": fps,
             "resolution": f"{width}x{height}",
             "frame_count": frame_count,
-            "codec": "unknown"
+            # Containers without a parsed header (AVI) fall back to the demuxer's FourCC
+            "codec": container.get("video_codec") or self._fourcc()
         }
+        for key in ("encoder", "audio_codec"):
+            if container.get(key):
+                metadata[key] = container[key]
+        return metadata
+
+    def frames(self, mode: str = "uniform", max_frames: int = 10, stride: int = 1,
+               interval_seconds: float = 1.0, timestamps: bool = False) -> Iterator[Any]:
+        """Yield sampled frames in decode order.
+
+        - ``uniform``: ``max_frames`` frames evenly spaced over the whole video
+        - ``stride``: every ``stride``-th frame
+        - ``time``: one frame every ``interval_seconds`` of presentation time
+        - ``keyframe``: only the frames stored as keyframes (see ``keyframe_times``)
+
+        With ``timestamps`` each item is a ``(timestamp_ms, frame)`` pair.
+        """
+        if mode not in SAMPLING_MODES:
+            raise ValueError(f"Unknown sampling mode '{mode}', expected one of {SAMPLING_MODES}")
+        if not self.is_opened() or max_frames <= 0:
+            return
+
+        total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if mode == "uniform":
+            if total_frames <= 0:
+                return
+            stride = max(1, total_frames // max_frames)
+        stride = max(1, stride)
+
+        next_time_ms = 0.0
+        interval_ms = max(0.0, interval_seconds) * 1000.0
+        keyframes = self.keyframe_times() if mode == "keyframe" else None
+        next_keyframe = 0
+        index = -1
+        yielded = 0
+
+        while yielded < max_frames and self.cap.grab():
+            index += 1
+
+            if mode in ("uniform", "stride"):
+                selected = index % stride == 0
+            elif mode == "time":
+                timestamp = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+                selected = timestamp >= next_time_ms
+                if selected:
+                    next_time_ms = timestamp + interval_ms
+            elif keyframes is None:
+                selected = self.cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME) > 0
+            else:
+                if next_keyframe == len(keyframes):
+                    break
+                timestamp = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+                while next_keyframe < len(keyframes) and keyframes[next_keyframe] < timestamp - KEYFRAME_TOLERANCE_MS:
+                    next_keyframe += 1
+                selected = (next_keyframe < len(keyframes)
+                            and keyframes[next_keyframe] <= timestamp + KEYFRAME_TOLERANCE_MS)
+
+            if not selected:
+                continue
+
+            ret, frame = self.cap.retrieve()
+            if not ret:
+                break
+            yielded += 1
+            yield (self.cap.get(cv2.CAP_PROP_POS_MSEC), frame) if timestamps else frame
+
+    @traced("video.keyframes")
+    def keyframe_times(self) -> Optional[List[float]]:
+        """Presentation times (ms) of the keyframes, in ascending order.
+
+        ``CAP_PROP_LRF_HAS_KEY_FRAME`` describes the last packet the demuxer
+        read, which runs ahead of the decoded frame by the decoder's delay, so
+        keyframes are found in a separate pass over the undecoded packets and
+        matched to decoded frames by timestamp.  None when the backend cannot
+        read raw packets.
+        """
+        raw = cv2.VideoCapture(self.video_path)
+        try:
+            if not raw.isOpened() or not raw.set(cv2.CAP_PROP_FORMAT, -1):
+                return None
+            times = []
+            while raw.grab():
+                if raw.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME) > 0:
+                    times.append(raw.get(cv2.CAP_PROP_POS_MSEC))
+            # Packets come in decode order, which B-frames take out of presentation order
+            return sorted(times)
+        finally:
+            raw.release()
+
+    async def stream(self, **sampling) -> AsyncIterator[Any]:
+        """Async version of ``frames`` that decodes off the event loop.
+
+        Each frame is handed to the consumer as soon as it is decoded, so
+        analysis of one frame overlaps with decoding of the next.
+        """
+        iterator = self.frames(**sampling)
+        done = object()
+        while True:
+            with span("video.decode_frame"):
+                frame = await self._in_thread(next, iterator, done)
+            if frame is done:
+                break
+            yield frame
+
+
+class AdaptiveFrameSampler:
+    """Chooses which frames to analyze next from the scores seen so far.
+
+    Sampling starts with ``initial_frames`` evenly spaced frames.  Each
+    later round picks the midpoints of the gaps between sampled frames with
+    the highest priority: the disagreement of the scores at both ends times
+    the gap's share of the video, plus a small coverage term so long
+    stretches are eventually visited even where scores agree.
+
+    ``stop_reason()`` tells when to stop: the 95% confidence interval of
+    every score mean is narrower than ``ci_half_width`` (``confidence``),
+    ``max_frames`` were analyzed, or no unsampled gap is left
+    (``exhausted``).  Time budgets are left to the caller.
+    """
+
+    SCORES = ("deepfake_probability", "ai_generated_probability")
+    # Priority of a gap where both ends agree, per unit of its length
+    COVERAGE_WEIGHT = 0.02
+
+    def __init__(self, total_frames: int, initial_frames: int = 5, max_frames: int = 32,
+                 batch_size: int = 5, ci_half_width: float = 0.05):
+        self.total_frames = max(0, total_frames)
+        self.initial_frames = max(2, initial_frames)
+        self.max_frames = max(self.initial_frames, max_frames)
+        self.batch_size = max(1, batch_size)
+        self.ci_half_width = ci_half_width
+        self.scores: Dict[int, Dict[str, float]] = {}
+        self._requested: set = set()
+
+    def initial(self) -> List[int]:
+        count = min(self.initial_frames, self.total_frames)
+        indices = [int((i + 0.5) * self.total_frames / count) for i in range(count)] if count else []
+        self._requested.update(indices)
+        return indices
+
+    def add(self, index: int, scores: Optional[Dict[str, float]]):
+        """Record the scores of an analyzed frame (None if it could not be decoded)"""
+        self._requested.add(index)
+        if scores is not None:
+            self.scores[index] = {name: float(scores.get(name, 0)) for name in self.SCORES}
+
+    def half_width(self) -> float:
+        """Largest 95% confidence half-width over the score means"""
+        n = len(self.scores)
+        if n < 2:
+            return float("inf")
+        values = np.array([[scores[name] for name in self.SCORES] for scores in self.scores.values()])
+        t = _T95[n - 2] if n - 2 < len(_T95) else 1.96
+        return float(t * values.std(axis=0, ddof=1).max() / np.sqrt(n))
+
+    def stop_reason(self) -> Optional[str]:
+        if len(self.scores) >= self.initial_frames and self.half_width() <= self.ci_half_width:
+            return "confidence"
+        if len(self._requested) >= self.max_frames:
+            return "max_frames"
+        if not self._gaps():
+            return "exhausted"
+        return None
+
+    def next_batch(self) -> List[int]:
+        count = min(self.batch_size, self.max_frames - len(self._requested))
+        gaps = sorted(self._gaps(), reverse=True)[:max(0, count)]
+        indices = [midpoint for _, midpoint in gaps]
+        self._requested.update(indices)
+        return indices
+
+    def _gaps(self) -> List[Any]:
+        """``(priority, midpoint)`` of every stretch with unsampled frames"""
+        if not self.total_frames:
+            return []
+        sampled = sorted(self._requested)
+        # The video's ends count as sampled with no scores of their own
+        bounds = [-1] + sampled + [self.total_frames]
+        gaps = []
+        for left, right in zip(bounds, bounds[1:]):
+            if right - left < 2:
+                continue
+            disagreement = 0.0
+            if left in self.scores and right in self.scores:
+                disagreement = max(abs(self.scores[left][name] - self.scores[right][name])
+                                   for name in self.SCORES)
+            share = (right - left) / self.total_frames
+            gaps.append(((disagreement + self.COVERAGE_WEIGHT) * share, (left + right) // 2))
+        return gaps
+
+
+class VideoProcessor:
+    @traced("video.open")
+    def open(self, video_path: str) -> VideoSource:
+        return VideoSource(video_path)
+
+    async def extract_frames(self, video_path: str, max_frames: int = 10,
+                             mode: str = "uniform", **sampling) -> List[np.ndarray]:
+        with self.open(video_path) as source:
+            return list(source.frames(mode=mode, max_frames=max_frames, **sampling))
+
+    async def analyze_video_metadata(self, video_path: str) -> Dict[str, Any]:
+        with self.open(video_path) as source:
+            return source.metadata()
@@ -0,0 +1,95 @@
+"""Benchmark the vectorized LBP engine against the original per-pixel loop.
+
+Usage (from the repository root):
+
+    python benchmarks/bench_lbp.py
+    python benchmarks/bench_lbp.py --sizes 128x128 1920x1080 --max-reference-pixels 70000
+
+The per-pixel reference is only run up to ``--max-reference-pixels``; above
+that the speedup is extrapolated from its measured per-pixel cost.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ml_models.lbp import local_binary_pattern
+
+DEFAULT_SIZES = ["64x64", "128x128", "256x256", "1920x1080", "4000x3000"]
+
+
+def reference_local_binary_pattern(image, points=8, radius=1):
+    """Original per-pixel implementation, kept for timing and equality checks"""
+    lbp = np.zeros_like(image)
+    for i in range(radius, image.shape[0]-radius):
+        for j in range(radius, image.shape[1]-radius):
+            center = image[i, j]
+            binary = ''
+            for p in range(points):
+                x = i + radius * np.cos(2 * np.pi * p / points)
+                y = j - radius * np.sin(2 * np.pi * p / points)
+                x, y = int(x), int(y)
+                binary += '1' if image[x, y] >= center else '0'
+            lbp[i, j] = int(binary, 2)
+    return lbp
+
+
+def _parse_size(size: str):
+    width, height = size.lower().split("x")
+    return int(height), int(width)
+
+
+def _best_of(fn, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, help="WIDTHxHEIGHT sizes")
+    parser.add_argument("--points", type=int, default=8)
+    parser.add_argument("--radius", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--max-reference-pixels", type=int, default=256 * 256)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    per_pixel_reference = None
+
+    print(f"{'size':>12} {'vectorized':>12} {'reference':>12} {'speedup':>10}  identical")
+    for size in args.sizes:
+        h, w = _parse_size(size)
+        gray = rng.integers(0, 256, size=(h, w), dtype=np.uint8)
+
+        vec_time = _best_of(lambda: local_binary_pattern(gray, args.points, args.radius), args.repeats)
+
+        if h * w <= args.max_reference_pixels:
+            start = time.perf_counter()
+            expected = reference_local_binary_pattern(gray, args.points, args.radius)
+            ref_time = time.perf_counter() - start
+            per_pixel_reference = ref_time / (h * w)
+            identical = str(np.array_equal(expected, local_binary_pattern(gray, args.points, args.radius)))
+            ref_label = f"{ref_time:11.3f}s"
+        elif per_pixel_reference is not None:
+            ref_time = per_pixel_reference * h * w
+            identical = "n/a"
+            ref_label = f"~{ref_time:10.1f}s"
+        else:
+            ref_time = None
+            identical = "n/a"
+            ref_label = f"{'skipped':>12}"
+
+        speedup = f"{ref_time / vec_time:9.0f}x" if ref_time else f"{'-':>10}"
+        print(f"{size:>12} {vec_time:11.4f}s {ref_label} {speedup}  {identical}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Benchmark the local entropy engines and check them against the original loop.
+
+Usage (from the repository root):
+
+    python benchmarks/bench_local_entropy.py
+    python benchmarks/bench_local_entropy.py --sizes 1920x1080 --bins 256 64 32
+
+For every size small enough to run the per-pixel reference, the maximum
+deviation is checked against ``ENTROPY_ABS_TOLERANCE`` (256 bins) or
+``quantization_error_bound(bins)`` (fewer bins); the script exits non-zero
+if any check fails.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ml_models.local_entropy import (
+    ENTROPY_ABS_TOLERANCE,
+    local_entropy,
+    quantization_error_bound,
+)
+
+DEFAULT_SIZES = ["64x64", "128x128", "1920x1080"]
+
+
+def reference_local_entropy(image, kernel_size=7):
+    """Original per-pixel implementation, kept for timing and accuracy checks"""
+    from scipy.stats import entropy
+
+    pad_size = kernel_size // 2
+    padded = np.pad(image, pad_size, mode='reflect')
+
+    entropy_map = np.zeros_like(image, dtype=np.float32)
+
+    for i in range(image.shape[0]):
+        for j in range(image.shape[1]):
+            window = padded[i:i+kernel_size, j:j+kernel_size]
+            hist, _ = np.histogram(window, bins=256, range=(0, 256))
+            prob = hist / hist.sum()
+            entropy_map[i, j] = entropy(prob[prob > 0])
+
+    return entropy_map
+
+
+def synthetic_gray(h: int, w: int, rng) -> np.ndarray:
+    """Smooth full-range gradients plus sensor-like noise"""
+    y, x = np.mgrid[0:h, 0:w]
+    base = 128 + 100 * np.sin(x / 60.0) * np.cos(y / 45.0)
+    return np.clip(base + rng.normal(0, 8, (h, w)), 0, 255).astype(np.uint8)
+
+
+def _parse_size(size: str):
+    width, height = size.lower().split("x")
+    return int(height), int(width)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, help="WIDTHxHEIGHT sizes")
+    parser.add_argument("--kernel-size", type=int, default=7)
+    parser.add_argument("--bins", nargs="+", type=int, default=[256, 64, 32])
+    parser.add_argument("--methods", nargs="+", default=["sliding", "integral"])
+    parser.add_argument("--max-reference-pixels", type=int, default=128 * 128)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    failures = 0
+
+    print(f"{'size':>12} {'bins':>5} {'method':>9} {'time':>10} {'reference':>10} {'max err':>10}  ok")
+    for size in args.sizes:
+        h, w = _parse_size(size)
+        gray = synthetic_gray(h, w, rng)
+
+        expected, ref_time = None, None
+        if h * w <= args.max_reference_pixels:
+            start = time.perf_counter()
+            expected = reference_local_entropy(gray, args.kernel_size)
+            ref_time = time.perf_counter() - start
+
+        for bins in args.bins:
+            for method in args.methods:
+                start = time.perf_counter()
+                result = local_entropy(gray, args.kernel_size, bins, method)
+                elapsed = time.perf_counter() - start
+
+                if expected is None:
+                    err_label, ok = f"{'-':>10}", "n/a"
+                else:
+                    # Quantized entropy may only fall below the reference, never above it
+                    diff = expected.astype(np.float64) - result
+                    bound = ENTROPY_ABS_TOLERANCE if bins == 256 else quantization_error_bound(bins)
+                    passed = diff.min() >= -ENTROPY_ABS_TOLERANCE and diff.max() <= bound + ENTROPY_ABS_TOLERANCE
+                    failures += not passed
+                    err_label, ok = f"{np.abs(diff).max():10.2e}", str(passed)
+
+                ref_label = f"{ref_time:9.2f}s" if ref_time is not None else f"{'-':>10}"
+                print(f"{size:>12} {bins:>5} {method:>9} {elapsed:9.4f}s {ref_label} {err_label}  {ok}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Benchmark full-resolution versus reduced-resolution image decode.
+
+Usage (from the repository root):
+
+    python benchmarks/bench_reduced_decode.py
+    python benchmarks/bench_reduced_decode.py --size 8000x6000 --max-sides 0 2048 1024 512
+
+A synthetic camera-sized JPEG and PNG are written once; every decode then
+runs in a fresh interpreter so its peak resident memory can be reported.
+A max side of 0 decodes at full resolution.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+def synthetic_photo(h: int, w: int) -> np.ndarray:
+    """Smooth colour gradients plus sensor-like noise"""
+    rng = np.random.default_rng(0)
+    y, x = np.ogrid[0:h, 0:w]
+    base = 128 + 100 * np.sin(x / 90.0) * np.cos(y / 70.0)
+    image = np.empty((h, w, 3), dtype=np.uint8)
+    for channel in range(3):
+        noise = rng.normal(0, 6, (h, w)).astype(np.float32)
+        image[:, :, channel] = np.clip(base + noise + 20 * channel, 0, 255)
+    return image
+
+
+def _peak_rss_mb() -> float:
+    """High-water resident set size of this process"""
+    try:
+        # Unlike ru_maxrss, VmHWM is not inherited from the parent across exec
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _child(path: str, max_side: int):
+    from app.services.detector_tasks import decode_image
+
+    with open(path, "rb") as f:
+        content = f.read()
+    baseline = _peak_rss_mb()
+    start = time.perf_counter()
+    image = decode_image(content, max_side or None)
+    elapsed = time.perf_counter() - start
+    print(f"{elapsed} {_peak_rss_mb() - baseline} {image.shape[1]}x{image.shape[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="8000x6000", help="WIDTHxHEIGHT of the synthetic photo")
+    parser.add_argument("--max-sides", nargs="+", type=int, default=[0, 2048, 1024, 512])
+    parser.add_argument("--child", nargs=2, metavar=("PATH", "MAX_SIDE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.child[0], int(args.child[1]))
+        return
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    photo = Image.fromarray(synthetic_photo(height, width))
+
+    with tempfile.TemporaryDirectory() as directory:
+        files = {}
+        for fmt, options in (("JPEG", {"quality": 90}), ("PNG", {"compress_level": 1})):
+            path = os.path.join(directory, f"photo.{fmt.lower()}")
+            photo.save(path, fmt, **options)
+            files[fmt] = path
+        del photo
+
+        print(f"{'format':>6} {'max side':>9} {'decoded':>11} {'time':>9} {'peak RSS':>10}")
+        for fmt, path in files.items():
+            for max_side in args.max_sides:
+                output = subprocess.run(
+                    [sys.executable, __file__, "--child", path, str(max_side)],
+                    check=True, capture_output=True, text=True
+                ).stdout.split()
+                elapsed, peak_mb, decoded = float(output[0]), float(output[1]), output[2]
+                label = str(max_side) if max_side else "native"
+                print(f"{fmt:>6} {label:>9} {decoded:>11} {elapsed:8.3f}s {peak_mb:8.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,445 @@
+"""Benchmark every detector feature method and end-to-end analysis on synthetic fixtures.
+
+Usage (from the repository root):
+
+    python benchmarks/bench_suite.py --output baseline.json
+    python benchmarks/bench_suite.py --sizes 256 1080p --modes rgb --output new.json --compare baseline.json
+    python benchmarks/bench_suite.py --input new.json --compare baseline.json
+
+Fixtures are generated deterministically: photo-like images at 256x256,
+1080p, 4K and 48 MP in RGB, RGBA and grayscale, and short MP4 clips.  Each
+fixture runs in a fresh interpreter.  The cases are the pixel-level private
+methods of ``DeepFakeDetector``, ``AIGeneratedDetector`` and
+``ImageForensicsAnalyzer``, each detector's public entry point, and
+``AnalysisService.analyze_media`` on the fixture encoded as PNG (and JPEG).
+
+Every case records the best and median wall time over ``--repeats`` runs,
+the peak resident memory of the last run (absolute and above the memory
+in use before it), and the peak traced allocations of one extra run
+(tracemalloc: Python objects and NumPy buffers, not OpenCV's).  Methods
+that take an ``AnalysisContext`` get a fresh one per run, so their times
+include the planes they derive; methods taking a grayscale plane get it
+precomputed.
+
+With ``--precision float32`` every case runs in the float32 precision
+mode (``ml_models.precision``); compare against a float64 run to see what
+it saves.
+
+With ``--compare BASELINE``, a case is a regression when its best time is
+more than ``--threshold`` (relative) and ``--min-delta`` seconds slower than
+the baseline, or when its peak allocations or resident growth exceed the
+baseline by ``--memory-threshold`` and 1 MB.  The script then exits non-zero.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bench_reduced_decode import _peak_rss_mb, synthetic_photo
+
+SIZES = {"256": (256, 256), "1080p": (1920, 1080), "4k": (3840, 2160), "48mp": (8000, 6000)}
+MODES = ("rgb", "rgba", "gray")
+# Name: (width, height, frames); 24 fps mp4v clips
+CLIPS = {"clip-360p": (640, 360, 48), "clip-720p": (1280, 720, 48)}
+
+# Settings for the service under benchmark: detector work stays in this
+# process (so it shows in RSS and allocations) and nothing is cached
+SERVICE_ENV = {
+    "RESULT_STORE_PATH": "",
+    "RESULT_CACHE_MEMORY_BYTES": "0",
+    "JOB_BROKER_URL": "memory://",
+    "JOB_LOCAL_WORKERS": "0",
+    "MODEL_WARMUP": "false",
+    "NEAR_DUPLICATE_ENABLED": "false"
+}
+
+# Fixed glibc mmap threshold: large buffers are returned to the OS when
+# freed instead of staying resident, so every case starts from the same RSS
+CHILD_ENV = dict(os.environ, MALLOC_MMAP_THRESHOLD_="131072")
+
+MB = 1024 * 1024
+
+
+# Fixtures
+
+def fixture_names(sizes: List[str], modes: List[str], clips: List[str]) -> List[str]:
+    return [f"{size}-{mode}" for size in sizes for mode in modes] + list(clips)
+
+
+def fixture_image(name: str) -> np.ndarray:
+    size, mode = name.split("-")
+    width, height = SIZES[size]
+    image = synthetic_photo(height, width)
+    if mode == "gray":
+        import cv2
+        return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    if mode == "rgba":
+        # Opaque in the middle, fading towards the left and right edges
+        x = np.linspace(-1.0, 1.0, width, dtype=np.float32)
+        alpha = np.clip(255 * (1.5 - np.abs(x) * 1.5), 0, 255).astype(np.uint8)
+        return np.dstack([image, np.broadcast_to(alpha, (height, width))])
+    return image
+
+
+def fixture_clip(name: str, directory: str) -> str:
+    import cv2
+
+    width, height, frames = CLIPS[name]
+    path = os.path.join(directory, f"{name}.mp4")
+    base = synthetic_photo(height, width + frames * 4)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 24.0, (width, height))
+    for index in range(frames):
+        # A slow pan across the synthetic scene
+        frame = np.ascontiguousarray(base[:, index * 4:index * 4 + width, ::-1])
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def encoded_fixtures(name: str, image: np.ndarray) -> Dict[str, bytes]:
+    from PIL import Image
+
+    encoded = {}
+    pil_image = Image.fromarray(image)
+    buffer = io.BytesIO()
+    pil_image.save(buffer, "PNG", compress_level=1)
+    encoded["png"] = buffer.getvalue()
+    if not name.endswith("-rgba"):
+        buffer = io.BytesIO()
+        pil_image.save(buffer, "JPEG", quality=90)
+        encoded["jpeg"] = buffer.getvalue()
+    return encoded
+
+
+# Cases
+
+def detector_cases(image: np.ndarray) -> Dict[str, Callable[[], Any]]:
+    from ml_models.ai_generated_detector import AIGeneratedDetector
+    from ml_models.analysis_context import AnalysisContext
+    from ml_models.deepfake_detector import DeepFakeDetector
+    from ml_models.image_forensics import ImageForensicsAnalyzer
+
+    deepfake = DeepFakeDetector()
+    ai = AIGeneratedDetector()
+    forensics = ImageForensicsAnalyzer(tile_grid=16)
+    gray = AnalysisContext(image).gray
+
+    def with_context(method):
+        return lambda: method(image, AnalysisContext(image))
+
+    def run_async(method):
+        return lambda: asyncio.run(method(image, AnalysisContext(image)))
+
+    return {
+        "deepfake.analyze_image": run_async(deepfake.analyze_image),
+        "deepfake._preprocess_image": with_context(deepfake._preprocess_image),
+        "deepfake._extract_deepfake_features": with_context(deepfake._extract_deepfake_features),
+        "deepfake._analyze_facial_consistency": with_context(deepfake._analyze_facial_consistency),
+        "deepfake._detect_blending_artifacts": with_context(deepfake._detect_blending_artifacts),
+        "deepfake._analyze_color_consistency": lambda: deepfake._analyze_color_consistency(image),
+        "deepfake._analyze_texture_patterns": with_context(deepfake._analyze_texture_patterns),
+        "deepfake._local_binary_pattern": lambda: deepfake._local_binary_pattern(
+            gray, deepfake.lbp_points, deepfake.lbp_radius, deepfake.lbp_method),
+        "ai.analyze_image": run_async(ai.analyze_image),
+        "ai._detect_gan_artifacts": with_context(ai._detect_gan_artifacts),
+        "ai._frequency_domain_analysis": with_context(ai._frequency_domain_analysis),
+        "ai._statistical_analysis": with_context(ai._statistical_analysis),
+        "ai._calculate_local_entropy": lambda: ai._calculate_local_entropy(
+            gray, ai.entropy_kernel_size, ai.entropy_bins),
+        "forensics.analyze": run_async(forensics.analyze),
+        "forensics._error_level_analysis": lambda: forensics._error_level_analysis(image),
+        "forensics._ela_error": lambda: forensics._ela_error(image),
+        "forensics._tile_analysis": lambda: forensics._tile_analysis(image),
+        "forensics._noise_consistency_analysis": with_context(forensics._noise_consistency_analysis),
+        "forensics._estimate_noise_level": lambda: forensics._estimate_noise_level(gray),
+        "forensics._cfa_artifact_analysis": lambda: forensics._cfa_artifact_analysis(image),
+        "forensics._compression_artifact_analysis": with_context(forensics._compression_artifact_analysis),
+        "forensics._detect_block_artifacts": lambda: forensics._detect_block_artifacts(gray),
+        "forensics._detect_ringing_artifacts": lambda: forensics._detect_ringing_artifacts(gray),
+    }
+
+
+def service_cases(uploads: Dict[str, Tuple[str, str]], executor: str) -> Tuple[Dict[str, Callable[[], Any]], Callable]:
+    """``analyze_media`` on every (filename, path) upload; returns the cases and a cleanup"""
+    os.environ.update(SERVICE_ENV, ANALYSIS_EXECUTOR=executor)
+    from app.services.analysis_service import AnalysisService
+    from app.utils.upload_ingest import IngestedUpload, sniff_media_type
+    import hashlib
+
+    service = AnalysisService()
+    loop = asyncio.new_event_loop()
+
+    def case(filename: str, path: str):
+        with open(path, "rb") as f:
+            content = f.read()
+        media_type = sniff_media_type(content[:64])
+        file = types.SimpleNamespace(filename=filename, content_type=media_type)
+        sha256 = hashlib.sha256(content).hexdigest()
+
+        def run():
+            if media_type.startswith("video"):
+                upload = IngestedUpload(filename, media_type, content[:65536], len(content), sha256, path=path)
+            else:
+                upload = IngestedUpload(filename, media_type, content[:65536], len(content), sha256,
+                                        buffer=io.BytesIO(content))
+            result = loop.run_until_complete(service.analyze_media(file, upload, media_type))
+            if "error" in result:
+                raise RuntimeError(result["error"])
+            return result
+        return run
+
+    def cleanup():
+        service.shutdown()
+        loop.close()
+
+    cases = {f"service.analyze_media[{kind}]": case(*upload) for kind, upload in uploads.items()}
+    return cases, cleanup
+
+
+# Measurement
+
+def _reset_peak_rss() -> bool:
+    """Reset VmHWM to the current RSS (Linux); False when unsupported"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _current_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def measure(fn: Callable[[], Any], repeats: int, warmup: bool = False) -> Dict[str, Any]:
+    if warmup:
+        fn()
+    times = []
+    for run in range(repeats):
+        if run == repeats - 1:
+            # Peak memory is taken from the last run alone
+            reset = _reset_peak_rss()
+            before = _current_rss_mb()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    peak_rss = _peak_rss_mb()
+    growth = peak_rss - before if reset else None
+
+    tracemalloc.start()
+    try:
+        fn()
+        alloc_peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "best_seconds": min(times),
+        "median_seconds": float(np.median(times)),
+        "runs": len(times),
+        "peak_rss_mb": round(peak_rss, 2),
+        "rss_growth_mb": None if growth is None else round(growth, 2),
+        "alloc_peak_mb": round(alloc_peak / MB, 2)
+    }
+
+
+def _child(fixture: str, repeats: int, only: Optional[str], executor: str, float_precision: str):
+    """Run every case of one fixture; prints one JSON object per line"""
+    from ml_models import precision
+
+    pattern = re.compile(only) if only else None
+    precision.set_precision(float_precision)
+    # Read by the service cases' settings
+    os.environ["ANALYSIS_PRECISION"] = float_precision
+
+    with tempfile.TemporaryDirectory() as directory:
+        if fixture in CLIPS:
+            cases: Dict[str, Callable[[], Any]] = {}
+            uploads = {"mp4": (f"{fixture}.mp4", fixture_clip(fixture, directory))}
+        else:
+            image = fixture_image(fixture)
+            cases = detector_cases(image)
+            uploads = {}
+            for kind, content in encoded_fixtures(fixture, image).items():
+                path = os.path.join(directory, f"{fixture}.{kind}")
+                with open(path, "wb") as f:
+                    f.write(content)
+                uploads[kind] = (os.path.basename(path), path)
+
+        cleanup = None
+        if pattern is None or pattern.search("service.analyze_media"):
+            service, cleanup = service_cases(uploads, executor)
+            cases.update(service)
+        try:
+            for name, fn in cases.items():
+                if pattern is not None and not pattern.search(name):
+                    continue
+                try:
+                    result = measure(fn, repeats, warmup=name.startswith("service."))
+                except Exception as e:
+                    result = {"error": f"{type(e).__name__}: {e}"}
+                print(json.dumps({"case": name, "fixture": fixture, **result}), flush=True)
+        finally:
+            if cleanup is not None:
+                cleanup()
+
+
+# Reporting
+
+def _metadata() -> Dict[str, Any]:
+    import cv2
+    import PIL
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count()
+    }
+
+
+def _format_seconds(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    if value < 1e-3:
+        return f"{value * 1e6:.0f}us"
+    if value < 1:
+        return f"{value * 1e3:.1f}ms"
+    return f"{value:.2f}s"
+
+
+def _print_result(result: Dict[str, Any]):
+    label = f"{result['case']:<48} {result['fixture']:<12}"
+    if "error" in result:
+        print(f"{label} error: {result['error']}")
+        return
+    print(f"{label} {_format_seconds(result['best_seconds']):>9} {_format_seconds(result['median_seconds']):>9}"
+          f" {result['alloc_peak_mb']:9.1f}MB {result['rss_growth_mb'] or 0:9.1f}MB")
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float,
+            min_delta: float, memory_threshold: float) -> List[Dict[str, Any]]:
+    """Regressions of ``current`` against ``baseline`` (both ``results`` mappings)"""
+    regressions = []
+    print(f"\n{'case':<48} {'fixture':<12} {'baseline':>9} {'current':>9} {'change':>8}")
+    for key, result in current.items():
+        base = baseline.get(key)
+        if base is None or "error" in base or "error" in result:
+            continue
+        change = result["best_seconds"] / base["best_seconds"] - 1 if base["best_seconds"] else 0.0
+        reasons = []
+        if change > threshold and result["best_seconds"] - base["best_seconds"] > min_delta:
+            reasons.append("time")
+        for metric in ("alloc_peak_mb", "rss_growth_mb"):
+            old, new = base.get(metric), result.get(metric)
+            if old is not None and new is not None and new - old > max(1.0, memory_threshold * old):
+                reasons.append(metric)
+        flag = f"  REGRESSION ({', '.join(reasons)})" if reasons else ""
+        print(f"{result['case']:<48} {result['fixture']:<12} {_format_seconds(base['best_seconds']):>9}"
+              f" {_format_seconds(result['best_seconds']):>9} {change:+7.1%}{flag}")
+        if reasons:
+            regressions.append({"key": key, "change": change, "reasons": reasons})
+
+    missing = sorted(set(baseline) - set(current))
+    if missing:
+        print(f"\n{len(missing)} baseline case(s) not run, e.g. {missing[0]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--clips", nargs="*", choices=list(CLIPS), default=list(CLIPS))
+    parser.add_argument("--only", help="regular expression selecting case names")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--executor", choices=("thread", "process"), default="thread",
+                        help="detector executor of the benchmarked service")
+    parser.add_argument("--precision", choices=("float64", "float32"), default="float64",
+                        help="floating-point precision of the detectors")
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    parser.add_argument("--input", help="load results from this JSON file instead of running")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against this results file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative slowdown flagged")
+    parser.add_argument("--min-delta", type=float, default=0.001, help="seconds of slowdown ignored")
+    parser.add_argument("--memory-threshold", type=float, default=0.20, help="relative memory growth flagged")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.child, max(1, args.repeats), args.only, args.executor, args.precision)
+        return
+
+    if args.input:
+        with open(args.input) as f:
+            report = json.load(f)
+    else:
+        report = {"meta": _metadata(), "settings": {"repeats": args.repeats, "executor": args.executor,
+                                                    "precision": args.precision},
+                  "results": {}}
+        print(f"{'case':<48} {'fixture':<12} {'best':>9} {'median':>9} {'alloc peak':>11} {'RSS growth':>11}")
+        for fixture in fixture_names(args.sizes, args.modes, args.clips):
+            command = [sys.executable, os.path.abspath(__file__), "--child", fixture,
+                       "--repeats", str(args.repeats), "--executor", args.executor,
+                       "--precision", args.precision]
+            if args.only:
+                command += ["--only", args.only]
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True, env=CHILD_ENV)
+            for line in process.stdout:
+                if not line.startswith("{"):
+                    continue  # detector start-up messages
+                result = json.loads(line)
+                report["results"][f"{result['case']}@{result['fixture']}"] = result
+                _print_result(result)
+            if process.wait() != 0:
+                print(f"{fixture}: benchmark process exited with {process.returncode}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report["results"], baseline["results"], args.threshold,
+                              args.min_delta, args.memory_threshold)
+        print(f"\n{len(regressions)} regression(s)")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,20 @@
 import numpy as np
 import cv2
-from typing import Dict, Any
+from typing import Dict, Any, List
 from PIL import Image
 
+from ml_models.analysis_context import AnalysisContext, FrameBatch
+from ml_models.local_entropy import local_entropy
+from ml_models import precision
+from ml_models.tracing import traced
+
 class AIGeneratedDetector:
-    def __init__(self):
+    # Spectral and entropy statistics hold up on a reduced image
+    needs_native_resolution = False
+    
+    def __init__(self, entropy_kernel_size: int = 7, entropy_bins: int = 256):
+        self.entropy_kernel_size = entropy_kernel_size
+        self.entropy_bins = entropy_bins
         self.setup_detector()
     
     def setup_detector(self):
@@ -12,13 +22,15 @@ class AIGeneratedDetector:
         # In production, load models like CLIP-based detectors or GAN-specific detectors
         print("AI Generation detector initialized")
     
-    async def analyze_image(self, image: np.ndarray) -> Dict[str, Any]:
+    async def analyze_image(self, image: np.ndarray, context: AnalysisContext = None) -> Dict[str, Any]:
         """Analyze image for AI generation indicators"""
         try:
+            context = AnalysisContext.ensure(image, context)
+            
             # Multiple detection strategies
-            gan_artifacts = self._detect_gan_artifacts(image)
-            frequency_analysis = self._frequency_domain_analysis(image)
-            statistical_analysis = self._statistical_analysis(image)
+            gan_artifacts = self._detect_gan_artifacts(image, context)
+            frequency_analysis = self._frequency_domain_analysis(image, context)
+            statistical_analysis = self._statistical_analysis(image, context)
             
             # Combine results
             ai_probability = self._combine_detection_scores(
@@ -48,44 +60,64 @@ class AIGeneratedDetector:
                 "error": str(e)
             }
     
-    def _detect_gan_artifacts(self, image: np.ndarray) -> float:
+    async def analyze_batch(self, frames: np.ndarray, batch: FrameBatch = None) -> List[Dict[str, Any]]:
+        """Analyze an N x H x W x C stack of frames; each result equals ``analyze_image`` on that frame.
+        
+        The spectra and entropy maps are computed over the whole stack.  The
+        DCT stays per frame, as OpenCV has no batched form and SciPy's would
+        not reproduce its values bit for bit; so do the channel deviations,
+        which are measured slower reduced over the stack.
+        """
+        batch = FrameBatch.ensure(frames, batch)
+        batch.prepare(type(self).__name__, [
+            lambda: batch.rfft_magnitude,
+            # Entropy maps for the whole stack in shared sliding passes
+            lambda: batch.get(self._entropy_key(), lambda: self._calculate_local_entropy(
+                batch.gray, self.entropy_kernel_size, self.entropy_bins
+            ))
+        ])
+        
+        return [await self.analyze_image(frame, context) for frame, context in batch]
+    
+    @traced("ai.gan_artifacts")
+    def _detect_gan_artifacts(self, image: np.ndarray, context: AnalysisContext = None) -> float:
         """Detect GAN-specific artifacts"""
         # Analyze for common GAN artifacts like:
         # - Repetitive patterns
         # - Asymmetric features
         # - Unnatural textures
         
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-        
         # Fourier analysis for repetitive patterns
-        f_transform = np.fft.fft2(gray)
-        f_shift = np.fft.fftshift(f_transform)
-        magnitude_spectrum = np.log(np.abs(f_shift) + 1)
-        
-        # Analyze symmetry in frequency domain
-        height, width = magnitude_spectrum.shape
+        half_spectrum = AnalysisContext.ensure(image, context).rfft_magnitude
+        height, width = image.shape[:2]
         center_y, center_x = height // 2, width // 2
         
-        # Check quadrant symmetry
-        q1 = magnitude_spectrum[center_y:, center_x:]
-        q2 = magnitude_spectrum[center_y:, :center_x]
-        q3 = magnitude_spectrum[:center_y, :center_x]
-        q4 = magnitude_spectrum[:center_y, center_x:]
+        # Quadrants of the centred spectrum, from the real-FFT half without
+        # shifting: its rows [0, H - cy) and columns [0, W - cx) are the
+        # centred bottom-right quadrant, and the spectrum of a real image
+        # mirrors as S[r, c] = S[-r, -c], so its columns [1, cx] read with
+        # rows negated are the left quadrants
+        right = half_spectrum[:, :width - center_x].sum(axis=1, dtype=np.float64)
+        left = half_spectrum[:, 1:center_x + 1].sum(axis=1, dtype=np.float64)
+        left = np.roll(left[::-1], 1)
+        bottom = height - center_y
+        q1 = right[:bottom].sum() / (bottom * (width - center_x))
+        q2 = left[:bottom].sum() / (bottom * center_x)
+        q3 = left[bottom:].sum() / (center_y * center_x)
+        q4 = right[bottom:].sum() / (center_y * (width - center_x))
+        mean = (right.sum() + left.sum()) / (height * width)
         
-        symmetry_score = (
-            np.abs(np.mean(q1) - np.mean(q2)) +
-            np.abs(np.mean(q3) - np.mean(q4))
-        ) / (2 * np.mean(magnitude_spectrum))
+        # Analyze symmetry in frequency domain
+        symmetry_score = (np.abs(q1 - q2) + np.abs(q3 - q4)) / (2 * mean)
         
         artifact_score = min(symmetry_score, 1.0)
         return float(artifact_score)
     
-    def _frequency_domain_analysis(self, image: np.ndarray) -> float:
+    @traced("ai.frequency_domain")
+    def _frequency_domain_analysis(self, image: np.ndarray, context: AnalysisContext = None) -> float:
         """Analyze frequency domain characteristics"""
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-        
         # Discrete Cosine Transform
-        dct = cv2.dct(np.float32(gray) / 255.0)
+        dct = AnalysisContext.ensure(image, context).dct
         
         # Analyze high-frequency components
         h, w = dct.shape
@@ -96,15 +128,18 @@ class AIGeneratedDetector:
         
         return float(high_freq_ratio)
     
-    def _statistical_analysis(self, image: np.ndarray) -> float:
+    @traced("ai.statistical")
+    def _statistical_analysis(self, image: np.ndarray, context: AnalysisContext = None) -> float:
         """Perform statistical analysis for AI detection"""
         # Analyze color distribution
-        color_std = np.std(image, axis=(0, 1))
+        color_std = precision.std(image, axis=(0, 1))
         color_consistency = np.mean(color_std) / 255.0
         
         # Analyze local entropy
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-        entropy = self._calculate_local_entropy(gray)
+        context = AnalysisContext.ensure(image, context)
+        entropy = context.get(self._entropy_key(), lambda: self._calculate_local_entropy(
+            context.gray, self.entropy_kernel_size, self.entropy_bins
+        ))
         
         # AI-generated images often have different entropy distributions
         entropy_std = np.std(entropy)
@@ -113,25 +148,13 @@ class AIGeneratedDetector:
         combined_score = (color_consistency + entropy_score) / 2
         return float(combined_score)
     
-    def _calculate_local_entropy(self, image, kernel_size=7):
+    def _entropy_key(self):
+        return ("local_entropy", self.entropy_kernel_size, self.entropy_bins)
+    
+    @traced("ai.local_entropy")
+    def _calculate_local_entropy(self, image, kernel_size=7, bins=256):
         """Calculate local entropy"""
-        from scipy.ndimage import uniform_filter
-        from scipy.stats import entropy
-        
-        # Pad image
-        pad_size = kernel_size // 2
-        padded = np.pad(image, pad_size, mode='reflect')
-        
-        entropy_map = np.zeros_like(image, dtype=np.float32)
-        
-        for i in range(image.shape[0]):
-            for j in range(image.shape[1]):
-                window = padded[i:i+kernel_size, j:j+kernel_size]
-                hist, _ = np.histogram(window, bins=256, range=(0, 256))
-                prob = hist / hist.sum()
-                entropy_map[i, j] = entropy(prob[prob > 0])
-        
-        return entropy_map
+        return local_entropy(image, kernel_size=kernel_size, bins=bins)
     
     def _combine_detection_scores(self, *scores) -> float:
         """Combine multiple detection scores"""
@@ -0,0 +1,244 @@
+import logging
+import numpy as np
+import cv2
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Tuple
+
+from ml_models.precision import cv_depth, float_dtype
+
+logger = logging.getLogger(__name__)
+
+
+def _key_lock(locks: Dict[Hashable, threading.Lock], key: Hashable) -> threading.Lock:
+    # dict.setdefault is atomic, so every thread gets the same lock for a key
+    return locks.setdefault(key, threading.Lock())
+
+
+class AnalysisContext:
+    """Per-image cache of derived representations shared by all detectors.
+
+    Each plane (grayscale, Laplacian, spectra, DCT, ...) is
+    computed on first use and reused by every later caller, in the
+    floating-point precision of ``ml_models.precision``.  Use it as a
+    context manager, or call ``release()``, to drop the cached planes once
+    the request is finished.  Detectors on different threads may share it:
+    a plane is computed by one of them while the others wait for it.
+    """
+
+    def __init__(self, image: np.ndarray):
+        self.image = image
+        self._cache: Dict[Hashable, Any] = {}
+        self._locks: Dict[Hashable, threading.Lock] = {}
+        self.computed = 0
+        self.reused = 0
+
+    @classmethod
+    def ensure(cls, image: np.ndarray, context: "AnalysisContext" = None) -> "AnalysisContext":
+        """Reuse ``context`` when given, otherwise start a private one for ``image``"""
+        return context if context is not None else cls(image)
+
+    def __enter__(self) -> "AnalysisContext":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+    def get(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Return the cached value for ``key``, computing it with ``factory`` once"""
+        try:
+            value = self._cache[key]
+        except KeyError:
+            with _key_lock(self._locks, key):
+                if key not in self._cache:
+                    value = self._cache[key] = factory()
+                    self.computed += 1
+                    return value
+            value = self._cache[key]
+        self.reused += 1
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        """Store a plane computed elsewhere (e.g. for a whole batch of frames)"""
+        if key not in self._cache:
+            self.computed += 1
+        self._cache[key] = value
+
+    def release(self):
+        """Free every cached plane"""
+        self._cache.clear()
+        self._locks.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "derived_planes_computed": self.computed,
+            "recomputations_avoided": self.reused
+        }
+
+    @property
+    def gray(self) -> np.ndarray:
+        """8-bit grayscale view of the image"""
+        return self.get("gray", self._compute_gray)
+
+    @property
+    def gray_float32(self) -> np.ndarray:
+        return self.get("gray_float32", lambda: np.float32(self.gray))
+
+    @property
+    def laplacian(self) -> np.ndarray:
+        """Laplacian of the grayscale plane (exact in either precision)"""
+        return self.get("laplacian", lambda: cv2.Laplacian(self.gray, cv_depth()))
+
+    @property
+    def rfft_magnitude(self) -> np.ndarray:
+        """Log-magnitude real-FFT spectrum of the grayscale plane.
+
+        Only the non-negative column frequencies (``W // 2 + 1`` columns) and
+        not shifted: the rest of the spectrum of a real image mirrors them.
+        """
+        return self.get("rfft_magnitude", self._compute_rfft_magnitude)
+
+    @property
+    def dct(self) -> np.ndarray:
+        """DCT of the grayscale plane scaled to [0, 1]"""
+        return self.get("dct", lambda: cv2.dct(self.gray_float32 / 255.0))
+
+    def resized(self, size: Tuple[int, int]) -> np.ndarray:
+        """Image resized to ``size`` (width, height)"""
+        return self.get(("resized", size), lambda: cv2.resize(self.image, size))
+
+    def _compute_gray(self) -> np.ndarray:
+        if self.image.ndim == 2:
+            return self.image
+        return cv2.cvtColor(self.image, cv2.COLOR_RGB2GRAY)
+
+    def _compute_rfft_magnitude(self) -> np.ndarray:
+        return _rfft_log_magnitude(self.gray)
+
+
+class FrameBatch:
+    """Per-frame ``AnalysisContext``s for an ``N x H x W [x C]`` stack of frames.
+
+    Planes that vectorize over the batch axis are computed once for the
+    whole stack and stored into every frame's context as a view, so the
+    per-frame detector code picks them up unchanged.  Each batched plane is
+    bit-identical to the one the frame's context would compute on its own.
+    """
+
+    # Pixels per pass of a stacked computation: runs of small frames share
+    # one pass, while large frames go one at a time so the temporaries stay
+    # cache-sized (a whole stack of them measured slower than a loop)
+    PASS_PIXELS = 1 << 20
+
+    def __init__(self, frames: np.ndarray):
+        self.frames = frames
+        self.contexts: List[AnalysisContext] = [AnalysisContext(frame) for frame in frames]
+        self._stacks: Dict[Hashable, np.ndarray] = {}
+        self._locks: Dict[Hashable, threading.Lock] = {}
+
+    @classmethod
+    def ensure(cls, frames: np.ndarray, batch: "FrameBatch" = None) -> "FrameBatch":
+        return batch if batch is not None else cls(frames)
+
+    def __len__(self) -> int:
+        return len(self.contexts)
+
+    def __iter__(self) -> Iterator[Tuple[np.ndarray, AnalysisContext]]:
+        return zip(self.frames, self.contexts)
+
+    def __enter__(self) -> "FrameBatch":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+    def get(self, key: Hashable, factory: Callable[[], np.ndarray]) -> np.ndarray:
+        """Stacked plane for ``key``; computed once and shared with every frame context"""
+        stack = self._stacks.get(key)
+        if stack is None:
+            with _key_lock(self._locks, key):
+                stack = self._stacks.get(key)
+                if stack is None:
+                    stack = factory()
+                    for index, context in enumerate(self.contexts):
+                        context.put(key, stack[index])
+                    # Published last, so no other thread sees it before the frame contexts do
+                    self._stacks[key] = stack
+        return stack
+
+    def in_passes(self, fn: Callable[[np.ndarray], np.ndarray], stack: np.ndarray) -> np.ndarray:
+        """``fn`` over runs of at most ``PASS_PIXELS`` of ``stack``, concatenated"""
+        step = max(1, self.PASS_PIXELS // max(1, stack.shape[1] * stack.shape[2]))
+        if step >= len(stack):
+            return fn(stack)
+        return np.concatenate([fn(stack[start:start + step]) for start in range(0, len(stack), step)])
+
+    def prepare(self, owner: str, planes: List[Callable[[], np.ndarray]]):
+        """Compute stacked planes ahead of the per-frame analysis.
+
+        Each of ``planes`` fetches one (``lambda: batch.get(key, factory)``).
+        One that fails is logged and left to the frames, each of which then
+        computes it (and reports its error) on its own.
+        """
+        for plane in planes:
+            try:
+                plane()
+            except Exception:
+                logger.exception("%s: a batched plane failed, the frames compute it one by one", owner)
+
+    def release(self):
+        self._stacks.clear()
+        self._locks.clear()
+        for context in self.contexts:
+            context.release()
+
+    def stats(self) -> Dict[str, int]:
+        totals = {"derived_planes_computed": 0, "recomputations_avoided": 0}
+        for context in self.contexts:
+            for key, value in context.stats().items():
+                totals[key] += value
+        return totals
+
+    @property
+    def gray(self) -> np.ndarray:
+        return self.get("gray", self._compute_gray)
+
+    @property
+    def laplacian(self) -> np.ndarray:
+        return self.get("laplacian", self._compute_laplacian)
+
+    @property
+    def rfft_magnitude(self) -> np.ndarray:
+        return self.get("rfft_magnitude", self._compute_rfft_magnitude)
+
+    def _compute_laplacian(self) -> np.ndarray:
+        return self.in_passes(_stacked_laplacian, self.gray)
+
+    def _compute_rfft_magnitude(self) -> np.ndarray:
+        return self.in_passes(_rfft_log_magnitude, self.gray)
+
+    def _compute_gray(self) -> np.ndarray:
+        if self.frames.ndim == 3:
+            return self.frames
+        gray = np.empty(self.frames.shape[:3], dtype=self.frames.dtype)
+        for index, frame in enumerate(self.frames):
+            cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY, dst=gray[index])
+        return gray
+
+
+def _stacked_laplacian(gray: np.ndarray) -> np.ndarray:
+    # One Laplacian over the frames stacked into a tall image, each framed by
+    # its reflected edge rows, so every frame sees the border it would on its
+    # own (BORDER_REFLECT_101)
+    n, h, w = gray.shape
+    padded = np.pad(gray, ((0, 0), (1, 1), (0, 0)), mode="reflect")
+    laplacian = cv2.Laplacian(padded.reshape(n * (h + 2), w), cv_depth())
+    return laplacian.reshape(n, h + 2, w)[:, 1:-1]
+
+
+def _rfft_log_magnitude(gray: np.ndarray) -> np.ndarray:
+    # Imported on first use: only spectral detectors need scipy, and it is slow to import
+    import scipy.fft
+    # rfft2 transforms the last two axes, so a stack of frames frame by frame;
+    # scipy keeps float32 input in complex64, where numpy would upcast
+    magnitude = np.abs(scipy.fft.rfft2(gray.astype(float_dtype())))
+    return np.log1p(magnitude, out=magnitude)
@@ -1,42 +1,76 @@
+import functools
 import numpy as np
 import cv2
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Sequence
 import os
 
+from ml_models.analysis_context import AnalysisContext, FrameBatch
+from ml_models.lbp import local_binary_pattern
+from ml_models.model_registry import LoadedModel, ModelRegistry
+from ml_models import precision
+from ml_models.tracing import traced
+
+# Share of the CNN score in the prediction when a model is loaded
+CNN_WEIGHT = 0.6
+
 class DeepFakeDetector:
-    def __init__(self, model_path: str = None):
-        self.model = None
+    # Edge, texture and colour statistics hold up on a reduced image
+    needs_native_resolution = False
+    
+    def __init__(self, model_path: str = None, lbp_points: int = 8, lbp_radius: int = 1,
+                 lbp_method: str = "default", registry: Optional[ModelRegistry] = None,
+                 model_names: Sequence[str] = ()):
         self.input_size = (256, 256)
+        self.lbp_points = lbp_points
+        self.lbp_radius = lbp_radius
+        self.lbp_method = lbp_method
+        # CNNs in the shared registry whose scores are blended into the prediction
+        self.registry = registry if registry is not None else ModelRegistry()
+        self.model_names = tuple(model_names)
         self.load_model(model_path)
     
     def load_model(self, model_path: str):
-        """Load pre-trained deepfake detection model"""
-        pass
+        """Register a pre-trained deepfake detection model; it is loaded on first use"""
+        if model_path:
+            self.registry.register("deepfake", model_path, self.input_size)
+            self.model_names += ("deepfake",)
+    
+    @property
+    def models(self) -> List[LoadedModel]:
+        """The registered models that are available in this process"""
+        models = (self.registry.get(name) for name in self.model_names)
+        return [model for model in models if model is not None]
     
     def _create_dummy_model(self):
         """Create dummy model for demonstration"""
         pass
     
-    async def analyze_image(self, image: np.ndarray) -> Dict[str, Any]:
+    async def analyze_image(self, image: np.ndarray, context: AnalysisContext = None) -> Dict[str, Any]:
         """Analyze image for deepfake indicators"""
         try:
-            # Preprocess image
-            processed = self._preprocess_image(image)
+            context = AnalysisContext.ensure(image, context)
             
             # Extract features for analysis
-            features = self._extract_deepfake_features(image)
+            features = self._extract_deepfake_features(image, context)
             
-            # Make prediction (using dummy logic for demonstration)
+            # Heuristic prediction, blended with the CNN scores when models are loaded
             prediction = self._predict_deepfake(features)
             confidence = self._calculate_confidence(features)
+            model_scores = self._model_scores(image, context)
+            if model_scores:
+                cnn_score = float(np.mean(list(model_scores.values())))
+                prediction = CNN_WEIGHT * cnn_score + (1.0 - CNN_WEIGHT) * prediction
             
-            return {
+            result = {
                 "is_authentic": prediction < 0.5,
                 "probability": float(prediction),
                 "confidence": float(confidence),
                 "features_analyzed": list(features.keys()),
                 "analysis_method": "CNN-based deepfake detection"
             }
+            if model_scores:
+                result["model_scores"] = model_scores
+            return result
             
         except Exception as e:
             return {
@@ -46,29 +80,70 @@ class DeepFakeDetector:
                 "error": str(e)
             }
     
-    def _preprocess_image(self, image: np.ndarray) -> np.ndarray:
+    async def analyze_batch(self, frames: np.ndarray, batch: FrameBatch = None) -> List[Dict[str, Any]]:
+        """Analyze an N x H x W x C stack of frames; each result equals ``analyze_image`` on that frame.
+        
+        The Laplacian, the texture codes and the CNN scores are computed over
+        the whole stack.  Edges and the variances stay per frame: reductions
+        over the stack are memory-bound and measured slower than frame by
+        frame.
+        """
+        batch = FrameBatch.ensure(frames, batch)
+        planes = [
+            lambda: batch.laplacian,
+            # Texture codes for runs of frames in shared vectorized passes
+            lambda: batch.get(self._lbp_key(), lambda: batch.in_passes(lambda gray: self._local_binary_pattern(
+                gray, self.lbp_points, self.lbp_radius, self.lbp_method
+            ), batch.gray))
+        ]
+        # One inference call per model for the whole stack
+        planes += [functools.partial(self._batch_model_scores, model, batch) for model in self.models]
+        batch.prepare(type(self).__name__, planes)
+        
+        return [await self.analyze_image(frame, context) for frame, context in batch]
+    
+    def _batch_model_scores(self, model: LoadedModel, batch: FrameBatch) -> np.ndarray:
+        return batch.get(("cnn", model.name), lambda: model.predict(np.concatenate([
+            self._preprocess_image(frame, context, model.input_size) for frame, context in batch
+        ])))
+    
+    @traced("deepfake.cnn")
+    def _model_scores(self, image: np.ndarray, context: AnalysisContext) -> Dict[str, float]:
+        """Fake probability from every available CNN"""
+        scores = {}
+        for model in self.models:
+            score = context.get(("cnn", model.name), lambda: model.predict(
+                self._preprocess_image(image, context, model.input_size)
+            )[0])
+            scores[model.name] = float(score)
+        return scores
+    
+    def _preprocess_image(self, image: np.ndarray, context: AnalysisContext = None,
+                          size=None) -> np.ndarray:
         """Preprocess image for model input"""
         # Resize
-        image = cv2.resize(image, self.input_size)
+        image = AnalysisContext.ensure(image, context).resized(tuple(size or self.input_size))
         # Normalize
         image = image.astype(np.float32) / 255.0
         # Expand dimensions for batch
         image = np.expand_dims(image, axis=0)
         return image
     
-    def _extract_deepfake_features(self, image: np.ndarray) -> Dict[str, float]:
+    def _extract_deepfake_features(self, image: np.ndarray, context: AnalysisContext = None) -> Dict[str, float]:
         """Extract features indicative of deepfakes"""
+        context = AnalysisContext.ensure(image, context)
+        
         # Analyze facial features consistency
-        face_consistency = self._analyze_facial_consistency(image)
+        face_consistency = self._analyze_facial_consistency(image, context)
         
         # Analyze blending artifacts
-        blending_artifacts = self._detect_blending_artifacts(image)
+        blending_artifacts = self._detect_blending_artifacts(image, context)
         
         # Analyze color consistency
         color_consistency = self._analyze_color_consistency(image)
         
         # Analyze texture patterns
-        texture_analysis = self._analyze_texture_patterns(image)
+        texture_analysis = self._analyze_texture_patterns(image, context)
         
         return {
             "face_consistency": face_consistency,
@@ -77,12 +152,13 @@ class DeepFakeDetector:
             "texture_anomalies": texture_analysis
         }
     
-    def _analyze_facial_consistency(self, image: np.ndarray) -> float:
+    @traced("deepfake.edge_consistency")
+    def _analyze_facial_consistency(self, image: np.ndarray, context: AnalysisContext = None) -> float:
         """Analyze consistency in facial features"""
         # Implementation using facial landmarks and symmetry analysis
         try:
             # Convert to grayscale
-            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            gray = AnalysisContext.ensure(image, context).gray
             
             # Simple edge-based consistency measure
             edges = cv2.Canny(gray, 100, 200)
@@ -92,51 +168,48 @@ class DeepFakeDetector:
         except:
             return 0.5
     
-    def _detect_blending_artifacts(self, image: np.ndarray) -> float:
+    @traced("deepfake.blending_artifacts")
+    def _detect_blending_artifacts(self, image: np.ndarray, context: AnalysisContext = None) -> float:
         """Detect image blending artifacts"""
         # Analyze high-frequency components
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-        laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
+        laplacian_var = AnalysisContext.ensure(image, context).laplacian.var()
         
         # Normalize to 0-1 range
         artifact_score = min(laplacian_var / 1000.0, 1.0)
         return float(artifact_score)
     
+    @traced("deepfake.color_consistency")
     def _analyze_color_consistency(self, image: np.ndarray) -> float:
         """Analyze color consistency across the image"""
         # Calculate color variance across channels
-        channel_variances = [np.var(image[:, :, i]) for i in range(3)]
+        channel_variances = [precision.variance(image[:, :, i]) for i in range(3)]
         avg_variance = np.mean(channel_variances)
         
         # Normalize
         consistency = 1.0 - min(avg_variance / 10000.0, 1.0)
         return float(consistency)
     
-    def _analyze_texture_patterns(self, image: np.ndarray) -> float:
+    @traced("deepfake.texture_patterns")
+    def _analyze_texture_patterns(self, image: np.ndarray, context: AnalysisContext = None) -> float:
         """Analyze texture patterns for anomalies"""
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        context = AnalysisContext.ensure(image, context)
         
         # Calculate LBP (Local Binary Patterns) variance
-        lbp = self._local_binary_pattern(gray)
-        lbp_variance = np.var(lbp)
+        lbp = context.get(self._lbp_key(), lambda: self._local_binary_pattern(
+            context.gray, self.lbp_points, self.lbp_radius, self.lbp_method
+        ))
+        lbp_variance = precision.variance(lbp)
         
         anomaly_score = min(lbp_variance / 1000.0, 1.0)
         return float(anomaly_score)
     
-    def _local_binary_pattern(self, image, points=8, radius=1):
+    def _lbp_key(self):
+        return ("lbp", self.lbp_points, self.lbp_radius, self.lbp_method)
+    
+    @traced("deepfake.lbp")
+    def _local_binary_pattern(self, image, points=8, radius=1, method="default"):
         """Calculate Local Binary Pattern"""
-        lbp = np.zeros_like(image)
-        for i in range(radius, image.shape[0]-radius):
-            for j in range(radius, image.shape[1]-radius):
-                center = image[i, j]
-                binary = ''
-                for p in range(points):
-                    x = i + radius * np.cos(2 * np.pi * p / points)
-                    y = j - radius * np.sin(2 * np.pi * p / points)
-                    x, y = int(x), int(y)
-                    binary += '1' if image[x, y] >= center else '0'
-                lbp[i, j] = int(binary, 2)
-        return lbp
+        return local_binary_pattern(image, points=points, radius=radius, method=method)
     
     def _predict_deepfake(self, features: Dict[str, float]) -> float:
         """Make deepfake prediction based on features"""
@@ -0,0 +1,164 @@
+import cv2
+import numpy as np
+from typing import Any, Callable, Dict, Optional, Tuple
+
+TILE_STATISTICS = ("noise", "ela", "blockiness", "cfa")
+
+# JPEG encodes independent 16x16 MCUs (with 4:2:0 chroma); ELA bands start on
+# this grid and carry one MCU of context so chroma upsampling at the band
+# edges sees the same neighbours as in a whole-image encode
+JPEG_MCU = 16
+
+BLOCK_SIZE = 8
+
+# Smallest spread, relative to the median tile, used for z-scores
+MIN_RELATIVE_SPREAD = 0.05
+
+
+def tile_grid(shape: Tuple[int, ...], grid: int) -> Tuple[int, int, int, int]:
+    """``(rows, cols, tile_h, tile_w)`` with ``grid`` tiles along the longer side.
+
+    Tiles are as close to square as the image allows; the last few pixels of
+    each axis (fewer than one per tile) are left out of the grid.
+    """
+    h, w = shape[:2]
+    tile = max(BLOCK_SIZE, -(-max(h, w) // grid))
+    rows, cols = max(1, h // tile), max(1, w // tile)
+    return rows, cols, h // rows, w // cols
+
+
+def _band_tiles(band: np.ndarray, cols: int, tile_w: int) -> np.ndarray:
+    """``cols x tile_h x tile_w`` strided view of a band of tiles (no copy)"""
+    tile_h = band.shape[0]
+    row_stride, col_stride = band.strides[:2]
+    return np.lib.stride_tricks.as_strided(
+        band, shape=(cols, tile_h, tile_w),
+        strides=(tile_w * col_stride, row_stride, col_stride), writeable=False
+    )
+
+
+def _noise_mad(tiles: np.ndarray) -> np.ndarray:
+    """Median absolute deviation of every tile"""
+    median = np.median(tiles, axis=(1, 2), keepdims=True).astype(np.float32)
+    deviation = np.abs(tiles.astype(np.float32) - median)
+    return np.median(deviation, axis=(1, 2))
+
+
+def _variance(tiles: np.ndarray) -> np.ndarray:
+    """Exact per-tile variance from integer sums, without a float copy of the band"""
+    n = tiles.shape[1] * tiles.shape[2]
+    total = tiles.sum(axis=(1, 2), dtype=np.int64)
+    squares = np.einsum("ijk,ijk->i", tiles, tiles, dtype=np.int64)
+    return (n * squares - total * total) / float(n * n)
+
+
+def _blockiness(band: np.ndarray, y0: int, cols: int, tile_w: int) -> np.ndarray:
+    """Mean gradient across the 8x8 block grid over the mean gradient inside blocks.
+
+    Close to 1 for natural content, well above 1 where JPEG blocking shows.
+    Only steps between two pixels of the same tile are counted.
+    """
+    width = cols * tile_w
+    band = band[:, :width].astype(np.int16)
+    tile_h = band.shape[0]
+
+    # Horizontal steps from column j to j + 1, summed over the band's rows
+    right = np.arange(1, width + 1)
+    inside = right % tile_w != 0
+    on_grid = inside & (right % BLOCK_SIZE == 0)
+    steps = np.append(np.abs(np.diff(band, axis=1)).sum(axis=0, dtype=np.int64), 0)
+    grid_sum = np.where(on_grid, steps, 0)
+    all_sum = np.where(inside, steps, 0)
+    grid_count = on_grid * tile_h
+    all_count = inside * tile_h
+
+    # Vertical steps from row i to i + 1 (absolute row numbers decide the grid)
+    vertical = np.abs(np.diff(band, axis=0))
+    row_on_grid = np.arange(y0 + 1, y0 + tile_h) % BLOCK_SIZE == 0
+    grid_sum = grid_sum + vertical[row_on_grid].sum(axis=0, dtype=np.int64)
+    all_sum = all_sum + vertical.sum(axis=0, dtype=np.int64)
+    grid_count = grid_count + int(row_on_grid.sum())
+    all_count = all_count + (tile_h - 1)
+
+    starts = np.arange(cols) * tile_w
+    grid_sum, all_sum, grid_count, all_count = (
+        np.add.reduceat(values, starts).astype(np.float64)
+        for values in (grid_sum, all_sum, grid_count, all_count)
+    )
+    grid_mean = grid_sum / np.maximum(grid_count, 1)
+    inside_mean = (all_sum - grid_sum) / np.maximum(all_count - grid_count, 1)
+    return (grid_mean + 1.0) / (inside_mean + 1.0)
+
+
+def _ela_band(image: np.ndarray, y0: int, y1: int,
+              ela_error: Callable[[np.ndarray], np.ndarray]) -> np.ndarray:
+    """Per-pixel ELA error for rows ``y0:y1``, encoding only an MCU-aligned strip around them"""
+    start = max(0, (y0 // JPEG_MCU - 1) * JPEG_MCU)
+    stop = min(image.shape[0], (-(-y1 // JPEG_MCU) + 1) * JPEG_MCU)
+    error = ela_error(image[start:stop])
+    return error[y0 - start:y1 - start]
+
+
+def tile_heatmaps(image: np.ndarray, grid: int = 16,
+                  ela_error: Optional[Callable[[np.ndarray], np.ndarray]] = None) -> Dict[str, np.ndarray]:
+    """Per-tile forensic statistics over a ``grid``-wide tiling of ``image``.
+
+    Returns one ``rows x cols`` float32 heatmap per statistic:
+
+    - ``noise``: median absolute deviation of the grayscale pixels
+    - ``ela``: mean error level (needs ``ela_error``, a function returning the
+      per-pixel ELA error of an image strip)
+    - ``blockiness``: gradient across the 8x8 grid relative to inside blocks
+    - ``cfa``: variance of the green channel (as in the whole-image CFA score)
+
+    The image is walked one row of tiles at a time through strided views,
+    so intermediate arrays never exceed a single band of tiles.
+    """
+    if image.ndim == 3 and image.shape[2] >= 3:
+        gray = None
+        green = image[:, :, 1]
+    else:
+        gray = green = image if image.ndim == 2 else image[:, :, 0]
+
+    rows, cols, tile_h, tile_w = tile_grid(image.shape, grid)
+    heatmaps = {name: np.zeros((rows, cols), dtype=np.float32) for name in TILE_STATISTICS}
+    if ela_error is None:
+        del heatmaps["ela"]
+
+    for row in range(rows):
+        y0, y1 = row * tile_h, (row + 1) * tile_h
+        if gray is None:
+            gray_band = cv2.cvtColor(np.ascontiguousarray(image[y0:y1, :, :3]), cv2.COLOR_RGB2GRAY)
+        else:
+            gray_band = gray[y0:y1]
+
+        heatmaps["noise"][row] = _noise_mad(_band_tiles(gray_band, cols, tile_w))
+        heatmaps["blockiness"][row] = _blockiness(gray_band, y0, cols, tile_w)
+        heatmaps["cfa"][row] = _variance(_band_tiles(green[y0:y1], cols, tile_w))
+        if ela_error is not None:
+            error = _ela_band(image, y0, y1, ela_error)
+            heatmaps["ela"][row] = _band_tiles(error, cols, tile_w).mean(axis=(1, 2))
+
+    return heatmaps
+
+
+def heatmap_scores(heatmap: np.ndarray) -> Dict[str, Any]:
+    """Mean and max of a heatmap plus the tile deviating most from the rest.
+
+    The deviation is a robust z-score (median / MAD), signed, so tiles that
+    are unusually low (e.g. a smoothed splice) stand out as much as high ones.
+    """
+    values = heatmap.astype(np.float64)
+    median = np.median(values)
+    mad = np.median(np.abs(values - median))
+    # 1.4826 * MAD estimates the standard deviation of normally distributed
+    # tiles; the floor keeps near-uniform maps from turning tiny wobbles into outliers
+    spread = max(1.4826 * mad, MIN_RELATIVE_SPREAD * abs(median), 1e-12)
+    zscores = (values - median) / spread
+    extreme = np.unravel_index(np.argmax(np.abs(zscores)), zscores.shape)
+    return {
+        "mean": float(values.mean()),
+        "max": float(values.max()),
+        "extreme_zscore": float(zscores[extreme]),
+        "extreme_tile": [int(extreme[0]), int(extreme[1])]
+    }
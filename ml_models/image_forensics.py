@@ -1,35 +1,84 @@
 import numpy as np
 import cv2
-from typing import Dict, Any, List
+import io
+from typing import Dict, Any, List, Optional, Sequence
 from PIL import Image, ImageFilter
 
+from ml_models.analysis_context import AnalysisContext, FrameBatch
+from ml_models.forensic_tiles import heatmap_scores, tile_grid, tile_heatmaps
+from ml_models.model_registry import ModelRegistry
+from ml_models import precision
+from ml_models.tracing import traced
+
+# Robust z-score above which a single tile is reported as a localized anomaly
+LOCAL_ANOMALY_ZSCORE = 6.0
+
+# Forensics CNN probability above which the image is reported as manipulated
+CNN_MANIPULATION_THRESHOLD = 0.5
+
+# Tile statistics whose outliers are reported, with their indicator
+LOCALIZED_INDICATORS = {
+    "ela": "Localized error level anomaly",
+    "noise": "Localized noise inconsistency"
+}
+
+
+def localized_anomalies(tile_analysis: Optional[Dict[str, Any]]) -> Dict[str, List[int]]:
+    """``[row, col]`` of the outlying tile of every reported statistic of a tile analysis"""
+    scores = (tile_analysis or {}).get("scores", {})
+    return {
+        name: scores[name]["extreme_tile"] for name in LOCALIZED_INDICATORS
+        if abs(scores.get(name, {}).get("extreme_zscore", 0)) > LOCAL_ANOMALY_ZSCORE
+    }
+
 class ImageForensicsAnalyzer:
-    def __init__(self):
+    # ELA, CFA and 8x8 block-grid analysis only make sense on the original pixels
+    needs_native_resolution = True
+    
+    def __init__(self, ela_qualities: Sequence[int] = (95, 75), ela_map_size: Optional[int] = None,
+                 tile_grid: Optional[int] = None, registry: Optional[ModelRegistry] = None,
+                 model_name: Optional[str] = None):
+        # First quality is the reference re-encode, every other level is diffed against it
+        self.ela_qualities = tuple(ela_qualities)
+        # Longest side of the optional per-pixel ELA map, None to skip it
+        self.ela_map_size = ela_map_size
+        # Tiles along the longer side for localization heatmaps, None to skip them
+        self.tile_grid = tile_grid
+        # Optional manipulation CNN in the shared model registry
+        self.registry = registry if registry is not None else ModelRegistry()
+        self.model_name = model_name
         self.setup_forensics_tools()
     
     def setup_forensics_tools(self):
         """Setup forensic analysis tools"""
         print("Image forensics analyzer initialized")
     
-    async def analyze(self, image: np.ndarray) -> Dict[str, Any]:
-        """Perform comprehensive forensic analysis"""
+    async def analyze(self, image: np.ndarray, context: AnalysisContext = None,
+                      tiles: bool = True) -> Dict[str, Any]:
+        """Perform comprehensive forensic analysis (``tiles=False`` skips the tile heatmaps)"""
         try:
+            context = AnalysisContext.ensure(image, context)
+            
             # Multiple forensic analyses
             ela_analysis = self._error_level_analysis(image)
-            noise_analysis = self._noise_consistency_analysis(image)
+            noise_analysis = self._noise_consistency_analysis(image, context)
             cfa_analysis = self._cfa_artifact_analysis(image)
-            compression_analysis = self._compression_artifact_analysis(image)
+            compression_analysis = self._compression_artifact_analysis(image, context)
+            tile_analysis = self._tile_analysis(image) if self.tile_grid and tiles else None
+            cnn_analysis = self._cnn_analysis(image, context)
             
             # Detect editing indicators
             editing_indicators = self._detect_editing_indicators(
-                ela_analysis, noise_analysis, cfa_analysis, compression_analysis
+                ela_analysis, noise_analysis, cfa_analysis, compression_analysis, tile_analysis
             )
+            if cnn_analysis and cnn_analysis["manipulation_probability"] > CNN_MANIPULATION_THRESHOLD:
+                editing_indicators.append("Manipulation detected by forensics model")
             
             confidence = self._calculate_forensics_confidence(
                 ela_analysis, noise_analysis, cfa_analysis, compression_analysis
             )
             
-            return {
+            result = {
                 "is_authentic": len(editing_indicators) == 0,
                 "editing_indicators": editing_indicators,
                 "compression_artifacts": compression_analysis,
@@ -40,6 +89,11 @@ class ImageForensicsAnalyzer:
                     "cfa_artifacts": cfa_analysis
                 }
             }
+            if tile_analysis is not None:
+                result["detailed_analysis"]["tile_analysis"] = tile_analysis
+            if cnn_analysis:
+                result["detailed_analysis"]["cnn_analysis"] = cnn_analysis
+            return result
             
         except Exception as e:
             return {
@@ -50,39 +104,132 @@ class ImageForensicsAnalyzer:
                 "error": str(e)
             }
     
-    def _error_level_analysis(self, image: np.ndarray) -> Dict[str, float]:
+    async def analyze_batch(self, frames: np.ndarray, batch: FrameBatch = None) -> List[Dict[str, Any]]:
+        """Analyze an N x H x W x C stack of frames; each result equals ``analyze`` on that frame.
+        
+        The Laplacian and the CNN scores are computed over the whole stack.
+        ELA (a JPEG round trip), the noise medians and the CFA variance stay
+        per frame.  Frames get no tile analysis, as video results report no
+        heatmaps.
+        """
+        batch = FrameBatch.ensure(frames, batch)
+        planes = [lambda: batch.laplacian]
+        model = self.registry.get(self.model_name) if self.model_name else None
+        if model is not None:
+            planes.append(lambda: batch.get(("cnn", model.name), lambda: model.predict(np.stack([
+                self._model_input(frame, context, model.input_size) for frame, context in batch
+            ]))))
+        batch.prepare(type(self).__name__, planes)
+        
+        return [await self.analyze(frame, context, tiles=False) for frame, context in batch]
+    
+    @traced("forensics.cnn")
+    def _cnn_analysis(self, image: np.ndarray, context: AnalysisContext) -> Optional[Dict[str, Any]]:
+        """Manipulation probability from the forensics CNN, None when it is not loaded"""
+        model = self.registry.get(self.model_name) if self.model_name else None
+        if model is None:
+            return None
+        probability = context.get(("cnn", model.name), lambda: model.predict(
+            self._model_input(image, context, model.input_size)[np.newaxis]
+        )[0])
+        return {"model": model.name, "manipulation_probability": float(probability)}
+    
+    def _model_input(self, image: np.ndarray, context: AnalysisContext, size) -> np.ndarray:
+        return context.resized(tuple(size)).astype(np.float32) / 255.0
+    
+    @traced("forensics.ela")
+    def _error_level_analysis(self, image: np.ndarray) -> Dict[str, Any]:
         """Error Level Analysis for JPEG compression artifacts"""
         try:
+            if len(self.ela_qualities) < 2:
+                raise ValueError("ELA needs at least two quality levels")
+            
             # Convert to PIL Image
             pil_image = Image.fromarray(image)
+            if pil_image.mode not in ("L", "RGB"):
+                pil_image = pil_image.convert("RGB")
             
-            # Save at different quality levels
-            pil_image.save('temp_high.jpg', 'JPEG', quality=95)
-            pil_image.save('temp_low.jpg', 'JPEG', quality=75)
+            # Re-encode at every quality level in memory, reusing one buffer
+            buffer = io.BytesIO()
+            reference = self._jpeg_roundtrip(pil_image, self.ela_qualities[0], buffer)
             
-            # Load and compare
-            high_qual = np.array(Image.open('temp_high.jpg'))
-            low_qual = np.array(Image.open('temp_low.jpg'))
+            level_scores = {}
+            ela_map = None
+            for quality in self.ela_qualities[1:]:
+                recompressed = self._jpeg_roundtrip(pil_image, quality, buffer)
+                diff = cv2.absdiff(reference, recompressed)
+                level_scores[quality] = float(np.mean(diff) / 255.0)
+                
+                if self.ela_map_size:
+                    pixel_error = diff.max(axis=2) if diff.ndim == 3 else diff
+                    ela_map = pixel_error if ela_map is None else np.maximum(ela_map, pixel_error)
             
-            # Calculate difference
-            diff = np.abs(high_qual.astype(float) - low_qual.astype(float))
-            ela_score = np.mean(diff) / 255.0
+            result = {"ela_score": float(np.mean(list(level_scores.values())))}
+            if len(level_scores) > 1:
+                result["ela_levels"] = {str(q): score for q, score in level_scores.items()}
+            if ela_map is not None:
+                result["ela_map"] = self._downsample_ela_map(ela_map).tolist()
             
-            import os
-            os.remove('temp_high.jpg')
-            os.remove('temp_low.jpg')
-            
-            return {"ela_score": float(ela_score)}
+            return result
             
         except Exception as e:
             return {"ela_score": 0.0, "error": str(e)}
     
-    def _noise_consistency_analysis(self, image: np.ndarray) -> Dict[str, float]:
-        """Analyze noise consistency across the image"""
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    def _jpeg_roundtrip(self, pil_image: Image.Image, quality: int, buffer: io.BytesIO) -> np.ndarray:
+        """Encode to JPEG in memory and decode it back"""
+        buffer.seek(0)
+        buffer.truncate()
+        pil_image.save(buffer, 'JPEG', quality=quality)
+        buffer.seek(0)
+        with Image.open(buffer) as decoded:
+            return np.array(decoded)
+    
+    def _ela_error(self, image: np.ndarray) -> np.ndarray:
+        """Per-pixel ELA error in [0, 1], averaged over channels and quality levels"""
+        pil_image = Image.fromarray(image)
+        if pil_image.mode not in ("L", "RGB"):
+            pil_image = pil_image.convert("RGB")
         
-        # Calculate noise pattern using wavelet transform
-        coeffs = self._wavelet_transform(gray)
+        buffer = io.BytesIO()
+        reference = self._jpeg_roundtrip(pil_image, self.ela_qualities[0], buffer)
+        error = np.zeros(reference.shape[:2], dtype=np.float32)
+        for quality in self.ela_qualities[1:]:
+            diff = cv2.absdiff(reference, self._jpeg_roundtrip(pil_image, quality, buffer))
+            error += diff.mean(axis=2, dtype=np.float32) if diff.ndim == 3 else diff
+        return error / (255.0 * (len(self.ela_qualities) - 1))
+    
+    @traced("forensics.tile_heatmaps")
+    def _tile_analysis(self, image: np.ndarray) -> Dict[str, Any]:
+        """Localization heatmaps over a grid of tiles, with summary scores per statistic"""
+        try:
+            ela_error = self._ela_error if len(self.ela_qualities) >= 2 else None
+            heatmaps = tile_heatmaps(image, self.tile_grid, ela_error)
+            rows, cols, tile_h, tile_w = tile_grid(image.shape, self.tile_grid)
+            
+            return {
+                "grid": [rows, cols],
+                "tile_size": [tile_h, tile_w],
+                "heatmaps": {name: np.round(heatmap, 4).tolist() for name, heatmap in heatmaps.items()},
+                "scores": {name: heatmap_scores(heatmap) for name, heatmap in heatmaps.items()}
+            }
+            
+        except Exception as e:
+            return {"error": str(e)}
+    
+    def _downsample_ela_map(self, ela_map: np.ndarray) -> np.ndarray:
+        """Shrink the per-pixel error map so its longest side is ela_map_size"""
+        h, w = ela_map.shape
+        scale = min(1.0, self.ela_map_size / max(h, w))
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        small = cv2.resize(ela_map, size, interpolation=cv2.INTER_AREA)
+        return np.round(small.astype(np.float32) / 255.0, 4)
+    
+    @traced("forensics.noise_consistency")
+    def _noise_consistency_analysis(self, image: np.ndarray, context: AnalysisContext = None) -> Dict[str, float]:
+        """Analyze noise consistency across the image"""
+        context = AnalysisContext.ensure(image, context)
+        gray = context.gray
+        h, w = gray.shape
         
         # Analyze noise consistency in different regions
         regions = [
@@ -98,13 +245,6 @@ class ImageForensicsAnalyzer:
             "average_noise_level": float(np.mean(region_noise_levels))
         }
     
-    def _wavelet_transform(self, image):
-        """Simple wavelet-like transform"""
-        # Using Laplacian pyramid as approximation
-        level1 = cv2.pyrDown(image)
-        level2 = cv2.pyrDown(level1)
-        return level2
-    
     def _estimate_noise_level(self, image):
         """Estimate noise level in image region"""
         # Using median absolute deviation
@@ -112,6 +252,7 @@ class ImageForensicsAnalyzer:
         mad = np.median(np.abs(image - median))
         return float(mad)
     
+    @traced("forensics.cfa_artifacts")
     def _cfa_artifact_analysis(self, image: np.ndarray) -> Dict[str, float]:
         """Analyze Color Filter Array artifacts"""
         # CFA interpolation creates specific patterns
@@ -120,7 +261,7 @@ class ImageForensicsAnalyzer:
         green_channel = image[:, :, 1]  # Green channel often shows CFA artifacts
         
         # Calculate variance in green pixel patterns
-        pattern_variance = np.var([
+        pattern_variance = precision.variance([
             green_channel[::2, ::2],  # Different Bayer pattern positions
             green_channel[::2, 1::2],
             green_channel[1::2, ::2],
@@ -130,15 +271,17 @@ class ImageForensicsAnalyzer:
         cfa_score = min(pattern_variance / 1000.0, 1.0)
         return {"cfa_artifact_score": float(cfa_score)}
     
-    def _compression_artifact_analysis(self, image: np.ndarray) -> Dict[str, Any]:
+    @traced("forensics.compression_artifacts")
+    def _compression_artifact_analysis(self, image: np.ndarray, context: AnalysisContext = None) -> Dict[str, Any]:
         """Analyze compression artifacts"""
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        context = AnalysisContext.ensure(image, context)
+        gray = context.gray
         
         # Detect block artifacts (common in JPEG)
         block_artifacts = self._detect_block_artifacts(gray)
         
         # Detect ringing artifacts
-        ringing_artifacts = self._detect_ringing_artifacts(gray)
+        ringing_artifacts = self._detect_ringing_artifacts(gray, context.laplacian)
         
         return {
             "block_artifacts": float(block_artifacts),
@@ -152,24 +295,22 @@ class ImageForensicsAnalyzer:
         h, w = image.shape
         
         block_size = 8  # Standard JPEG block size
-        horizontal_artifacts = 0
-        vertical_artifacts = 0
-        
-        for i in range(block_size, h, block_size):
-            row_diff = np.mean(np.abs(image[i, :] - image[i-1, :]))
-            horizontal_artifacts += row_diff
         
-        for j in range(block_size, w, block_size):
-            col_diff = np.mean(np.abs(image[:, j] - image[:, j-1]))
-            vertical_artifacts += col_diff
+        # All boundary rows / columns at once; the per-line means are then
+        # accumulated in order so the total matches the line-by-line loop
+        row_diffs = np.abs(image[block_size::block_size, :] - image[block_size - 1:h - 1:block_size, :])
+        col_diffs = np.abs(image[:, block_size::block_size] - image[:, block_size - 1:w - 1:block_size])
+        horizontal_artifacts = sum(row_diffs.mean(axis=1).tolist(), 0)
+        vertical_artifacts = sum(col_diffs.mean(axis=0).tolist(), 0)
         
         total_artifacts = (horizontal_artifacts + vertical_artifacts) / (h + w)
         return float(total_artifacts / 255.0)
     
-    def _detect_ringing_artifacts(self, image):
+    def _detect_ringing_artifacts(self, image, edges: Optional[np.ndarray] = None):
         """Detect ringing artifacts around edges"""
         # Use Laplacian to find edges
-        edges = cv2.Laplacian(image, cv2.CV_64F)
+        if edges is None:
+            edges = cv2.Laplacian(image, precision.cv_depth())
         edge_mask = np.abs(edges) > np.mean(np.abs(edges)) * 2
         
         # Analyze oscillations near edges
@@ -188,6 +329,7 @@ class ImageForensicsAnalyzer:
         noise_consistency = analyses[1].get("noise_consistency", 0)
         cfa_score = analyses[2].get("cfa_artifact_score", 0)
         compression_artifacts = analyses[3]
+        anomalies = localized_anomalies(analyses[4]) if len(analyses) > 4 else {}
         
         if ela_score > 0.1:
             indicators.append("High error level variation detected")
@@ -197,6 +339,7 @@ class ImageForensicsAnalyzer:
             indicators.append("CFA interpolation artifacts detected")
         if compression_artifacts["block_artifacts"] > 0.5:
             indicators.append("Heavy compression artifacts")
+        indicators.extend(LOCALIZED_INDICATORS[name] for name in anomalies)
         
         return indicators
     
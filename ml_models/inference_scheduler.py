@@ -0,0 +1,202 @@
+"""Dynamic micro-batching of model inference.
+
+Callers hand ``InferenceScheduler.predict`` a stack of preprocessed inputs
+(one image, or the frames of a video batch) and block until their outputs
+are ready.  A batcher thread concatenates the stacks queued by concurrent
+callers and runs them as one batch of at most ``max_batch_size`` inputs.
+It waits at most ``max_wait_ms`` after the oldest queued input, and not at
+all once every caller thread of the process is queued.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Sequence
+
+import numpy as np
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+QUEUE_WAIT_BUCKETS_MS = (0.1, 0.5, 1, 2, 5, 10, 25, 50, 100, 250)
+
+
+class Histogram:
+    """Counts of observed values per bucket (upper bounds, plus one for +Inf)"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other: Dict[str, Any]):
+        """Add the counts of another histogram's ``to_dict`` with the same buckets"""
+        for i, count in enumerate(other["counts"]):
+            self.counts[i] += count
+        self.count += other["count"]
+        self.sum += other["sum"]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"counts": list(self.counts), "count": self.count, "sum": self.sum}
+
+    def summary(self) -> Dict[str, Any]:
+        """Cumulative bucket counts keyed by upper bound, as Prometheus reports them"""
+        buckets, total = {}, 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            buckets[str(bound)] = total
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "buckets": buckets
+        }
+
+
+def new_histograms() -> Dict[str, Histogram]:
+    return {"batch_size": Histogram(BATCH_SIZE_BUCKETS), "queue_wait_ms": Histogram(QUEUE_WAIT_BUCKETS_MS)}
+
+
+class InferenceStats:
+    """Histograms per model, merged from the deltas drained in worker processes"""
+
+    def __init__(self):
+        self.models: Dict[str, Dict[str, Histogram]] = {}
+
+    def merge(self, drained: Dict[str, Dict[str, Dict[str, Any]]]):
+        for name, histograms in drained.items():
+            merged = self.models.setdefault(name, new_histograms())
+            for key, histogram in histograms.items():
+                merged[key].merge(histogram)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {key: histogram.summary() for key, histogram in histograms.items()}
+            for name, histograms in self.models.items()
+        }
+
+    def to_dict(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Raw counts in the form ``merge`` takes"""
+        return {
+            name: {key: histogram.to_dict() for key, histogram in histograms.items()}
+            for name, histograms in self.models.items()
+        }
+
+
+class _Request:
+    __slots__ = ("inputs", "future", "enqueued")
+
+    def __init__(self, inputs: np.ndarray):
+        self.inputs = inputs
+        self.future: Future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class InferenceScheduler:
+    """Batches the ``run(inputs) -> outputs`` calls of concurrent threads.
+
+    ``concurrency`` is the number of threads that may call ``predict`` at
+    once; with a single caller (a process-pool worker) inputs run inline,
+    split into chunks of ``max_batch_size``, and no thread is started.
+    """
+
+    def __init__(self, run: Callable[[np.ndarray], np.ndarray], max_batch_size: int = 16,
+                 max_wait_ms: float = 5.0, concurrency: int = 1):
+        self.run = run
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self.concurrency = max(1, concurrency)
+        self._pending: Deque[_Request] = deque()
+        self._pending_inputs = 0
+        self._cond = threading.Condition()
+        self._stats_lock = threading.Lock()
+        self._stats = new_histograms()
+        self._thread = None
+
+    def predict(self, inputs: np.ndarray) -> np.ndarray:
+        """Outputs for ``inputs``, computed as part of whichever batch they join"""
+        if self.concurrency == 1:
+            self._observe_wait(0.0)
+            return self._run_chunked(inputs)
+
+        request = _Request(inputs)
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._batch_loop, name="inference-batcher",
+                                                daemon=True)
+                self._thread.start()
+            self._pending.append(request)
+            self._pending_inputs += len(inputs)
+            self._cond.notify()
+        return request.future.result()
+
+    def drain_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Histogram counts since the last drain (empty when nothing ran)"""
+        with self._stats_lock:
+            stats, self._stats = self._stats, new_histograms()
+        if not stats["batch_size"].count:
+            return {}
+        return {key: histogram.to_dict() for key, histogram in stats.items()}
+
+    def _batch_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = self._pending[0].enqueued + self.max_wait_ms / 1000.0
+                # Nobody else can join once every caller thread is queued
+                while self._pending_inputs < self.max_batch_size and len(self._pending) < self.concurrency:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._take_batch()
+            self._execute(batch)
+
+    def _take_batch(self) -> List[_Request]:
+        # Whole requests only; a request larger than the limit runs on its own
+        batch, size = [], 0
+        while self._pending and (not batch or size + len(self._pending[0].inputs) <= self.max_batch_size):
+            request = self._pending.popleft()
+            batch.append(request)
+            size += len(request.inputs)
+        self._pending_inputs -= size
+        return batch
+
+    def _execute(self, batch: List[_Request]):
+        started = time.perf_counter()
+        for request in batch:
+            self._observe_wait((started - request.enqueued) * 1000.0)
+        try:
+            inputs = batch[0].inputs if len(batch) == 1 else np.concatenate([r.inputs for r in batch])
+            outputs = self._run_chunked(inputs)
+        except BaseException as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        offset = 0
+        for request in batch:
+            request.future.set_result(outputs[offset:offset + len(request.inputs)])
+            offset += len(request.inputs)
+
+    def _run_chunked(self, inputs: np.ndarray) -> np.ndarray:
+        chunks = []
+        for start in range(0, max(len(inputs), 1), self.max_batch_size):
+            chunk = inputs[start:start + self.max_batch_size]
+            with self._stats_lock:
+                self._stats["batch_size"].observe(len(chunk))
+            chunks.append(self.run(chunk))
+        return chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+
+    def _observe_wait(self, milliseconds: float):
+        with self._stats_lock:
+            self._stats["queue_wait_ms"].observe(milliseconds)
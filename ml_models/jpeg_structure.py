@@ -0,0 +1,283 @@
+import struct
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Natural (row-major) index of every coefficient in zigzag order
+ZIGZAG = np.array([
+    0, 1, 8, 16, 9, 2, 3, 10, 17, 24, 32, 25, 18, 11, 4, 5,
+    12, 19, 26, 33, 40, 48, 41, 34, 27, 20, 13, 6, 7, 14, 21, 28,
+    35, 42, 49, 56, 57, 50, 43, 36, 29, 22, 15, 23, 30, 37, 44, 51,
+    58, 59, 52, 45, 38, 31, 39, 46, 53, 60, 61, 54, 47, 55, 62, 63
+])
+
+# Annex K example tables, the base of libjpeg's (IJG) quality scaling
+IJG_LUMA = np.array([
+    16, 11, 10, 16, 24, 40, 51, 61,
+    12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56,
+    14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77,
+    24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101,
+    72, 92, 95, 98, 112, 100, 103, 99
+])
+IJG_CHROMA = np.array([
+    17, 18, 24, 47, 99, 99, 99, 99,
+    18, 21, 26, 66, 99, 99, 99, 99,
+    24, 26, 56, 99, 99, 99, 99, 99,
+    47, 66, 99, 99, 99, 99, 99, 99
+] + [99] * 32)
+
+
+def _ijg_tables(base: np.ndarray) -> np.ndarray:
+    """``100 x 64`` tables libjpeg's ``jpeg_set_quality`` produces for quality 1..100"""
+    quality = np.arange(1, 101)[:, None]
+    scale = np.where(quality < 50, 5000 // quality, 200 - 2 * quality)
+    return np.clip((base[None, :] * scale + 50) // 100, 1, 255)
+
+
+_IJG_LUMA_TABLES = _ijg_tables(IJG_LUMA)
+_IJG_CHROMA_TABLES = _ijg_tables(IJG_CHROMA)
+
+# Other encoders' luma tables (natural order) that should not count as a
+# mismatch, e.g. a camera vendor's fixed tables
+KNOWN_LUMA_TABLES: Dict[str, np.ndarray] = {}
+
+# Fixed Exif thumbnail sizes (DCF's 160 x 120, either way round): cameras
+# letterbox every shape into them, so their aspect ratio says nothing
+STANDARD_THUMBNAIL_SIZES = {(160, 120), (120, 160)}
+
+# Start-of-frame markers (everything in C0..CF except DHT, JPG and DAC)
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Markers without a length field
+_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+
+_APP_IDENTIFIERS = (
+    (b"JFIF\x00", "JFIF"),
+    (b"Exif\x00", "Exif"),
+    (b"http://ns.adobe.com/xap/1.0/\x00", "XMP"),
+    (b"ICC_PROFILE\x00", "ICC"),
+    (b"Photoshop 3.0\x00", "Photoshop"),
+    (b"Adobe", "Adobe"),
+    (b"Ducky", "Ducky"),
+)
+
+
+def estimate_quality(table: np.ndarray, chroma: bool = False) -> Dict[str, Any]:
+    """Closest IJG quality for a quantization table given in natural order"""
+    candidates = _IJG_CHROMA_TABLES if chroma else _IJG_LUMA_TABLES
+    errors = np.abs(candidates - np.asarray(table)[None, :]).sum(axis=1)
+    best = int(np.argmin(errors))
+    return {"quality": best + 1, "exact": bool(errors[best] == 0)}
+
+
+def _app_name(marker: int, payload: memoryview) -> str:
+    head = bytes(payload[:32])
+    for prefix, name in _APP_IDENTIFIERS:
+        if head.startswith(prefix):
+            return name
+    return f"APP{marker - 0xE0}"
+
+
+def _subsampling(components: List[Dict[str, int]]) -> str:
+    if len(components) < 3:
+        return "grayscale"
+    luma, chroma = components[0], components[1]
+    ratio = (luma["h"] // max(chroma["h"], 1), luma["v"] // max(chroma["v"], 1))
+    return {(1, 1): "4:4:4", (2, 1): "4:2:2", (2, 2): "4:2:0", (4, 1): "4:1:1", (1, 2): "4:4:0"}.get(
+        ratio, f"{luma['h']}x{luma['v']}"
+    )
+
+
+def _parse_segments(data: memoryview, offset: int = 0, limit: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """Walk the marker segments of one JPEG stream up to its first scan"""
+    end = len(data) if limit is None else min(len(data), limit)
+    if end - offset < 4 or data[offset] != 0xFF or data[offset + 1] != 0xD8:
+        return None
+
+    tables: Dict[int, np.ndarray] = {}
+    structure: Dict[str, Any] = {"markers": [], "progressive": False, "restart_interval": 0}
+    try:
+        _walk_segments(data, offset + 2, end, structure, tables)
+    except (struct.error, ValueError, IndexError):
+        structure["malformed"] = True
+
+    structure["_tables"] = tables
+    return structure
+
+
+def _walk_segments(data: memoryview, pos: int, end: int, structure: Dict[str, Any],
+                   tables: Dict[int, np.ndarray]):
+    while pos + 4 <= end:
+        if data[pos] != 0xFF:
+            structure["malformed"] = True
+            break
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1  # fill byte
+            continue
+        if marker in _STANDALONE_MARKERS:
+            pos += 2
+            continue
+
+        length = struct.unpack_from(">H", data, pos + 2)[0]
+        payload = data[pos + 4:pos + 2 + length]
+        if length < 2 or pos + 2 + length > end:
+            structure["truncated"] = True
+            break
+
+        if 0xE0 <= marker <= 0xEF:
+            name = _app_name(marker, payload)
+            structure["markers"].append(name)
+            if name == "Exif":
+                structure["exif_segment"] = (pos + 4, pos + 2 + length)
+        elif marker == 0xDB:
+            structure["markers"].append("DQT")
+            i = 0
+            while i < len(payload):
+                precision, table_id = payload[i] >> 4, payload[i] & 0x0F
+                size = 128 if precision else 64
+                raw = payload[i + 1:i + 1 + size]
+                values = np.frombuffer(raw, dtype=">u2" if precision else np.uint8)
+                table = np.empty(64, dtype=np.int64)
+                table[ZIGZAG] = values
+                tables[table_id] = table
+                i += 1 + size
+        elif marker in _SOF_MARKERS:
+            structure["markers"].append(f"SOF{marker - 0xC0}")
+            precision, height, width, count = struct.unpack_from(">BHHB", payload, 0)
+            components = []
+            for c in range(count):
+                component_id, sampling, table_id = struct.unpack_from(">BBB", payload, 6 + 3 * c)
+                components.append({"id": component_id, "h": sampling >> 4, "v": sampling & 0x0F,
+                                   "table": table_id})
+            structure.update({
+                "width": width,
+                "height": height,
+                "precision": precision,
+                "components": len(components),
+                "subsampling": _subsampling(components),
+                "progressive": marker in (0xC2, 0xC6, 0xCA, 0xCE)
+            })
+            structure["_components"] = components
+        elif marker == 0xC4:
+            structure["markers"].append("DHT")
+        elif marker == 0xDD:
+            structure["markers"].append("DRI")
+            structure["restart_interval"] = struct.unpack_from(">H", payload, 0)[0]
+        elif marker == 0xDA:
+            structure["markers"].append("SOS")
+            break
+        elif marker == 0xFE:
+            structure["markers"].append("COM")
+        else:
+            structure["markers"].append(f"0x{marker:02X}")
+        pos += 2 + length
+
+
+def _find_exif_thumbnail(data: memoryview, start: int, stop: int) -> Optional[int]:
+    """Offset of the embedded thumbnail's SOI inside the Exif segment"""
+    # Search the underlying bytes in place rather than copying the segment
+    index = data.obj.find(b"\xff\xd8\xff", start + 6, stop)
+    return index if index >= 0 else None
+
+
+def _quantization_summary(structure: Dict[str, Any]) -> Dict[str, Any]:
+    tables = structure["_tables"]
+    components = structure.get("_components", [])
+    luma_id = components[0]["table"] if components else 0
+    chroma_id = components[1]["table"] if len(components) > 1 else None
+
+    summary: Dict[str, Any] = {"tables": len(tables)}
+    luma = tables.get(luma_id)
+    if luma is None:
+        return summary
+
+    luma_quality = estimate_quality(luma)
+    summary["quality_estimate"] = luma_quality["quality"]
+    summary["standard_tables"] = luma_quality["exact"]
+    if chroma_id is not None and chroma_id in tables and chroma_id != luma_id:
+        chroma_quality = estimate_quality(tables[chroma_id], chroma=True)
+        summary["chroma_quality_estimate"] = chroma_quality["quality"]
+        summary["standard_tables"] = luma_quality["exact"] and chroma_quality["exact"]
+    summary["known_table"] = next(
+        (name for name, table in KNOWN_LUMA_TABLES.items() if np.array_equal(table, luma)), None
+    )
+    return summary
+
+
+def analyze_jpeg_structure(content: bytes) -> Optional[Dict[str, Any]]:
+    """Compression forensics from JPEG headers alone, without decoding any pixels.
+
+    Reads the quantization tables, frame header and marker layout (stopping
+    at the first scan) and returns, or None for non-JPEG data:
+
+    - ``quality_estimate``: closest libjpeg (IJG) quality of the luma table,
+      with ``standard_tables`` telling whether the tables match it exactly
+    - ``table_mismatch``: Exif metadata with plain libjpeg tables, for
+      information only (many phones and tools write exactly that)
+    - ``subsampling``, ``progressive``, ``markers`` and frame geometry
+    - ``thumbnail``: the same for the Exif thumbnail, if there is one
+    - ``indicators``: header-level signs of re-compression or editing, and
+      ``double_compression_suspected`` when any of them points that way
+
+    Detecting double quantization from DCT coefficient histograms needs the
+    entropy-coded data and is not attempted here.
+    """
+    data = memoryview(content)
+    structure = _parse_segments(data)
+    if structure is None:
+        return None
+
+    result: Dict[str, Any] = {
+        key: value for key, value in structure.items() if not key.startswith("_") and key != "exif_segment"
+    }
+    result.update(_quantization_summary(structure))
+
+    indicators = []
+    markers = structure["markers"]
+    has_exif = "Exif" in markers
+    resaved_by_editor = has_exif and ("Photoshop" in markers or "Adobe" in markers)
+    if resaved_by_editor:
+        indicators.append("Camera image re-saved by Adobe software")
+    # Many cameras use their own tables, but phones and tools writing Exif
+    # often use libjpeg's; without a table database this is only metadata
+    result["table_mismatch"] = bool(has_exif and result.get("standard_tables") and not result.get("known_table"))
+
+    thumbnail = None
+    if "exif_segment" in structure:
+        start, stop = structure["exif_segment"]
+        thumb_offset = _find_exif_thumbnail(data, start, stop)
+        thumb_structure = _parse_segments(data, thumb_offset, stop) if thumb_offset is not None else None
+        if thumb_structure is not None:
+            thumbnail = _quantization_summary(thumb_structure)
+            thumb_luma = thumb_structure["_tables"].get(0)
+            main_luma = structure["_tables"].get(0)
+            thumbnail["matches_main_tables"] = bool(
+                thumb_luma is not None and main_luma is not None and np.array_equal(thumb_luma, main_luma)
+            )
+            if "width" in thumb_structure and "width" in structure and thumb_structure["height"]:
+                thumb_ratio = thumb_structure["width"] / thumb_structure["height"]
+                main_ratio = structure["width"] / max(structure["height"], 1)
+                thumbnail["size"] = [thumb_structure["width"], thumb_structure["height"]]
+                # Thumbnails are made at capture; a different shape means the image was cropped later
+                thumbnail["aspect_ratio_mismatch"] = bool(
+                    tuple(thumbnail["size"]) not in STANDARD_THUMBNAIL_SIZES
+                    and abs(thumb_ratio - main_ratio) > 0.05 and abs(thumb_ratio - 1 / main_ratio) > 0.05
+                )
+                if thumbnail["aspect_ratio_mismatch"]:
+                    indicators.append("Exif thumbnail does not match the image shape")
+            recompressed = bool(
+                thumbnail.get("quality_estimate") and result.get("quality_estimate")
+                and thumbnail["quality_estimate"] > result["quality_estimate"] + 5
+            )
+            if recompressed:
+                indicators.append("Image is compressed harder than its Exif thumbnail")
+
+    result["thumbnail"] = thumbnail
+    result["indicators"] = indicators
+    result["double_compression_suspected"] = bool(
+        resaved_by_editor or (thumbnail is not None and (recompressed or thumbnail.get("aspect_ratio_mismatch")))
+    )
+    return result
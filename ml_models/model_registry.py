@@ -0,0 +1,276 @@
+"""Lazily loaded CNN models for CPU inference.
+
+Models run on ONNX Runtime, an optional dependency: without it (or without
+a model file) ``get`` returns None and the detectors fall back to their
+heuristics.  The configured paths may name the original Keras/PyTorch
+weights; the registry loads the ``.ort`` or ``.onnx`` export next to them
+(e.g. ``models/mesonet.onnx`` for ``models/mesonet.h5``).
+
+``.ort`` models are read into memory by ``preload`` and ONNX Runtime keeps
+its initializers in that buffer instead of copying them, so when the
+parent preloads before forking its worker pool every worker shares one
+copy of the weights (copy-on-write).  ``.onnx`` models are loaded from
+the path by each process.
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ml_models.inference_scheduler import InferenceScheduler
+
+MODEL_SUFFIXES = (".ort", ".onnx")
+
+
+def _onnxruntime():
+    try:
+        import onnxruntime
+    except ImportError:
+        return None
+    return onnxruntime
+
+
+def resolve_model_file(path: str) -> Optional[str]:
+    """ONNX model file for a configured path, None when there is none"""
+    if not path:
+        return None
+    root, suffix = os.path.splitext(path)
+    candidates = [path] if suffix in MODEL_SUFFIXES else []
+    candidates += [root + other for other in MODEL_SUFFIXES if other != suffix]
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+class LoadedModel:
+    """An inference session taking ``N x H x W x 3`` float32 batches in [0, 1].
+
+    ``predict`` goes through the model's micro-batching scheduler, so
+    concurrent callers share inference calls.
+    """
+
+    def __init__(self, name: str, path: str, session, input_size: Tuple[int, int],
+                 logits: bool = False, max_batch_size: int = 16, max_wait_ms: float = 5.0,
+                 concurrency: int = 1):
+        self.name = name
+        self.path = path
+        self.session = session
+        # Whether the model ends before its sigmoid/softmax
+        self.logits = logits
+        self.scheduler = InferenceScheduler(self.run, max_batch_size, max_wait_ms, concurrency)
+        model_input = session.get_inputs()[0]
+        self.input_name = model_input.name
+        shape = list(model_input.shape)
+        # Channels-first models declare 3 channels right after the batch axis
+        self.channels_first = len(shape) == 4 and shape[1] == 3
+        spatial = shape[2:4] if self.channels_first else shape[1:3]
+        if len(spatial) == 2 and all(isinstance(side, int) and side > 0 for side in spatial):
+            input_size = (spatial[1], spatial[0])
+        self.input_size = input_size
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        """Fake/manipulated probability of every image in ``batch``"""
+        return self.scheduler.predict(batch)
+
+    def run(self, batch: np.ndarray) -> np.ndarray:
+        """One inference call on ``batch``, bypassing the scheduler"""
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        if self.channels_first:
+            batch = np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+        output = np.asarray(self.session.run(None, {self.input_name: batch})[0], dtype=np.float64)
+        output = output.reshape(len(batch), -1)
+        if output.shape[1] > 1:
+            # One column per class, the last one is "fake"
+            if self.logits:
+                output = np.exp(output - output.max(axis=1, keepdims=True))
+            return output[:, -1] / output.sum(axis=1)
+        scores = output[:, 0]
+        return 1.0 / (1.0 + np.exp(-scores)) if self.logits else scores
+
+
+class ModelRegistry:
+    """Named models, each loaded on first use (or by ``warmup``) once per process.
+
+    Sessions never cross a fork: a child process that inherits a registry
+    (or unpickles one) opens its own, while preloaded ``.ort`` buffers are
+    kept and shared.
+    """
+
+    def __init__(self, threads: int = 1, max_batch_size: int = 16, max_wait_ms: float = 5.0,
+                 concurrency: int = 1):
+        # Per-session intra-op threads; the worker processes already use every core
+        self.threads = max(1, threads)
+        # Micro-batching defaults, and the threads of a process that run detectors
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.concurrency = concurrency
+        self._specs: Dict[str, Dict[str, Any]] = {}
+        self._buffers: Dict[str, bytes] = {}
+        self._models: Dict[str, Optional[LoadedModel]] = {}
+        self._status: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_models"] = {}
+        state["_status"] = {}
+        state["_lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def register(self, name: str, path: str, input_size: Tuple[int, int] = (256, 256),
+                 logits: bool = False, max_batch_size: Optional[int] = None,
+                 max_wait_ms: Optional[float] = None):
+        """Declare a model; nothing is read until it is needed.
+
+        ``input_size`` (width, height) is used when the model does not fix
+        it; ``logits`` marks models exported without their final activation.
+        The batching limits default to the registry's.
+        """
+        self._specs[name] = {
+            "path": path,
+            "input_size": tuple(input_size),
+            "logits": logits,
+            "max_batch_size": int(max_batch_size or self.max_batch_size),
+            "max_wait_ms": self.max_wait_ms if max_wait_ms is None else max_wait_ms
+        }
+
+    def batching(self, name: str) -> Dict[str, Any]:
+        spec = self._specs[name]
+        return {"max_batch_size": spec["max_batch_size"], "max_wait_ms": spec["max_wait_ms"]}
+
+    def names(self) -> Sequence[str]:
+        return list(self._specs)
+
+    def model_file(self, name: str) -> Optional[str]:
+        return resolve_model_file(self._specs[name]["path"]) if name in self._specs else None
+
+    def fingerprint(self) -> Dict[str, Optional[list]]:
+        """Identity (file, size, mtime) of each model that would be loaded"""
+        result = {}
+        for name in self._specs:
+            path = self.model_file(name)
+            if path is None or _onnxruntime() is None:
+                result[name] = None
+            else:
+                stat = os.stat(path)
+                result[name] = [os.path.basename(path), stat.st_size, int(stat.st_mtime)]
+        return result
+
+    def preload(self):
+        """Read ``.ort`` weights into memory; call before forking workers to share them"""
+        if _onnxruntime() is None:
+            return
+        for name in self._specs:
+            path = self.model_file(name)
+            if path and path.endswith(".ort") and name not in self._buffers:
+                with open(path, "rb") as f:
+                    self._buffers[name] = f.read()
+
+    def get(self, name: str) -> Optional[LoadedModel]:
+        """The loaded model, or None when it is unregistered, missing or failed to load"""
+        self._check_process()
+        try:
+            return self._models[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._models:
+                self._models[name] = self._load(name)
+            return self._models[name]
+
+    def warmup(self) -> Dict[str, Dict[str, Any]]:
+        """Load every model and run one dummy batch through it"""
+        for name in self._specs:
+            model = self.get(name)
+            if model is None or "warmup_seconds" in self._status[name]:
+                continue
+            started = time.perf_counter()
+            try:
+                width, height = model.input_size
+                model.run(np.zeros((1, height, width, 3), dtype=np.float32))
+            except Exception as e:
+                self._models[name] = None
+                self._status[name].update({"loaded": False, "error": f"Warmup failed: {e}"})
+            else:
+                self._status[name]["warmup_seconds"] = round(time.perf_counter() - started, 4)
+        return self.status()
+
+    def drain_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Batch-size and queue-wait histogram deltas of the models used since the last drain"""
+        self._check_process()
+        stats = {}
+        for name, model in list(self._models.items()):
+            if model is not None:
+                drained = model.scheduler.drain_stats()
+                if drained:
+                    stats[name] = drained
+        return stats
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        self._check_process()
+        result = {}
+        for name in self._specs:
+            status = self._status.get(name)
+            if status is None:
+                status = {"loaded": False, "path": self.model_file(name)}
+            result[name] = dict(status)
+        return result
+
+    def _check_process(self):
+        if os.getpid() != self._pid:
+            # Forked: inference sessions (and their thread pools) stay with the parent
+            self._models = {}
+            self._status = {}
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+
+    def _load(self, name: str) -> Optional[LoadedModel]:
+        if name not in self._specs:
+            return None
+        spec = self._specs[name]
+        configured = spec["path"]
+        path = resolve_model_file(configured)
+        status: Dict[str, Any] = {"loaded": False, "path": path}
+        self._status[name] = status
+        ort = _onnxruntime()
+        if path is None:
+            status["error"] = f"No .ort or .onnx model found for {configured}"
+            return None
+        if ort is None:
+            status["error"] = "ONNX Runtime is not installed (pip install onnxruntime)"
+            return None
+
+        started = time.perf_counter()
+        try:
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            buffer = self._buffers.get(name)
+            if buffer is not None:
+                options.add_session_config_entry("session.use_ort_model_bytes_directly", "1")
+                options.add_session_config_entry("session.use_ort_model_bytes_for_initializers", "1")
+                session = ort.InferenceSession(buffer, options, providers=["CPUExecutionProvider"])
+            else:
+                session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+            model = LoadedModel(name, path, session, spec["input_size"], spec["logits"],
+                                spec["max_batch_size"], spec["max_wait_ms"], self.concurrency)
+        except Exception as e:
+            status["error"] = f"Failed to load model: {e}"
+            return None
+        status.update({
+            "loaded": True,
+            "shared_weights": buffer is not None,
+            "input_size": list(model.input_size),
+            "load_seconds": round(time.perf_counter() - started, 4)
+        })
+        return model
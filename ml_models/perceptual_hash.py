@@ -0,0 +1,67 @@
+import cv2
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+# Bits in every hash; distances between hashes are Hamming distances
+HASH_BITS = 64
+
+# Grayscale side the pHash DCT runs on; its top-left 8 x 8 coefficients are kept
+_PHASH_SIDE = 32
+
+# Below this spread (grey levels) an image is too flat to tell from others
+MIN_CONTRAST = 2.0
+
+
+def _pack(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def phash(gray: np.ndarray) -> int:
+    """64-bit DCT perceptual hash of a grayscale image.
+
+    Each bit tells whether a low-frequency DCT coefficient of the 32 x 32
+    downscaled image is above their median, which survives recompression,
+    resizing and mild cropping or color changes.
+    """
+    small = cv2.resize(gray.astype(np.float32), (_PHASH_SIDE, _PHASH_SIDE), interpolation=cv2.INTER_AREA)
+    low = cv2.dct(small)[:8, :8]
+    return _pack(low > np.median(low))
+
+
+def dhash(gray: np.ndarray) -> int:
+    """64-bit difference hash: whether each pixel of a 9 x 8 thumbnail is brighter than its left neighbour"""
+    small = cv2.resize(gray.astype(np.float32), (9, 8), interpolation=cv2.INTER_AREA)
+    return _pack(small[:, 1:] > small[:, :-1])
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def image_hashes(gray: np.ndarray) -> Optional[List[int]]:
+    """``[phash, dhash]`` of a grayscale image, None when it is too flat to fingerprint"""
+    if gray.size == 0 or float(gray.std()) < MIN_CONTRAST:
+        return None
+    return [phash(gray), dhash(gray)]
+
+
+def image_fingerprint(gray: np.ndarray) -> Optional[Dict[str, Any]]:
+    hashes = image_hashes(gray)
+    return {"kind": "image", "hashes": hashes} if hashes is not None else None
+
+
+def video_fingerprint(frames: List[Optional[np.ndarray]]) -> Optional[Dict[str, Any]]:
+    """Hashes of frames taken at fixed fractions of a video's length.
+
+    ``frames`` are BGR (or grayscale) frames, None where one could not be
+    decoded; their positions are compared, so re-encodes with another frame
+    rate still line up.  None when no frame could be hashed.
+    """
+    hashes = []
+    for frame in frames:
+        if frame is not None and frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        hashes.append(image_hashes(frame) if frame is not None else None)
+    if not any(hashes):
+        return None
+    return {"kind": "video", "frames": hashes}
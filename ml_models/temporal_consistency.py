@@ -0,0 +1,275 @@
+import cv2
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+# Longest side of the grayscale thumbnails frame-to-frame metrics run on
+THUMBNAIL_SIDE = 64
+
+# Segments kept before neighbours are merged (and the segment size doubled)
+MAX_SEGMENTS = 64
+
+# Frames seen before a residual spike can be flagged
+SPIKE_WARMUP = 5
+SPIKE_ZSCORE = 4.0
+# Segment means this many frame-level standard deviations from the whole
+# video's mean are reported as anomalies
+SEGMENT_ZSCORE = 2.5
+
+# Smallest spread used for z-scores, relative to the mean and absolute
+MIN_RELATIVE_SPREAD = 0.05
+MIN_SPREAD = 1e-3
+
+
+def frame_thumbnail(frame: np.ndarray) -> np.ndarray:
+    """Grayscale float32 copy of a BGR frame with its longest side at most ``THUMBNAIL_SIDE``.
+
+    Thumbnails can be passed to ``add_frame`` in place of the frame.
+    """
+    h, w = frame.shape[:2]
+    scale = THUMBNAIL_SIDE / max(h, w)
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA) if scale < 1 else frame
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return small.astype(np.float32)
+
+
+class RunningStats:
+    """Count, mean, variance (Welford), min and max of a stream in O(1) memory"""
+
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "RunningStats"):
+        """Fold in the statistics of another stream (Chan et al.)"""
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self) -> float:
+        """Population variance, as ``np.var``"""
+        return self.m2 / self.count if self.count else 0.0
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.variance))
+
+    def spread(self) -> float:
+        return max(self.std, MIN_RELATIVE_SPREAD * abs(self.mean), MIN_SPREAD)
+
+    def summary(self) -> Dict[str, float]:
+        if not self.count:
+            return {"mean": 0.0, "std": 0.0, "min": 0.0, "max": 0.0}
+        return {"mean": float(self.mean), "std": self.std, "min": float(self.min), "max": float(self.max)}
+
+
+class _Segment:
+    """Statistics of a run of consecutive samples"""
+
+    def __init__(self, start: int):
+        self.start = start
+        self.start_time: Optional[float] = None
+        self.end_time: Optional[float] = None
+        self.pixels = {name: RunningStats() for name in TemporalConsistencyAnalyzer.PIXEL_METRICS}
+        self.scores: Dict[str, RunningStats] = {}
+        self.spikes = 0
+
+    def merge(self, other: "_Segment"):
+        if other.end_time is not None:
+            self.end_time = other.end_time
+        for name, stats in other.pixels.items():
+            self.pixels[name].merge(stats)
+        for name, stats in other.scores.items():
+            self.scores.setdefault(name, RunningStats()).merge(stats)
+        self.spikes += other.spikes
+
+
+class TemporalConsistencyAnalyzer:
+    """Streaming temporal analysis of sampled video frames.
+
+    Frames (``add_frame``) and their detector scores (``add_scores``) are
+    consumed one at a time, each in sample order, and only running
+    statistics are kept, so memory does not depend on the number of frames:
+
+    - Welford mean/variance of every score, plus the jitter of the primary
+      score between consecutive samples
+    - frame difference (mean absolute change of a grayscale thumbnail),
+      residual energy (that change after removing the global brightness
+      shift) and flicker (the brightness shift itself)
+    - per-segment statistics; when more than ``MAX_SEGMENTS`` exist,
+      neighbours are merged and the segment size doubles
+
+    ``summary()`` reports segments whose scores or flicker stand out from
+    the whole video, and abrupt residual spikes (cuts or splices).
+    """
+
+    PIXEL_METRICS = ("frame_difference", "residual_energy", "flicker")
+
+    def __init__(self, segment_size: int = 10, primary_score: str = "deepfake_probability"):
+        self.segment_size = max(1, segment_size)
+        self.primary_score = primary_score
+        self.pixels = {name: RunningStats() for name in self.PIXEL_METRICS}
+        self.scores: Dict[str, RunningStats] = {}
+        self.jitter = RunningStats()
+        self.spikes: List[Dict[str, Any]] = []
+        self._segments: List[_Segment] = []
+        self._previous: Optional[np.ndarray] = None
+        self._previous_score: Optional[float] = None
+        self._frames = 0
+        self._scored = 0
+
+    # Streams
+
+    def add_frame(self, frame: np.ndarray, timestamp_ms: Optional[float] = None):
+        """Update pixel metrics with the next sampled frame"""
+        index = self._frames
+        self._frames += 1
+        segment = self._segment(index)
+        if timestamp_ms is not None:
+            seconds = timestamp_ms / 1000.0
+            if segment.start_time is None:
+                segment.start_time = seconds
+            segment.end_time = seconds
+
+        thumbnail = frame_thumbnail(frame)
+        previous, self._previous = self._previous, thumbnail
+        if previous is None or previous.shape != thumbnail.shape:
+            return
+
+        difference = thumbnail - previous
+        shift = float(difference.mean())
+        residual = difference - shift
+        metrics = {
+            "frame_difference": float(np.abs(difference).mean()),
+            "residual_energy": float(np.square(residual).mean()),
+            "flicker": abs(shift)
+        }
+
+        residual_stats = self.pixels["residual_energy"]
+        if residual_stats.count >= SPIKE_WARMUP:
+            zscore = (metrics["residual_energy"] - residual_stats.mean) / residual_stats.spread()
+            if zscore > SPIKE_ZSCORE:
+                segment.spikes += 1
+                if len(self.spikes) < MAX_SEGMENTS:
+                    spike = {"sample": index, "zscore": float(zscore)}
+                    if timestamp_ms is not None:
+                        spike["time"] = timestamp_ms / 1000.0
+                    self.spikes.append(spike)
+
+        for name, value in metrics.items():
+            self.pixels[name].add(value)
+            segment.pixels[name].add(value)
+
+    def add_scores(self, scores: Dict[str, float]):
+        """Update score statistics with the detector results of the next sample"""
+        segment = self._segment(self._scored)
+        self._scored += 1
+        for name, value in scores.items():
+            self.scores.setdefault(name, RunningStats()).add(value)
+            segment.scores.setdefault(name, RunningStats()).add(value)
+
+        primary = scores.get(self.primary_score)
+        if primary is not None:
+            if self._previous_score is not None:
+                self.jitter.add(abs(primary - self._previous_score))
+            self._previous_score = primary
+
+    # Results
+
+    def score(self, name: str) -> RunningStats:
+        return self.scores.get(name, RunningStats())
+
+    def summary(self) -> Dict[str, Any]:
+        primary = self.score(self.primary_score)
+        anomalies = []
+        for segment in self._segments:
+            reasons = self._segment_reasons(segment, primary)
+            if reasons:
+                anomalies.append(self._describe(segment, reasons))
+
+        return {
+            "frames": self._frames,
+            "segment_size": self.segment_size,
+            "segments": len(self._segments),
+            self.primary_score: primary.summary(),
+            "score_jitter": float(self.jitter.mean),
+            **{name: stats.summary() for name, stats in self.pixels.items()},
+            "residual_spikes": self.spikes,
+            "anomalous_segments": anomalies
+        }
+
+    # Internals
+
+    def _segment(self, index: int) -> _Segment:
+        """Segment holding sample ``index``, opening (and compacting) as needed"""
+        position = index // self.segment_size
+        while position >= len(self._segments):
+            if len(self._segments) == MAX_SEGMENTS:
+                self._compact()
+                position = index // self.segment_size
+                continue
+            self._segments.append(_Segment(len(self._segments) * self.segment_size))
+        return self._segments[position]
+
+    def _compact(self):
+        merged = []
+        for i in range(0, len(self._segments), 2):
+            segment = self._segments[i]
+            if i + 1 < len(self._segments):
+                segment.merge(self._segments[i + 1])
+            merged.append(segment)
+        self._segments = merged
+        self.segment_size *= 2
+
+    def _segment_reasons(self, segment: _Segment, primary: RunningStats) -> List[str]:
+        reasons = []
+        seg_primary = segment.scores.get(self.primary_score)
+        if seg_primary is not None and primary.count > seg_primary.count:
+            zscore = (seg_primary.mean - primary.mean) / primary.spread()
+            if abs(zscore) > SEGMENT_ZSCORE:
+                reasons.append("score_shift")
+
+        flicker = self.pixels["flicker"]
+        seg_flicker = segment.pixels["flicker"]
+        if seg_flicker.count and flicker.count > seg_flicker.count:
+            if (seg_flicker.mean - flicker.mean) / flicker.spread() > SEGMENT_ZSCORE:
+                reasons.append("flicker")
+
+        if segment.spikes:
+            reasons.append("abrupt_change")
+        return reasons
+
+    def _describe(self, segment: _Segment, reasons: List[str]) -> Dict[str, Any]:
+        description: Dict[str, Any] = {
+            "first_sample": segment.start,
+            "last_sample": min(segment.start + self.segment_size, self._frames) - 1,
+            "reasons": reasons,
+            self.primary_score: segment.scores.get(self.primary_score, RunningStats()).summary()["mean"],
+            "flicker": segment.pixels["flicker"].summary()["mean"],
+            "residual_spikes": segment.spikes
+        }
+        if segment.start_time is not None:
+            description["start_time"] = segment.start_time
+            description["end_time"] = segment.end_time
+        return description
@@ -0,0 +1,101 @@
+"""Lightweight per-stage latency tracing.
+
+Stages are timed with the ``traced`` decorator or the ``span`` context
+manager and collected by the ``StageRecorder`` of the surrounding
+``recording()`` block (a context variable, so it follows asyncio tasks and
+``asyncio.to_thread``).  Stages nest: an outer stage's time includes its
+inner ones.
+
+With tracing disabled (the default until ``enable()``), or outside any
+``recording()`` block, a traced call costs one flag check.
+"""
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+_enabled = False
+_recorder: ContextVar[Optional["StageRecorder"]] = ContextVar("stage_recorder", default=None)
+
+
+def enable(enabled: bool = True):
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+class StageRecorder:
+    """Durations (seconds) of every traced stage call, by stage name"""
+
+    def __init__(self):
+        self.stages: Dict[str, List[float]] = {}
+
+    def add(self, name: str, seconds: float):
+        self.stages.setdefault(name, []).append(seconds)
+
+    def merge(self, stages: Dict[str, List[float]]):
+        """Fold in the stages recorded elsewhere (e.g. by a worker process)"""
+        for name, durations in stages.items():
+            self.stages.setdefault(name, []).extend(durations)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {"calls": len(durations), "total_ms": round(sum(durations) * 1000.0, 3)}
+            for name, durations in self.stages.items()
+        }
+
+
+@contextmanager
+def recording() -> Iterator[StageRecorder]:
+    """Collect the stages traced inside the block (and in tasks it starts)"""
+    recorder = StageRecorder()
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+def current() -> Optional[StageRecorder]:
+    return _recorder.get() if _enabled else None
+
+
+def merge(stages: Optional[Dict[str, List[float]]]):
+    """Add stages recorded in another process to the current recorder"""
+    recorder = current()
+    if recorder is not None and stages:
+        recorder.merge(stages)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    recorder = current()
+    if recorder is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.add(name, time.perf_counter() - start)
+
+
+def traced(name: str) -> Callable:
+    """Decorator timing every call of a (synchronous) function as stage ``name``"""
+    def decorate(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            recorder = _recorder.get() if _enabled else None
+            if recorder is None:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                recorder.add(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
@@ -0,0 +1,10 @@
+import os
+import sys
+
+_ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+# ml_models, the backend's app package, and the benchmarks that hold the
+# original per-pixel reference implementations
+sys.path.insert(0, _ROOT)
+sys.path.insert(0, os.path.join(_ROOT, 'backend'))
+sys.path.insert(0, os.path.join(_ROOT, 'benchmarks'))
@@ -0,0 +1,86 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from ml_models import precision
+from ml_models.ai_generated_detector import AIGeneratedDetector
+from ml_models.analysis_context import FrameBatch
+from ml_models.deepfake_detector import DeepFakeDetector
+from ml_models.image_forensics import ImageForensicsAnalyzer
+
+
+def _frames(count, h, w, seed=0):
+    """Smooth colour gradients plus noise, moving from frame to frame"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:h, 0:w]
+    frames = []
+    for i in range(count):
+        base = np.stack([
+            128 + 100 * np.sin((x + 7 * i) / 23.0),
+            128 + 90 * np.cos((y - 5 * i) / 17.0),
+            np.full((h, w), 40.0 * i % 255)
+        ], axis=-1)
+        frames.append(np.clip(base + rng.normal(0, 12, (h, w, 3)), 0, 255))
+    return np.ascontiguousarray(frames, dtype=np.uint8)
+
+
+@pytest.fixture(params=precision.PRECISIONS)
+def mode(request):
+    previous = precision.precision()
+    precision.set_precision(request.param)
+    yield request.param
+    precision.set_precision(previous)
+
+
+DETECTORS = {
+    "deepfake": (DeepFakeDetector, "analyze_image"),
+    "ai": (AIGeneratedDetector, "analyze_image"),
+    "forensics": (lambda: ImageForensicsAnalyzer(ela_map_size=16), "analyze"),
+}
+
+
+@pytest.mark.parametrize("name", DETECTORS)
+@pytest.mark.parametrize("shape", [(4, 48, 64), (3, 45, 61), (1, 32, 32)])
+def test_batch_equals_single_image_path(mode, name, shape):
+    make, single = DETECTORS[name]
+    detector = make()
+    frames = _frames(*shape)
+
+    batched = asyncio.run(detector.analyze_batch(frames))
+
+    expected = [asyncio.run(getattr(detector, single)(frame.copy())) for frame in frames]
+    assert batched == expected
+
+
+@pytest.mark.parametrize("name", DETECTORS)
+def test_batched_planes_are_shared_with_every_frame(name):
+    make, _ = DETECTORS[name]
+    frames = _frames(3, 40, 40)
+
+    with FrameBatch(frames) as batch:
+        asyncio.run(make().analyze_batch(frames, batch))
+        stacked = dict(batch._stacks)
+        contexts = [dict(context._cache) for context in batch.contexts]
+
+    assert len(stacked) >= 2
+    # Every frame picked up its slice of each stacked value instead of computing its own
+    for index, cache in enumerate(contexts):
+        for key, stack in stacked.items():
+            if isinstance(cache[key], np.ndarray):
+                assert np.shares_memory(cache[key], stack[index])
+            else:
+                assert cache[key] == stack[index]
+
+
+def test_failed_batched_plane_falls_back_to_frames(caplog):
+    detector = AIGeneratedDetector()
+    frames = _frames(2, 32, 32)
+    batch = FrameBatch(frames)
+    batch.prepare("test", [lambda: batch.get("broken", lambda: 1 / 0)])
+
+    assert "broken" not in batch._stacks
+    assert "a batched plane failed" in caplog.text
+    assert asyncio.run(detector.analyze_batch(frames, batch)) == [
+        asyncio.run(detector.analyze_image(frame)) for frame in frames
+    ]
@@ -0,0 +1,92 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from ml_models.image_forensics import ImageForensicsAnalyzer
+
+
+def _image(seed=0, shape=(48, 64, 3)):
+    # Smooth content with some noise, so the two re-encodes differ measurably
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[:shape[0], :shape[1]]
+    base = (np.sin(x / 5.0) + np.cos(y / 7.0)) * 60 + 128
+    noisy = base[..., None] + rng.normal(0, 12, size=shape)
+    return np.clip(noisy, 0, 255).astype(np.uint8)
+
+
+def _reference_ela(image, directory):
+    # ELA as it was computed through files on disk
+    pil_image = Image.fromarray(image)
+    high, low = os.path.join(directory, "high.jpg"), os.path.join(directory, "low.jpg")
+    pil_image.save(high, "JPEG", quality=95)
+    pil_image.save(low, "JPEG", quality=75)
+    diff = np.abs(np.array(Image.open(high)).astype(float) - np.array(Image.open(low)).astype(float))
+    return float(np.mean(diff) / 255.0)
+
+
+def test_default_score_matches_file_based_ela(tmp_path):
+    image = _image()
+
+    result = ImageForensicsAnalyzer()._error_level_analysis(image)
+
+    assert result == {"ela_score": pytest.approx(_reference_ela(image, tmp_path), abs=1e-12)}
+    assert result["ela_score"] > 0
+
+
+def test_nothing_is_written_to_the_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    ImageForensicsAnalyzer()._error_level_analysis(_image())
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_concurrent_analyses_do_not_interfere():
+    analyzer = ImageForensicsAnalyzer()
+    images = [_image(seed) for seed in range(8)]
+    expected = [analyzer._error_level_analysis(image) for image in images]
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(analyzer._error_level_analysis, images * 4))
+
+    assert results == expected * 4
+
+
+def test_rgba_image_is_analyzed_as_rgb():
+    image = _image()
+    rgba = np.dstack([image, np.full(image.shape[:2], 200, dtype=np.uint8)])
+    analyzer = ImageForensicsAnalyzer()
+
+    result = analyzer._error_level_analysis(rgba)
+
+    assert "error" not in result
+    assert result == analyzer._error_level_analysis(image)
+
+
+def test_every_extra_quality_is_scored_against_the_reference():
+    image = _image()
+
+    result = ImageForensicsAnalyzer(ela_qualities=(95, 75, 50))._error_level_analysis(image)
+
+    levels = result["ela_levels"]
+    assert set(levels) == {"75", "50"}
+    assert levels["75"] == ImageForensicsAnalyzer()._error_level_analysis(image)["ela_score"]
+    assert result["ela_score"] == pytest.approx((levels["75"] + levels["50"]) / 2)
+
+
+def test_ela_map_is_downsampled_to_its_longest_side():
+    result = ImageForensicsAnalyzer(ela_map_size=16)._error_level_analysis(_image(shape=(48, 64, 3)))
+
+    ela_map = np.array(result["ela_map"])
+    assert ela_map.shape == (12, 16)
+    assert 0.0 <= ela_map.min() and ela_map.max() <= 1.0
+
+
+def test_single_quality_is_reported_as_an_error():
+    result = ImageForensicsAnalyzer(ela_qualities=(95,))._error_level_analysis(_image())
+
+    assert result["ela_score"] == 0.0
+    assert "two quality levels" in result["error"]
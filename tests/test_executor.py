@@ -0,0 +1,90 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.services.executor import DetectorExecutor, ExecutorOverloaded
+
+
+def test_full_queue_is_rejected():
+    executor = DetectorExecutor("thread", max_workers=1, queue_depth=1, retry_after=7)
+    release = threading.Event()
+
+    async def run():
+        tasks = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.02)
+        with pytest.raises(ExecutorOverloaded) as overloaded:
+            await executor.run(release.wait)
+        release.set()
+        await asyncio.gather(*tasks)
+        return overloaded.value
+
+    try:
+        overloaded = asyncio.run(run())
+    finally:
+        executor.shutdown()
+
+    assert overloaded.retry_after == 7
+    assert executor.in_flight == 0
+
+
+def test_cancelled_caller_keeps_the_slot_until_the_task_ends():
+    executor = DetectorExecutor("thread", max_workers=1)
+    started, release = threading.Event(), threading.Event()
+
+    def task():
+        started.set()
+        release.wait()
+
+    async def run():
+        caller = asyncio.ensure_future(executor.run(task))
+        await asyncio.to_thread(started.wait)
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        # The pool is still running the task
+        held = executor.in_flight, executor.has_capacity()
+
+        waiter = asyncio.ensure_future(executor.wait_for_capacity())
+        await asyncio.sleep(0.02)
+        waiting = not waiter.done()
+        release.set()
+        await asyncio.wait_for(waiter, 1.0)
+        return held, waiting
+
+    try:
+        held, waiting = asyncio.run(run())
+    finally:
+        release.set()
+        executor.shutdown()
+
+    assert held == (1, False)
+    assert waiting
+    assert executor.in_flight == 0
+
+
+def test_cancelled_queued_task_frees_its_slot():
+    executor = DetectorExecutor("thread", max_workers=1, queue_depth=1)
+    release = threading.Event()
+
+    async def run():
+        running = asyncio.ensure_future(executor.run(release.wait))
+        queued = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.02)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        await asyncio.sleep(0.02)
+        in_flight = executor.in_flight
+        release.set()
+        await running
+        return in_flight
+
+    try:
+        in_flight = asyncio.run(run())
+    finally:
+        release.set()
+        executor.shutdown()
+
+    assert in_flight == 1
+    assert executor.in_flight == 0
@@ -0,0 +1,113 @@
+import cv2
+import numpy as np
+import pytest
+
+from ml_models.forensic_tiles import heatmap_scores, tile_grid, tile_heatmaps
+from ml_models.image_forensics import ImageForensicsAnalyzer, localized_anomalies
+
+
+def _noisy(shape, seed=0, sigma=10.0):
+    rng = np.random.default_rng(seed)
+    return np.clip(rng.normal(128, sigma, size=shape), 0, 255).astype(np.uint8)
+
+
+def _tiles(plane, rows, cols, tile_h, tile_w):
+    for row in range(rows):
+        for col in range(cols):
+            yield row, col, plane[row * tile_h:(row + 1) * tile_h, col * tile_w:(col + 1) * tile_w]
+
+
+@pytest.mark.parametrize("shape,grid,expected", [
+    ((480, 640), 16, (12, 16, 40, 40)),
+    ((640, 480, 3), 16, (16, 12, 40, 40)),
+    ((100, 104), 4, (3, 4, 33, 26)),
+    # Tiles never get smaller than a JPEG block
+    ((32, 40), 16, (4, 5, 8, 8)),
+    ((5, 7), 16, (1, 1, 5, 7)),
+])
+def test_tile_grid(shape, grid, expected):
+    assert tile_grid(shape, grid) == expected
+
+
+@pytest.mark.parametrize("shape", [(96, 128, 3), (101, 67, 3), (64, 64)])
+def test_heatmaps_match_per_tile_statistics(shape):
+    image = _noisy(shape)
+    rows, cols, tile_h, tile_w = tile_grid(image.shape, 4)
+
+    heatmaps = tile_heatmaps(image, 4)
+
+    assert set(heatmaps) == {"noise", "blockiness", "cfa"}
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    green = image if image.ndim == 2 else image[:, :, 1]
+    for row, col, tile in _tiles(gray, rows, cols, tile_h, tile_w):
+        mad = np.median(np.abs(tile.astype(np.float32) - np.median(tile)))
+        assert heatmaps["noise"][row, col] == pytest.approx(mad)
+    for row, col, tile in _tiles(green, rows, cols, tile_h, tile_w):
+        assert heatmaps["cfa"][row, col] == pytest.approx(np.var(tile.astype(np.float64)), rel=1e-6)
+
+
+def test_blockiness_singles_out_a_jpeg_blocked_tile():
+    image = _noisy((64, 64), sigma=20.0)
+    # Flat 8x8 blocks in the top-left tile: steps only across the block grid
+    blocks = np.kron(_noisy((4, 4), seed=1, sigma=40.0), np.ones((8, 8), dtype=np.uint8))
+    image[:32, :32] = blocks
+
+    blockiness = tile_heatmaps(image, 2)["blockiness"]
+
+    assert blockiness[0, 0] > 10
+    assert np.all(np.abs(blockiness.ravel()[1:] - 1.0) < 0.2)
+
+
+def test_ela_band_matches_the_whole_image_error():
+    analyzer = ImageForensicsAnalyzer()
+    image = _noisy((96, 80, 3))
+    rows, cols, tile_h, tile_w = tile_grid(image.shape, 4)
+
+    ela = tile_heatmaps(image, 4, analyzer._ela_error)["ela"]
+
+    error = analyzer._ela_error(image)
+    for row, col, tile in _tiles(error, rows, cols, tile_h, tile_w):
+        assert ela[row, col] == pytest.approx(tile.mean(), abs=1e-6)
+
+
+def test_scores_point_at_the_outlying_tile_with_its_sign():
+    heatmap = np.full((4, 5), 10.0) + np.random.default_rng(0).normal(0, 0.1, (4, 5))
+    heatmap[2, 3] = 2.0
+
+    scores = heatmap_scores(heatmap)
+
+    assert scores["extreme_tile"] == [2, 3]
+    assert scores["extreme_zscore"] < -6
+    assert scores["max"] == pytest.approx(heatmap.max())
+    assert scores["mean"] == pytest.approx(heatmap.mean())
+
+
+def test_uniform_heatmap_has_no_outlier():
+    heatmap = np.full((3, 3), 5.0)
+    heatmap[1, 1] = 5.001
+
+    assert abs(heatmap_scores(heatmap)["extreme_zscore"]) < 1
+    assert abs(heatmap_scores(np.zeros((2, 2)))["extreme_zscore"]) == 0
+
+
+def test_localized_anomalies_reports_only_strong_outliers():
+    tile_analysis = {"scores": {
+        "ela": {"extreme_zscore": 7.5, "extreme_tile": [1, 2]},
+        "noise": {"extreme_zscore": -3.0, "extreme_tile": [0, 0]},
+        "cfa": {"extreme_zscore": 50.0, "extreme_tile": [3, 3]}
+    }}
+
+    assert localized_anomalies(tile_analysis) == {"ela": [1, 2]}
+    assert localized_anomalies(None) == {}
+    assert localized_anomalies({"error": "undecodable"}) == {}
+
+
+def test_spliced_noise_is_localized():
+    image = _noisy((128, 128, 3), sigma=2.0)
+    image[64:96, 32:64] = _noisy((32, 32, 3), seed=2, sigma=30.0)
+    analyzer = ImageForensicsAnalyzer(tile_grid=4)
+
+    tiles = analyzer._tile_analysis(image)
+
+    assert tiles["grid"] == [4, 4] and tiles["tile_size"] == [32, 32]
+    assert localized_anomalies(tiles)["noise"] == [2, 1]
@@ -0,0 +1,162 @@
+import io
+import struct
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from ml_models.jpeg_structure import IJG_LUMA, analyze_jpeg_structure, estimate_quality
+
+
+def _jpeg(width=64, height=48, **save_options):
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "JPEG", **save_options)
+    return buffer.getvalue()
+
+
+def _with_segment(jpeg, marker, payload):
+    # Inserted right after SOI, where encoders put their APP segments
+    return jpeg[:2] + struct.pack(">BBH", 0xFF, marker, len(payload) + 2) + payload + jpeg[2:]
+
+
+def _with_exif(jpeg, thumbnail=b""):
+    # A bare TIFF header; the parser only looks for the thumbnail's SOI
+    return _with_segment(jpeg, 0xE1, b"Exif\x00\x00II*\x00\x08\x00\x00\x00" + thumbnail)
+
+
+@pytest.mark.parametrize("quality", [5, 30, 50, 75, 90, 100])
+def test_quality_of_libjpeg_tables_is_exact(quality):
+    result = analyze_jpeg_structure(_jpeg(quality=quality))
+
+    assert result["quality_estimate"] == quality
+    assert result["chroma_quality_estimate"] == quality
+    assert result["standard_tables"] is True
+    assert result["tables"] == 2
+
+
+def test_estimate_quality_finds_the_closest_table():
+    table = (IJG_LUMA * 2).copy()
+    table[0] += 3
+
+    assert estimate_quality(IJG_LUMA) == {"quality": 50, "exact": True}
+    assert estimate_quality(table) == {"quality": 25, "exact": False}
+
+
+def test_frame_header_and_markers():
+    result = analyze_jpeg_structure(_jpeg(width=64, height=48, quality=80))
+
+    assert (result["width"], result["height"], result["components"]) == (64, 48, 3)
+    assert result["subsampling"] == "4:2:0"
+    assert result["progressive"] is False
+    assert result["markers"][-1] == "SOS"
+    assert {"DQT", "SOF0", "DHT"} <= set(result["markers"])
+    assert result["thumbnail"] is None
+    assert result["indicators"] == [] and result["double_compression_suspected"] is False
+
+
+def test_subsampling_and_progressive_are_read():
+    result = analyze_jpeg_structure(_jpeg(quality=80, subsampling=0, progressive=True))
+
+    assert result["subsampling"] == "4:4:4"
+    assert result["progressive"] is True
+    assert "SOF2" in result["markers"]
+
+
+def test_custom_tables_are_not_standard():
+    luma = list(range(1, 65))
+    result = analyze_jpeg_structure(_jpeg(qtables=[luma, luma]))
+
+    assert result["standard_tables"] is False
+    assert result["table_mismatch"] is False
+
+
+def test_exif_with_libjpeg_tables_is_a_table_mismatch():
+    assert analyze_jpeg_structure(_with_exif(_jpeg(quality=90)))["table_mismatch"] is True
+    assert analyze_jpeg_structure(_jpeg(quality=90))["table_mismatch"] is False
+
+
+def test_thumbnail_compressed_lighter_than_the_image():
+    thumbnail = _jpeg(width=32, height=24, quality=95)
+    content = _with_exif(_jpeg(width=64, height=48, quality=60), thumbnail)
+
+    result = analyze_jpeg_structure(content)
+
+    assert result["thumbnail"]["quality_estimate"] == 95
+    assert result["thumbnail"]["size"] == [32, 24]
+    assert result["thumbnail"]["matches_main_tables"] is False
+    assert result["thumbnail"]["aspect_ratio_mismatch"] is False
+    assert result["indicators"] == ["Image is compressed harder than its Exif thumbnail"]
+    assert result["double_compression_suspected"] is True
+
+
+def test_thumbnail_of_another_shape_means_a_crop():
+    thumbnail = _jpeg(width=32, height=32, quality=80)
+    content = _with_exif(_jpeg(width=64, height=32, quality=80), thumbnail)
+
+    result = analyze_jpeg_structure(content)
+
+    assert result["thumbnail"]["matches_main_tables"] is True
+    assert result["indicators"] == ["Exif thumbnail does not match the image shape"]
+    assert result["double_compression_suspected"] is True
+
+
+@pytest.mark.parametrize("width,height", [(160, 120), (120, 160)])
+def test_standard_thumbnail_sizes_say_nothing_about_the_shape(width, height):
+    thumbnail = _jpeg(width=width, height=height, quality=80)
+    content = _with_exif(_jpeg(width=64, height=64, quality=80), thumbnail)
+
+    result = analyze_jpeg_structure(content)
+
+    assert result["thumbnail"]["aspect_ratio_mismatch"] is False
+    assert result["indicators"] == []
+
+
+def test_camera_image_resaved_by_adobe_software():
+    content = _with_segment(_with_exif(_jpeg(quality=80)), 0xEE, b"Adobe\x00\x64\x00\x00\x00\x00\x01")
+
+    result = analyze_jpeg_structure(content)
+
+    assert result["markers"][:2] == ["Adobe", "Exif"]
+    assert result["indicators"] == ["Camera image re-saved by Adobe software"]
+    assert result["double_compression_suspected"] is True
+
+
+@pytest.mark.parametrize("content", [b"", b"\xff\xd8", b"\x89PNG\r\n\x1a\n" + b"\x00" * 16, b"GIF89a"])
+def test_non_jpeg_data_is_not_analyzed(content):
+    assert analyze_jpeg_structure(content) is None
+
+
+def test_truncated_headers_are_reported_not_raised():
+    content = _with_exif(_jpeg(quality=80), _jpeg(width=16, height=16))
+    header_end = content.index(b"\xff\xda")
+
+    for length in range(4, header_end):
+        result = analyze_jpeg_structure(content[:length])
+        assert result is not None
+        assert result.get("truncated") or result.get("malformed") or "SOS" not in result["markers"]
+
+
+def test_corrupted_headers_never_raise():
+    content = _with_exif(_jpeg(quality=80), _jpeg(width=16, height=16))
+    header_end = content.index(b"\xff\xda") + 4
+    rng = np.random.default_rng(0)
+
+    for _ in range(2000):
+        corrupted = bytearray(content[:header_end + 64])
+        for position in rng.integers(2, header_end, size=rng.integers(1, 4)):
+            corrupted[position] = rng.integers(0, 256)
+        result = analyze_jpeg_structure(bytes(corrupted))
+        assert isinstance(result, dict)
+        assert isinstance(result["indicators"], list)
+
+
+def test_dqt_segment_shorter_than_its_table_is_malformed():
+    # A DQT claiming one 8-bit table but carrying only 10 of its 64 values
+    content = b"\xff\xd8" + struct.pack(">BBH", 0xFF, 0xDB, 13) + b"\x00" + bytes(range(1, 11)) + b"\xff\xd9"
+
+    result = analyze_jpeg_structure(content)
+
+    assert result["malformed"] is True
+    assert result["markers"] == ["DQT"]
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from bench_lbp import reference_local_binary_pattern
+from ml_models.lbp import local_binary_pattern
+
+
+@pytest.mark.parametrize("shape", [(48, 64), (37, 29), (3, 3)])
+@pytest.mark.parametrize("points,radius", [(8, 1), (8, 2), (4, 1), (8, 3)])
+def test_matches_reference_bit_for_bit(shape, points, radius):
+    gray = np.random.default_rng(0).integers(0, 256, size=shape, dtype=np.uint8)
+
+    result = local_binary_pattern(gray, points, radius)
+
+    expected = reference_local_binary_pattern(gray, points, radius)
+    assert result.dtype == expected.dtype
+    assert np.array_equal(result, expected)
+
+
+def test_sixteen_points_on_16_bit_image_matches_reference():
+    gray = np.random.default_rng(1).integers(0, 1 << 16, size=(24, 32), dtype=np.uint16)
+
+    result = local_binary_pattern(gray, points=16, radius=2)
+
+    expected = reference_local_binary_pattern(gray, points=16, radius=2)
+    assert result.dtype == expected.dtype
+    assert np.array_equal(result, expected)
+
+
+def test_flat_image_sets_every_bit():
+    gray = np.full((8, 8), 7, dtype=np.uint8)
+
+    result = local_binary_pattern(gray)
+
+    assert np.array_equal(result, reference_local_binary_pattern(gray))
+    assert (result[1:-1, 1:-1] == 255).all()
+
+
+@pytest.mark.parametrize("method", ["default", "ror", "uniform", "nri_uniform"])
+def test_stack_matches_each_frame(method):
+    frames = np.random.default_rng(2).integers(0, 256, size=(3, 20, 30), dtype=np.uint8)
+
+    stacked = local_binary_pattern(frames, 8, 1, method)
+
+    for frame, codes in zip(frames, stacked):
+        assert np.array_equal(codes, local_binary_pattern(frame, 8, 1, method))
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from bench_local_entropy import reference_local_entropy, synthetic_gray
+from ml_models.local_entropy import ENTROPY_ABS_TOLERANCE, local_entropy, quantization_error_bound
+
+
+@pytest.fixture(scope="module")
+def gray():
+    return synthetic_gray(40, 56, np.random.default_rng(0))
+
+
+@pytest.fixture(scope="module")
+def reference(gray):
+    return reference_local_entropy(gray).astype(np.float64)
+
+
+@pytest.mark.parametrize("method", ["sliding", "integral"])
+def test_full_resolution_within_tolerance(gray, reference, method):
+    result = local_entropy(gray, 7, 256, method)
+
+    assert np.abs(result - reference).max() <= ENTROPY_ABS_TOLERANCE
+
+
+@pytest.mark.parametrize("method", ["sliding", "integral"])
+@pytest.mark.parametrize("bins", [64, 32, 8])
+def test_quantized_within_bound_below_reference(gray, reference, method, bins):
+    result = local_entropy(gray, 7, bins, method)
+
+    # Merging grey levels can only lower a window's entropy, by at most the bound
+    diff = reference - result
+    assert diff.min() >= -ENTROPY_ABS_TOLERANCE
+    assert diff.max() <= quantization_error_bound(bins) + ENTROPY_ABS_TOLERANCE
+
+
+@pytest.mark.parametrize("kernel_size", [3, 5, 9])
+def test_other_kernel_sizes_within_tolerance(kernel_size):
+    gray = np.random.default_rng(1).integers(0, 256, size=(23, 31), dtype=np.uint8)
+
+    expected = reference_local_entropy(gray, kernel_size).astype(np.float64)
+
+    for method in ("sliding", "integral"):
+        result = local_entropy(gray, kernel_size, 256, method)
+        assert np.abs(result - expected).max() <= ENTROPY_ABS_TOLERANCE
+
+
+@pytest.mark.parametrize("method", ["sliding", "integral"])
+def test_stack_matches_each_frame(method):
+    frames = np.random.default_rng(2).integers(0, 256, size=(3, 20, 30), dtype=np.uint8)
+
+    stacked = local_entropy(frames, 7, 256, method)
+
+    for frame, entropy in zip(frames, stacked):
+        assert np.array_equal(entropy, local_entropy(frame, 7, 256, method))
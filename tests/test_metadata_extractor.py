@@ -0,0 +1,382 @@
+import io
+import struct
+import tracemalloc
+import zlib
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.utils import metadata_extractor
+from app.utils.metadata_extractor import (MAX_TEXT_LENGTH, MAX_XMP_LENGTH, detect_generator, parse_exif,
+                                          parse_image_metadata, parse_video_container)
+
+XMP_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+AI_SOURCE = "http://cv.iptc.org/newscodes/digitalsourcetype/trainedAlgorithmicMedia"
+
+
+# EXIF
+
+def _ascii(tag, text):
+    return tag, 2, len(text) + 1, text.encode("latin-1") + b"\x00"
+
+
+def _short(tag, value, endian="<"):
+    return tag, 3, 1, struct.pack(endian + "H", value)
+
+
+def _ifd(entries, offset, endian):
+    """An IFD at ``offset``, followed by the values that do not fit in its entries"""
+    data_offset = offset + 2 + 12 * len(entries) + 4
+    table, extra = struct.pack(endian + "H", len(entries)), b""
+    for tag, field_type, count, raw in entries:
+        if len(raw) <= 4:
+            value = raw.ljust(4, b"\x00")
+        else:
+            value = struct.pack(endian + "I", data_offset + len(extra))
+            extra += raw
+        table += struct.pack(endian + "HHI", tag, field_type, count) + value
+    return table + b"\x00" * 4 + extra
+
+
+def _tiff(entries, exif_entries=None, endian="<"):
+    header = (b"II" if endian == "<" else b"MM") + struct.pack(endian + "HI", 42, 8)
+    if exif_entries is None:
+        return header + _ifd(entries, 8, endian)
+    pointer = lambda offset: (0x8769, 4, 1, struct.pack(endian + "I", offset))
+    exif_offset = 8 + len(_ifd(entries + [pointer(0)], 8, endian))
+    ifd0 = _ifd(entries + [pointer(exif_offset)], 8, endian)
+    return header + ifd0 + _ifd(exif_entries, exif_offset, endian)
+
+
+@pytest.mark.parametrize("endian", ["<", ">"])
+def test_exif_tags_of_both_byte_orders(endian):
+    tiff = _tiff(
+        [_ascii(0x010F, "Canon"), _ascii(0x0110, "EOS R5"), _short(0x0112, 6, endian),
+         _ascii(0x0131, "Firmware 1.8.1"), (0x8825, 4, 1, struct.pack(endian + "I", 0))],
+        [_ascii(0x9003, "2024:05:01 10:00:00"), (0xA002, 4, 1, struct.pack(endian + "I", 8192))],
+        endian
+    )
+
+    assert parse_exif(tiff) == {
+        "Make": "Canon", "Model": "EOS R5", "Orientation": 6, "Software": "Firmware 1.8.1",
+        "DateTimeOriginal": "2024:05:01 10:00:00", "PixelXDimension": 8192, "GPSInfo": True
+    }
+
+
+@pytest.mark.parametrize("code,encoded", [
+    (b"ASCII\x00\x00\x00", b"Steps: 20, Sampler: Euler\x00"),
+    (b"UNICODE\x00", "Steps: 20, Sampler: Euler".encode("utf-16-be")),
+    (b"UNICODE\x00", "Steps: 20, Sampler: Euler".encode("utf-16-le")),
+    (b"\x00" * 8, "Steps: 20, Sampler: Euler".encode("utf-8")),
+])
+def test_user_comment_character_codes(code, encoded):
+    raw = code + encoded
+    tiff = _tiff([], [(0x9286, 7, len(raw), raw)])
+
+    assert parse_exif(tiff) == {"UserComment": "Steps: 20, Sampler: Euler"}
+
+
+def test_long_text_is_cut_to_the_limit():
+    tiff = _tiff([_ascii(0x010E, "x" * (MAX_TEXT_LENGTH + 100))])
+
+    assert parse_exif(tiff)["ImageDescription"] == "x" * MAX_TEXT_LENGTH
+
+
+def test_values_pointing_outside_the_block_are_skipped():
+    # Claims four billion characters at an offset past the end
+    tiff = b"II*\x00\x08\x00\x00\x00" + struct.pack("<HHHII", 1, 0x010F, 2, 0xFFFFFFFF, 0x7FFFFFF0) + b"\x00" * 4
+
+    assert parse_exif(tiff) == {}
+
+
+@pytest.mark.parametrize("tiff", [b"", b"II*\x00", b"XX*\x00\x08\x00\x00\x00", b"\x00" * 64])
+def test_non_tiff_data_has_no_tags(tiff):
+    assert parse_exif(tiff) == {}
+
+
+def test_ifd_past_the_end_is_malformed():
+    assert parse_exif(b"II*\x00\xff\x00\x00\x00") == {"malformed": True}
+    tiff = _tiff([_ascii(0x010F, "Canon"), _ascii(0x0110, "EOS R5")])
+    assert parse_exif(tiff[:20])["malformed"] is True
+
+
+def test_corrupted_exif_never_raises():
+    tiff = _tiff([_ascii(0x010F, "Canon"), _short(0x0112, 1), _ascii(0x0131, "Editor 2.0")],
+                 [_ascii(0x9003, "2024:05:01 10:00:00"), (0x9286, 7, 16, b"UNICODE\x00" + b"a\x00" * 4)])
+    rng = np.random.default_rng(0)
+
+    for _ in range(3000):
+        corrupted = bytearray(tiff)
+        for position in rng.integers(2, len(tiff), size=rng.integers(1, 5)):
+            corrupted[position] = rng.integers(0, 256)
+        assert isinstance(parse_exif(bytes(corrupted)), dict)
+
+
+# Images
+
+def _image_bytes(kind):
+    buffer = io.BytesIO()
+    Image.fromarray(np.zeros((6, 10, 3), dtype=np.uint8)).save(buffer, kind)
+    return buffer.getvalue()
+
+
+def _jpeg_with(*segments):
+    jpeg = _image_bytes("JPEG")
+    inserted = b"".join(struct.pack(">BBH", 0xFF, marker, len(payload) + 2) + payload for marker, payload in segments)
+    return jpeg[:2] + inserted + jpeg[2:]
+
+
+def _chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def _png_with(*chunks):
+    png = _image_bytes("PNG")
+    # After the signature and IHDR, where encoders put their text
+    return png[:33] + b"".join(_chunk(kind, data) for kind, data in chunks) + png[33:]
+
+
+def test_jpeg_exif_xmp_and_comment():
+    xmp = b'<x:xmpmeta><rdf:Description xmp:CreatorTool="Editor 2.0"/></x:xmpmeta>'
+    content = _jpeg_with((0xE1, b"Exif\x00\x00" + _tiff([_ascii(0x0131, "Editor 2.0")])),
+                         (0xE1, XMP_HEADER + xmp), (0xFE, b"a comment\x00"))
+
+    metadata = parse_image_metadata(content)
+
+    assert metadata == {"format": "JPEG", "exif": {"Software": "Editor 2.0"},
+                        "xmp": {"creator_tool": "Editor 2.0"}, "comment": "a comment",
+                        "height": 6, "width": 10}
+
+
+def test_xmp_property_forms():
+    packet = (b'<xmp:CreatorTool>Editor 2.0</xmp:CreatorTool>'
+              b'<Iptc4xmpExt:DigitalSourceType rdf:resource="' + AI_SOURCE.encode() + b'"/>')
+
+    assert metadata_extractor.parse_xmp(packet) == {"creator_tool": "Editor 2.0", "digital_source_type": AI_SOURCE}
+
+
+def test_png_text_chunks_and_size():
+    content = _png_with(
+        (b"tEXt", b"parameters\x00a cat\nSteps: 20, Sampler: Euler"),
+        (b"zTXt", b"prompt\x00\x00" + zlib.compress(b'{"1": {}}')),
+        (b"iTXt", b"Software\x00\x00\x00en\x00Software\x00Generator \xc3\xa9"),
+        (b"iTXt", b"Comment\x00\x01\x00\x00\x00" + zlib.compress("compressed é".encode())),
+        (b"eXIf", _tiff([_ascii(0x010F, "Canon")])),
+    )
+
+    metadata = parse_image_metadata(content)
+
+    assert (metadata["width"], metadata["height"]) == (10, 6)
+    assert metadata["text_chunks"] == {"parameters": "a cat\nSteps: 20, Sampler: Euler", "prompt": '{"1": {}}',
+                                       "Software": "Generator é", "Comment": "compressed é"}
+    assert metadata["exif"] == {"Make": "Canon"}
+    assert "malformed" not in metadata
+
+
+@pytest.mark.parametrize("kind,header", [(b"zTXt", b"prompt\x00\x00"), (b"iTXt", b"prompt\x00\x01\x00\x00\x00")])
+def test_compressed_png_text_is_inflated_only_to_the_limit(kind, header):
+    content = _png_with((kind, header + zlib.compress(b"a" * (64 * 1024 * 1024), 9)))
+
+    tracemalloc.start()
+    try:
+        metadata = parse_image_metadata(content)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert metadata["text_chunks"]["prompt"] == "a" * MAX_TEXT_LENGTH
+    assert peak < 4 * 1024 * 1024
+
+
+def test_compressed_xmp_is_inflated_only_to_its_limit():
+    # A packet padded past the limit, with its only property beyond it
+    packet = b" " * MAX_XMP_LENGTH + b'<xmp:CreatorTool>hidden</xmp:CreatorTool>'
+    bomb = zlib.compress(packet, 9)
+
+    metadata = parse_image_metadata(_png_with((b"iTXt", b"XML:com.adobe.xmp\x00\x01\x00\x00\x00" + bomb)))
+
+    assert metadata["xmp"] == {}
+
+
+def test_png_chunk_overrunning_the_file_is_malformed():
+    content = _png_with((b"zTXt", b"prompt\x00\x00not zlib"))
+
+    assert parse_image_metadata(content)["malformed"] is True
+    truncated = parse_image_metadata(content[:40])
+    assert truncated["format"] == "PNG" and truncated["width"] == 10
+
+
+def test_corrupted_image_headers_never_raise():
+    jpeg = _jpeg_with((0xE1, b"Exif\x00\x00" + _tiff([_ascii(0x0131, "Editor 2.0")])), (0xFE, b"comment"))
+    png = _png_with((b"tEXt", b"Software\x00Editor"), (b"zTXt", b"prompt\x00\x00" + zlib.compress(b"{}")))
+    rng = np.random.default_rng(0)
+
+    for content in (jpeg, png):
+        for _ in range(2000):
+            corrupted = bytearray(content[:200])
+            for position in rng.integers(8, len(corrupted), size=rng.integers(1, 4)):
+                corrupted[position] = rng.integers(0, 256)
+            assert isinstance(parse_image_metadata(bytes(corrupted)), dict)
+
+
+# Videos
+
+def _box(kind, payload=b""):
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+def _hdlr(handler):
+    return _box(b"hdlr", b"\x00" * 8 + handler + b"\x00" * 12 + b"\x00")
+
+
+def _video_track(codec=b"avc1", width=320, height=240, compressor=b"Encoder X"):
+    entry = (struct.pack(">I4s", 86, codec) + b"\x00" * 24 + struct.pack(">HH", width, height) + b"\x00" * 14
+             + bytes([len(compressor)]) + compressor.ljust(31, b"\x00") + b"\x00" * 4)
+    stsd = _box(b"stsd", b"\x00" * 4 + struct.pack(">I", 1) + entry)
+    return _box(b"trak", _box(b"mdia", _hdlr(b"vide") + _box(b"minf", _box(b"stbl", stsd))))
+
+
+def _audio_track():
+    stsd = _box(b"stsd", b"\x00" * 4 + struct.pack(">I", 1) + struct.pack(">I4s", 16, b"mp4a") + b"\x00" * 8)
+    return _box(b"trak", _box(b"mdia", _hdlr(b"soun") + _box(b"minf", _box(b"stbl", stsd))))
+
+
+def _mdta(entries):
+    """QuickTime meta box with mdta keys and their ilst values"""
+    keys = b"".join(struct.pack(">I", 8 + len(key)) + b"mdta" + key for key, _ in entries)
+    items = b"".join(
+        _box(struct.pack(">I", index + 1), _box(b"data", struct.pack(">II", 1, 0) + value))
+        for index, (_, value) in enumerate(entries)
+    )
+    return _box(b"meta", _hdlr(b"mdta") + _box(b"keys", b"\x00" * 4 + struct.pack(">I", len(entries)) + keys)
+                + _box(b"ilst", items))
+
+
+def _mvhd(timescale=1000, duration=5000):
+    return _box(b"mvhd", b"\x00" * 12 + struct.pack(">II", timescale, duration) + b"\x00" * 80)
+
+
+def _mp4(path, moov, brand=b"isom", moov_first=False):
+    ftyp = _box(b"ftyp", brand + b"\x00\x00\x02\x00" + brand)
+    mdat = _box(b"mdat", b"\x00" * 4096)
+    moov = _box(b"moov", moov)
+    path.write_bytes(ftyp + (moov + mdat if moov_first else mdat + moov))
+    return str(path)
+
+
+@pytest.mark.parametrize("moov_first", [False, True])
+def test_container_tracks_and_tags(tmp_path, moov_first):
+    moov = (_mvhd() + _video_track() + _audio_track()
+            + _box(b"udta", _box(b"\xa9too", struct.pack(">HH", 9, 0) + b"Lavf60.16"))
+            + _mdta([(b"com.apple.quicktime.software", b"17.4"), (b"com.apple.quicktime.make", b"Apple")]))
+
+    container = parse_video_container(_mp4(tmp_path / "a.mp4", moov, moov_first=moov_first))
+
+    assert container == {
+        "format": "MP4", "brand": "isom", "duration": 5.0,
+        "tracks": [
+            {"type": "video", "format": "avc1", "codec": "h264", "width": 320, "height": 240,
+             "compressor": "Encoder X"},
+            {"type": "audio", "format": "mp4a", "codec": "aac"}
+        ],
+        "video_codec": "h264", "resolution": "320x240", "audio_codec": "aac",
+        "encoder": "Lavf60.16", "software": "17.4", "make": "Apple", "compressor": "Encoder X"
+    }
+
+
+def test_quicktime_brand_is_mov(tmp_path):
+    container = parse_video_container(_mp4(tmp_path / "a.mov", _mvhd(600, 1200), brand=b"qt  "))
+
+    assert container["format"] == "MOV" and container["duration"] == 2.0
+
+
+def test_deeply_nested_boxes_are_malformed(tmp_path):
+    nested = _mvhd()
+    for _ in range(metadata_extractor.MAX_BOX_DEPTH + 5):
+        nested = _box(b"edts", nested)
+
+    container = parse_video_container(_mp4(tmp_path / "a.mp4", nested))
+
+    assert container["malformed"] is True
+
+
+def test_oversized_moov_is_not_read(tmp_path, monkeypatch):
+    monkeypatch.setattr(metadata_extractor, "MAX_MOOV_SIZE", 100)
+
+    container = parse_video_container(_mp4(tmp_path / "a.mp4", _mvhd() + _video_track()))
+
+    assert container == {"format": "MP4", "brand": "isom", "moov_found": False}
+
+
+def test_mdta_keys_with_an_impossible_count(tmp_path):
+    keys = _box(b"keys", b"\x00" * 4 + struct.pack(">I", 0xFFFFFFFF) + struct.pack(">I", 8) + b"mdta")
+    moov = _mvhd() + _box(b"meta", _hdlr(b"mdta") + keys)
+
+    container = parse_video_container(_mp4(tmp_path / "a.mp4", moov))
+
+    assert container["duration"] == 5.0 and "malformed" not in container
+
+
+def test_non_iso_files_have_no_container(tmp_path):
+    path = tmp_path / "a.avi"
+    path.write_bytes(b"RIFF\x00\x00\x00\x00AVI LIST")
+
+    assert parse_video_container(str(path)) == {}
+    assert parse_video_container(str(tmp_path / "missing.mp4")) == {}
+
+
+def test_corrupted_moov_never_raises(tmp_path):
+    moov = (_mvhd() + _video_track() + _audio_track()
+            + _box(b"udta", _box(b"\xa9too", struct.pack(">HH", 9, 0) + b"Lavf60.16"))
+            + _mdta([(b"com.apple.quicktime.software", b"17.4")]))
+    path = tmp_path / "a.mp4"
+    original = _box(b"moov", moov)
+    rng = np.random.default_rng(0)
+
+    for _ in range(1000):
+        corrupted = bytearray(original)
+        for position in rng.integers(8, len(corrupted), size=rng.integers(1, 4)):
+            corrupted[position] = rng.integers(0, 256)
+        path.write_bytes(_box(b"ftyp", b"isom\x00\x00\x02\x00isom") + bytes(corrupted))
+        assert parse_video_container(str(path))["format"] == "MP4"
+
+
+# Pre-screen
+
+@pytest.mark.parametrize("metadata,expected", [
+    ({"exif_data": {"Software": "Adobe Firefly 2.0"}}, {"tool": "Adobe Firefly", "field": "exif.Software"}),
+    ({"xmp": {"creator_tool": "Midjourney v6"}}, {"tool": "Midjourney", "field": "xmp.creator_tool"}),
+    ({"text_chunks": {"Software": "NovelAI"}}, {"tool": "NovelAI", "field": "png.Software"}),
+    ({"container": {"encoder": "Made with Stable Diffusion Video"}},
+     {"tool": "Stable Diffusion", "field": "container.encoder"}),
+    ({"xmp": {"digital_source_type": AI_SOURCE, "creator_tool": "Midjourney v6"}},
+     {"tool": "Midjourney", "field": "xmp.digital_source_type"}),
+    ({"xmp": {"digital_source_type": AI_SOURCE + "/", "creator_tool": "Studio 3"}},
+     {"tool": "Studio 3", "field": "xmp.digital_source_type"}),
+    ({"xmp": {"digital_source_type": "trainedAlgorithmicMedia"}},
+     {"tool": "Generative AI", "field": "xmp.digital_source_type"}),
+    ({"text_chunks": {"parameters": "a cat\nSteps: 20, Sampler: Euler a, CFG scale: 7"}},
+     {"tool": "Stable Diffusion", "field": "png.parameters"}),
+    ({"exif_data": {"UserComment": "Steps: 30, Sampler: DPM++ 2M"}},
+     {"tool": "Stable Diffusion", "field": "exif.UserComment"}),
+    ({"text_chunks": {"prompt": '{"3": {"class_type": "KSampler"}}', "workflow": "{}"}},
+     {"tool": "ComfyUI", "field": "png.prompt"}),
+    ({"text_chunks": {"invokeai_metadata": "{}"}}, {"tool": "InvokeAI", "field": "png.invokeai_metadata"}),
+])
+def test_generators_named_by_metadata(metadata, expected):
+    assert detect_generator(metadata) == expected
+
+
+@pytest.mark.parametrize("metadata", [
+    {},
+    {"exif_data": {"Software": "Adobe Photoshop 25.0", "ImageDescription": "made with Midjourney"}},
+    {"xmp": {"digital_source_type": AI_SOURCE.replace("trained", "compositeWithTrained")}},
+    {"xmp": {"digital_source_type": "http://cv.iptc.org/newscodes/digitalsourcetype/digitalCapture"}},
+    {"text_chunks": {"prompt": "not json", "workflow": "{}"}},
+    {"text_chunks": {"parameters": "Steps: 20"}},
+    {"container": {"encoder": "Lavf60.16", "comment": "stable diffusion"}},
+    {"exif_data": {"Software": 3}},
+])
+def test_no_generator(metadata):
+    assert detect_generator(metadata) is None
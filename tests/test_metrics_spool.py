@@ -0,0 +1,77 @@
+import json
+import os
+
+from app.services.metrics import MetricsSpool, service_metrics
+
+
+def _snapshot(analyses):
+    metrics = service_metrics()
+    metrics.inc("analyses_total", analyses, media_type="image", source="computed")
+    return metrics.snapshot()
+
+
+def _total(snapshots):
+    metrics = service_metrics()
+    for snapshot in snapshots:
+        metrics.merge(snapshot)
+    return metrics.snapshot()
+
+
+def _analyses(snapshots):
+    return sum(value for snapshot in snapshots for _, value in snapshot["counters"]["analyses_total"])
+
+
+def _write(directory, name, snapshot):
+    with open(os.path.join(directory, name), "w") as f:
+        json.dump(snapshot, f)
+
+
+def test_collect_reads_every_other_process(tmp_path):
+    spool = MetricsSpool(str(tmp_path))
+    spool.write(_snapshot(1))
+    _write(tmp_path, "101-aaaaaaaa.json", _snapshot(2))
+    _write(tmp_path, "102-bbbbbbbb.json", _snapshot(3))
+    _write(tmp_path, "103-cccccccc.json.tmp", _snapshot(100))
+
+    assert _analyses(spool.collect()) == 5
+
+
+def test_retire_folds_exited_process_into_one_total(tmp_path):
+    spool = MetricsSpool(str(tmp_path))
+    for pid in range(200, 210):
+        _write(tmp_path, f"{pid}-aaaaaaaa.json", _snapshot(pid - 199))
+    _write(tmp_path, "205-aaaaaaaa.json.tmp", _snapshot(100))
+    before = _analyses(spool.collect())
+
+    for pid in range(200, 208):
+        spool.retire(pid, _total)
+        # Totals never change while workers are retired
+        assert _analyses(spool.collect()) == before
+
+    assert sorted(os.listdir(tmp_path)) == ["208-aaaaaaaa.json", "209-aaaaaaaa.json", MetricsSpool.RETIRED]
+    assert len(spool.collect()) == 3
+
+
+def test_retire_without_a_file_is_a_no_op(tmp_path):
+    spool = MetricsSpool(str(tmp_path))
+    _write(tmp_path, "300-aaaaaaaa.json", _snapshot(1))
+
+    spool.retire(301, _total)
+    # A pid that merely starts with the same digits is someone else
+    spool.retire(30, _total)
+
+    assert os.listdir(tmp_path) == ["300-aaaaaaaa.json"]
+
+
+def test_absorbed_file_not_yet_deleted_is_not_counted_twice(tmp_path):
+    spool = MetricsSpool(str(tmp_path))
+    _write(tmp_path, "400-aaaaaaaa.json", _snapshot(2))
+    _write(tmp_path, "401-aaaaaaaa.json", _snapshot(3))
+    spool.retire(400, _total)
+
+    # As if the reaper had stopped between writing the total and deleting the file
+    _write(tmp_path, "400-aaaaaaaa.json", _snapshot(2))
+
+    assert _analyses(spool.collect()) == 5
+    spool.retire(401, _total)
+    assert _analyses(spool.collect()) == 5
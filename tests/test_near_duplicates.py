@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from app.services.near_duplicates import HammingIndex, NearDuplicateIndex, _popcount
+from ml_models.perceptual_hash import hamming
+
+
+def _random_hashes(rng, count):
+    return [int(value) for value in rng.integers(0, 1 << 64, size=count, dtype=np.uint64)]
+
+
+def _flip(value, rng, bits):
+    for bit in rng.choice(64, size=bits, replace=False):
+        value ^= 1 << int(bit)
+    return value
+
+
+def _brute_force(hashes, value, max_distance):
+    return sorted((hamming(value, h), tag) for tag, h in enumerate(hashes) if hamming(value, h) <= max_distance)
+
+
+def _index(hashes, chunks=4, rebuild=True):
+    index = HammingIndex(chunks=chunks)
+    for tag, value in enumerate(hashes):
+        index.add(value, tag)
+    if rebuild:
+        index.rebuild()
+    return index
+
+
+def test_popcount():
+    values = [0, 1, 0xFF, 1 << 63, (1 << 64) - 1, 0x5555555555555555]
+
+    counts = _popcount(np.array(values, dtype=np.uint64))
+
+    assert counts.tolist() == [bin(value).count("1") for value in values]
+
+
+@pytest.mark.parametrize("chunks", [4, 8])
+@pytest.mark.parametrize("max_distance", [0, 3, 6, 10])
+def test_search_matches_brute_force(chunks, max_distance):
+    rng = np.random.default_rng(max_distance)
+    queries = _random_hashes(rng, 20)
+    hashes = _random_hashes(rng, 2000)
+    # Planted neighbours at every distance up to past the radius
+    for query in queries:
+        hashes += [_flip(query, rng, bits) for bits in range(max_distance + 3)]
+    index = _index(hashes, chunks)
+
+    for query in queries:
+        assert index.search(query, max_distance) == _brute_force(hashes, query, max_distance)
+
+
+def test_entries_added_since_the_rebuild_are_found():
+    rng = np.random.default_rng(1)
+    hashes = _random_hashes(rng, 500)
+    index = _index(hashes)
+    query = hashes[10]
+    late = [_flip(query, rng, 2), query]
+    for tag, value in enumerate(late, start=len(hashes)):
+        index.add(value, tag)
+
+    assert index.search(query, 4) == [(0, 10), (0, 501), (2, 500)]
+    assert len(index) == 502
+
+
+def test_search_rebuilds_once_enough_entries_are_pending():
+    rng = np.random.default_rng(2)
+    hashes = _random_hashes(rng, 100)
+    index = HammingIndex(rebuild_after=64)
+    for tag, value in enumerate(hashes):
+        index.add(value, tag)
+
+    assert index.search(hashes[5], 0) == [(0, 5)]
+    assert index._indexed == 100
+
+
+def test_never_rebuilt_index_compares_every_entry():
+    rng = np.random.default_rng(3)
+    hashes = _random_hashes(rng, 50)
+    index = _index(hashes, rebuild=False)
+
+    assert index.search(hashes[7], 6) == _brute_force(hashes, hashes[7], 6)
+
+
+def test_empty_index_and_no_match():
+    assert HammingIndex().search(123, 6) == []
+    assert _index([0]).search((1 << 64) - 1, 6) == []
+
+
+def test_near_duplicate_image_needs_both_hashes(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "nd.sqlite3"), max_distance=6)
+    index.add("aa" * 32, {"kind": "image", "hashes": [0b1111, 0b1010]})
+
+    assert index.find({"kind": "image", "hashes": [0b0111, 0b1011]}) == {
+        "content_sha256": "aa" * 32, "distance": 1, "dhash_distance": 1
+    }
+    assert index.find({"kind": "image", "hashes": [0b1111, 0b1010 ^ 0xFF00]}) is None
+
+    # Another process sees the fingerprint through the shared file
+    reopened = NearDuplicateIndex(str(tmp_path / "nd.sqlite3"), max_distance=6)
+    assert reopened.find({"kind": "image", "hashes": [0b1111, 0b1010]})["distance"] == 0
+
+
+def test_near_duplicate_video_needs_enough_frames_in_place():
+    index = NearDuplicateIndex(None, max_distance=6, video_match=0.75)
+    hashes = _random_hashes(np.random.default_rng(4), 8)
+    frames = [hashes[i:i + 2] for i in range(0, 8, 2)]
+    index.add("bb" * 32, {"kind": "video", "frames": frames})
+
+    # Three of four frames in place, one undecodable
+    found = index.find({"kind": "video", "frames": frames[:3] + [None]})
+    assert found == {"content_sha256": "bb" * 32, "distance": 0, "frames_matched": 3, "frames": 4}
+    # The same frames in another order do not line up
+    assert index.find({"kind": "video", "frames": frames[::-1]}) is None
+    assert index.find({"kind": "video", "frames": frames[:2]}) is None
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import sqlite3
+import time
+
+import pytest
+
+from app.services import result_store
+from app.services.result_store import ResultStore
+
+
+def _result(analysis_id, padding=0):
+    return {"analysis_id": analysis_id, "padding": "x" * padding}
+
+
+def _size(result):
+    return len(json.dumps(result))
+
+
+def _computed(result, calls=None, delay=0.0):
+    async def compute():
+        if calls is not None:
+            calls.append(result["analysis_id"])
+        await asyncio.sleep(delay)
+        return result
+    return compute
+
+
+def _disk_rows(path):
+    with sqlite3.connect(path) as db:
+        return [row[0] for row in db.execute("SELECT analysis_id FROM analysis_results ORDER BY created_at")]
+
+
+def test_memory_hit_after_compute():
+    store = ResultStore(None, 10_000, "v1")
+
+    async def run():
+        first = await store.get_or_compute("a", _computed(_result("id-a")))
+        second = await store.get_or_compute("a", _computed(_result("other")))
+        return first, second
+
+    (first, first_source), (second, second_source) = asyncio.run(run())
+
+    assert first_source == "computed" and second_source == "memory"
+    assert second == first == _result("id-a")
+
+
+def test_config_version_separates_results():
+    assert ResultStore(None, 1, "v1").cache_key("a") != ResultStore(None, 1, "v2").cache_key("a")
+
+
+def test_memory_tier_evicts_least_recently_used_by_bytes():
+    size = _size(_result("id-a", 100))
+    store = ResultStore(None, 2 * size, "v1")
+
+    async def run():
+        await store.get_or_compute("a", _computed(_result("id-a", 100)))
+        await store.get_or_compute("b", _computed(_result("id-b", 100)))
+        await store.get_or_compute("a", _computed(_result("unused")))
+        await store.get_or_compute("c", _computed(_result("id-c", 100)))
+
+    asyncio.run(run())
+
+    assert store._memory_get(store.cache_key("a")) is not None
+    assert store._memory_get(store.cache_key("b")) is None
+    assert store._memory_bytes == 2 * size
+    assert set(store._ids) == {"id-a", "id-c"}
+
+
+def test_result_larger_than_memory_limit_is_not_kept():
+    store = ResultStore(None, 10, "v1")
+
+    asyncio.run(store.get_or_compute("a", _computed(_result("id-a", 100))))
+
+    assert store._memory_bytes == 0 and not store._memory and not store._ids
+
+
+def test_unstorable_result_reaches_waiters_but_is_not_stored(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"), 10_000, "v1")
+    calls = []
+
+    async def run():
+        compute = _computed(_result("id-a"), calls, delay=0.05)
+        keep = lambda result: False
+        return await asyncio.gather(store.get_or_compute("a", compute, keep),
+                                    store.get_or_compute("a", compute, keep))
+
+    results = asyncio.run(run())
+
+    assert [source for _, source in results] == ["computed", "coalesced"]
+    assert calls == ["id-a"]
+    assert asyncio.run(store.get("a")) is None
+    assert asyncio.run(store.get_by_analysis_id("id-a")) is None
+
+
+def test_concurrent_requests_are_coalesced():
+    store = ResultStore(None, 10_000, "v1")
+    calls = []
+
+    async def run():
+        compute = _computed(_result("id-a"), calls, delay=0.05)
+        return await asyncio.gather(*[store.get_or_compute("a", compute) for _ in range(3)])
+
+    results = asyncio.run(run())
+
+    assert calls == ["id-a"]
+    assert sorted(source for _, source in results) == ["coalesced", "coalesced", "computed"]
+    assert all(result == _result("id-a") for result, _ in results)
+
+
+def test_waiter_computes_when_the_computing_caller_is_cancelled():
+    store = ResultStore(None, 10_000, "v1")
+    calls = []
+
+    async def run():
+        compute = _computed(_result("id-a"), calls, delay=0.1)
+        first = asyncio.ensure_future(store.get_or_compute("a", compute))
+        await asyncio.sleep(0.02)
+        second = asyncio.ensure_future(store.get_or_compute("a", compute))
+        third = asyncio.ensure_future(store.get_or_compute("a", compute))
+        await asyncio.sleep(0.02)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second, await third
+
+    (second, second_source), (third, third_source) = asyncio.run(run())
+
+    assert calls == ["id-a", "id-a"]
+    assert {second_source, third_source} == {"computed", "coalesced"}
+    assert second == third == _result("id-a")
+    assert not store._pending
+
+
+def test_compute_error_reaches_waiters():
+    store = ResultStore(None, 10_000, "v1")
+
+    async def fail():
+        await asyncio.sleep(0.05)
+        raise ValueError("undecodable")
+
+    async def run():
+        return await asyncio.gather(store.get_or_compute("a", fail), store.get_or_compute("a", fail),
+                                    return_exceptions=True)
+
+    errors = asyncio.run(run())
+
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert not store._pending
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "results.db")
+    store = ResultStore(path, 10_000, "v1")
+    asyncio.run(store.get_or_compute("a", _computed(_result("id-a"))))
+    store.close()
+
+    reopened = ResultStore(path, 10_000, "v1")
+    result, source = asyncio.run(reopened.get_or_compute("a", _computed(_result("other"))))
+
+    assert (result, source) == (_result("id-a"), "disk")
+    assert asyncio.run(reopened.get_by_analysis_id("id-a")) == _result("id-a")
+    assert asyncio.run(ResultStore(path, 10_000, "v2").get("a")) is None
+
+
+def test_disk_tier_prunes_oldest_results_beyond_size_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store, "PRUNE_INTERVAL", 0.0)
+    path = str(tmp_path / "results.db")
+    size = _size(_result("id-0", 100))
+    store = ResultStore(path, 1, "v1", disk_limit_bytes=3 * size)
+
+    async def run():
+        for i in range(5):
+            await store.get_or_compute(str(i), _computed(_result(f"id-{i}", 100)))
+
+    asyncio.run(run())
+
+    assert _disk_rows(path) == ["id-2", "id-3", "id-4"]
+
+
+def test_disk_tier_expires_old_results(tmp_path, monkeypatch):
+    path = str(tmp_path / "results.db")
+    store = ResultStore(path, 1, "v1", disk_max_age=60)
+    asyncio.run(store.get_or_compute("old", _computed(_result("id-old"))))
+
+    # An hour later the old result is neither served nor kept
+    now = time.time() + 3600
+    monkeypatch.setattr(result_store.time, "time", lambda: now)
+    assert asyncio.run(store.get("old")) is None
+    assert asyncio.run(store.get_by_analysis_id("id-old")) is None
+
+    store._next_prune = 0.0
+    asyncio.run(store.get_or_compute("new", _computed(_result("id-new"))))
+
+    assert _disk_rows(path) == ["id-new"]
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from ml_models.temporal_consistency import MAX_SEGMENTS, RunningStats, TemporalConsistencyAnalyzer
+
+
+def _stats(values):
+    stats = RunningStats()
+    for value in values:
+        stats.add(float(value))
+    return stats
+
+
+def _assert_matches(stats, values):
+    values = np.asarray(values, dtype=np.float64)
+    assert stats.count == len(values)
+    assert stats.mean == pytest.approx(values.mean(), rel=1e-12, abs=1e-12)
+    assert stats.variance == pytest.approx(values.var(), rel=1e-9, abs=1e-12)
+    assert (stats.min, stats.max) == (values.min(), values.max())
+
+
+def test_add_matches_numpy():
+    values = np.random.default_rng(0).normal(3.0, 2.0, 1000)
+
+    _assert_matches(_stats(values), values)
+
+
+@pytest.mark.parametrize("split", [0, 1, 137, 999, 1000])
+def test_merge_of_two_parts_equals_the_whole(split):
+    values = np.random.default_rng(1).exponential(5.0, 1000)
+    merged = _stats(values[:split])
+
+    merged.merge(_stats(values[split:]))
+
+    _assert_matches(merged, values)
+
+
+def test_merge_of_many_parts_in_any_order():
+    rng = np.random.default_rng(2)
+    parts = [rng.normal(rng.uniform(-10, 10), rng.uniform(0.1, 5), rng.integers(1, 50)) for _ in range(20)]
+
+    merged = RunningStats()
+    for index in rng.permutation(len(parts)):
+        merged.merge(_stats(parts[index]))
+
+    _assert_matches(merged, np.concatenate(parts))
+
+
+def test_pairwise_tree_merge_equals_the_whole():
+    # The shape of segment compaction: neighbours merged in pairs, level after level
+    values = np.random.default_rng(3).uniform(0, 1, 256)
+    level = [_stats(values[i:i + 4]) for i in range(0, len(values), 4)]
+    while len(level) > 1:
+        for left, right in zip(level[::2], level[1::2]):
+            left.merge(right)
+        level = level[::2]
+
+    _assert_matches(level[0], values)
+
+
+def test_large_offset_keeps_its_variance():
+    # The naive sum-of-squares formula loses every digit here
+    values = 1e9 + np.random.default_rng(4).normal(0, 1e-3, 500)
+    merged = _stats(values[:250])
+    merged.merge(_stats(values[250:]))
+
+    assert merged.variance == pytest.approx(np.var(values), rel=1e-3)
+
+
+def test_empty_stats():
+    stats = RunningStats()
+    stats.merge(RunningStats())
+
+    assert stats.count == 0 and stats.variance == 0.0
+    assert stats.summary() == {"mean": 0.0, "std": 0.0, "min": 0.0, "max": 0.0}
+    stats.merge(_stats([2.0, 4.0]))
+    assert stats.summary() == {"mean": 3.0, "std": 1.0, "min": 2.0, "max": 4.0}
+
+
+def test_compacted_segments_keep_their_statistics():
+    rng = np.random.default_rng(5)
+    scores = rng.uniform(0.2, 0.3, 3 * MAX_SEGMENTS)
+    analyzer = TemporalConsistencyAnalyzer(segment_size=1)
+    for score in scores:
+        analyzer.add_scores({"deepfake_probability": float(score)})
+
+    # Doubled twice: 192 samples in 48 segments of 4
+    assert (len(analyzer._segments), analyzer.segment_size) == (48, 4)
+    for index, segment in enumerate(analyzer._segments):
+        _assert_matches(segment.scores["deepfake_probability"], scores[4 * index:4 * index + 4])
+    _assert_matches(analyzer.score("deepfake_probability"), scores)
+    assert analyzer.jitter.mean == pytest.approx(np.abs(np.diff(scores)).mean())
+
+
+def test_shifted_segment_is_reported_after_compaction():
+    scores = np.full(4 * MAX_SEGMENTS, 0.2) + np.random.default_rng(6).normal(0, 0.01, 4 * MAX_SEGMENTS)
+    scores[100:108] = 0.9
+    analyzer = TemporalConsistencyAnalyzer(segment_size=2)
+    for score in scores:
+        analyzer.add_scores({"deepfake_probability": float(score)})
+
+    anomalies = analyzer.summary()["anomalous_segments"]
+
+    assert analyzer.segment_size == 4
+    assert [(a["first_sample"], a["reasons"]) for a in anomalies] == [(100, ["score_shift"]), (104, ["score_shift"])]
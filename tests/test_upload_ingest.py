@@ -0,0 +1,230 @@
+import asyncio
+import hashlib
+import io
+import os
+import tarfile
+import tempfile
+import zipfile
+
+import pytest
+
+from app.utils.upload_ingest import (IMAGE_EXTENSIONS, VIDEO_EXTENSIONS, ArchiveTooLarge, UploadRejected,
+                                     _ArchiveBudget, ingest_upload, iter_batch_sources, sniff_media_type)
+
+ALLOWED_EXTENSIONS = IMAGE_EXTENSIONS + VIDEO_EXTENSIONS
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 60
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 56
+MP4 = b"\x00\x00\x00\x18ftypisom" + b"\x00" * 52
+
+
+class FakeUpload:
+    """Just enough of an ``UploadFile``: a name, an optional size and chunked reads"""
+
+    def __init__(self, filename, content, size=None):
+        self.filename = filename
+        self.size = size
+        self.content = content
+        self.reads = 0
+        self._offset = 0
+
+    async def read(self, size=-1):
+        self.reads += 1
+        end = len(self.content) if size < 0 else self._offset + size
+        chunk = self.content[self._offset:end]
+        self._offset += len(chunk)
+        return chunk
+
+
+def _ingest(upload, max_size=1 << 20, chunk_size=16):
+    return asyncio.run(ingest_upload(upload, max_size, ALLOWED_EXTENSIONS, chunk_size=chunk_size))
+
+
+@pytest.mark.parametrize("head,media_type", [
+    (JPEG, "image/jpeg"),
+    (PNG, "image/png"),
+    (b"RIFF\x00\x10\x00\x00AVI LIST", "video/x-msvideo"),
+    (MP4, "video/mp4"),
+    (b"\x00\x00\x00\x14ftypqt  \x00\x00\x00\x00", "video/quicktime"),
+    (b"\x00\x00\x00\x08wide\x00\x00\x00\x00", "video/quicktime"),
+    (b"\x00\x00\x01\x00moov", "video/quicktime"),
+    (b"RIFF\x00\x10\x00\x00WAVEfmt ", None),
+    (b"GIF89a\x00\x00", None),
+    (b"\xff\xd8", None),
+    (b"", None),
+])
+def test_sniff_media_type(head, media_type):
+    assert sniff_media_type(head) == media_type
+
+
+def test_image_is_buffered_and_hashed():
+    content = JPEG + os.urandom(100)
+
+    with _ingest(FakeUpload("a.JPG", content)) as upload:
+        assert upload.media_type == "image/jpeg" and not upload.is_video
+        assert upload.path is None
+        assert upload.read() == content
+        assert upload.size == len(content)
+        assert upload.sha256 == hashlib.sha256(content).hexdigest()
+
+
+def test_video_is_spooled_to_disk_and_removed_on_close():
+    content = MP4 + os.urandom(100)
+
+    upload = _ingest(FakeUpload("a.mp4", content))
+
+    assert upload.is_video and upload.buffer is None
+    assert upload.read() == content
+    assert upload.sha256 == hashlib.sha256(content).hexdigest()
+    path = upload.path
+    upload.close()
+    assert not os.path.exists(path)
+
+
+def test_declared_size_is_rejected_before_reading():
+    upload = FakeUpload("a.png", PNG, size=1001)
+
+    with pytest.raises(UploadRejected) as rejected:
+        _ingest(upload, max_size=1000)
+
+    assert rejected.value.status_code == 413
+    assert upload.reads == 0
+
+
+@pytest.mark.parametrize("filename,head", [("a.png", PNG), ("a.mp4", MP4)])
+def test_size_is_enforced_while_streaming(filename, head, tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    # No declared size: the limit is hit after the chunk that crosses it
+    upload = FakeUpload(filename, head + b"\x00" * 200)
+
+    with pytest.raises(UploadRejected) as rejected:
+        _ingest(upload, max_size=100, chunk_size=16)
+
+    assert rejected.value.status_code == 413
+    assert upload.reads == 7
+    # A partly spooled video is deleted
+    assert os.listdir(tmp_path) == []
+
+
+def test_upload_of_exactly_the_limit_is_accepted():
+    with _ingest(FakeUpload("a.png", PNG + b"\x00" * 36), max_size=100) as upload:
+        assert upload.size == 100
+
+
+@pytest.mark.parametrize("filename,content,detail", [
+    ("a.gif", b"GIF89a", "File type not supported"),
+    ("a", PNG, "File type not supported"),
+    ("a.png", b"GIF89a" + b"\x00" * 40, "does not match a supported media type"),
+    ("a.mp4", PNG, "does not match its extension"),
+    ("a.jpg", MP4, "does not match its extension"),
+])
+def test_mismatched_content_is_rejected(filename, content, detail):
+    with pytest.raises(UploadRejected) as rejected:
+        _ingest(FakeUpload(filename, content))
+
+    assert rejected.value.status_code == 400
+    assert detail in rejected.value.detail
+
+
+class FakeArchiveUpload:
+    def __init__(self, filename, content, size=None):
+        self.filename = filename
+        self.size = size
+        self.file = io.BytesIO(content)
+
+
+def _zip(members, compression=zipfile.ZIP_DEFLATED):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression) as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def _tar(members, mode="w:gz"):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as archive:
+        for name, content in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def _expand(files, max_archive_size):
+    async def run():
+        members = {}
+        async for source in iter_batch_sources(files, max_archive_size):
+            members[source.filename] = await source.read()
+        return members
+    return asyncio.run(run())
+
+
+def test_budget_is_shared_by_every_wrapped_file():
+    budget = _ArchiveBudget("a.zip", 10)
+    first, second = budget.wrap(io.BytesIO(b"x" * 6)), budget.wrap(io.BytesIO(b"y" * 6))
+
+    assert first.read() == b"x" * 6
+    with pytest.raises(ArchiveTooLarge) as too_large:
+        second.read()
+
+    assert too_large.value.status_code == 413
+    assert "a.zip" in too_large.value.detail
+
+
+def test_budget_allows_exactly_the_limit():
+    budget = _ArchiveBudget("a.zip", 12)
+    file = budget.wrap(io.BytesIO(b"x" * 12))
+
+    assert file.read(5) + file.read() == b"x" * 12
+    assert budget.remaining == 0
+    # Attributes other than read pass through
+    assert file.tell() == 12
+
+
+@pytest.mark.parametrize("build", [_zip, _tar])
+def test_archive_members_are_extracted(build):
+    members = {"a.png": PNG, "dir/b.jpg": JPEG, "__MACOSX/._a.png": b"fork", ".hidden.png": PNG}
+
+    expanded = _expand([FakeArchiveUpload("set" + (".zip" if build is _zip else ".tar.gz"),
+                                          build(members))], 1 << 20)
+
+    assert expanded == {"a.png": PNG, "dir/b.jpg": JPEG}
+
+
+@pytest.mark.parametrize("build,filename", [(_zip, "bomb.zip"), (_tar, "bomb.tar.gz")])
+def test_extracted_bytes_are_capped(build, filename):
+    # Compresses to a few hundred bytes, well under the limit
+    content = build({"a.png": PNG + b"\x00" * 200_000})
+    assert len(content) < 10_000
+
+    with pytest.raises(ArchiveTooLarge):
+        _expand([FakeArchiveUpload(filename, content)], 10_000)
+
+
+def test_archive_bytes_read_are_capped_without_a_declared_size():
+    # A tar is read through the members it skips, which are never extracted
+    members = {f".skipped-{i}.png": os.urandom(2_000) for i in range(5)}
+    members["a.png"] = PNG
+
+    with pytest.raises(ArchiveTooLarge):
+        _expand([FakeArchiveUpload("a.tar", _tar(members, "w"))], 6_000)
+
+    assert _expand([FakeArchiveUpload("a.tar", _tar(members, "w"))], 1 << 20) == {"a.png": PNG}
+
+
+def test_declared_archive_size_is_rejected_before_reading():
+    upload = FakeArchiveUpload("a.zip", b"", size=10_001)
+
+    with pytest.raises(ArchiveTooLarge):
+        _expand([upload], 10_000)
+
+    assert upload.file.tell() == 0
+
+
+def test_broken_archive_is_rejected():
+    with pytest.raises(UploadRejected) as rejected:
+        _expand([FakeArchiveUpload("a.zip", b"PK\x03\x04 not really a zip")], 10_000)
+
+    assert rejected.value.status_code == 400
+    assert "could not be read" in rejected.value.detail
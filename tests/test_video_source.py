@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+import pytest
+
+from app.utils.video_processor import VideoSource
+
+
+class SlowSource(VideoSource):
+    """Decode steps that take a while, logging when they run and when the capture is released"""
+
+    def __init__(self, log):
+        super().__init__("missing.mp4")
+        self.log = log
+
+    def frames(self, **sampling):
+        while True:
+            self.log.append("decode")
+            time.sleep(0.2)
+            self.log.append("decoded")
+            yield 0.0, None
+
+    def read_frames(self, indices):
+        self.log.append("decode")
+        time.sleep(0.2)
+        self.log.append("decoded")
+        return []
+
+    def close(self):
+        self.log.append("close")
+        super().close()
+
+
+async def _stream(source):
+    async with source:
+        async for _ in source.stream():
+            pass
+
+
+async def _read(source):
+    async with source:
+        await source.read_frames_async([1, 2])
+
+
+async def _cancel(consume, cancels):
+    log = []
+    task = asyncio.ensure_future(consume(SlowSource(log)))
+    await asyncio.sleep(0.05)
+    for _ in range(cancels):
+        task.cancel()
+        await asyncio.sleep(0.02)
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await asyncio.sleep(0.3)
+    return log
+
+
+@pytest.mark.parametrize("consume", [_stream, _read])
+@pytest.mark.parametrize("cancels", [1, 2])
+def test_cancelled_consumer_releases_capture_after_decode_step(consume, cancels):
+    log = asyncio.run(_cancel(consume, cancels))
+
+    assert log == ["decode", "decoded", "close"]